@@ -0,0 +1,116 @@
+# Copyright 2017 The Rudders Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Benchmark of HyperML trained with its entities in tangent space, mapped with expmap0 in each forward pass, against
+entities on the Poincare ball trained with Riemannian SGD and Riemannian Adam.
+It reports the time per training step and the train loss of each epoch. The user-item triplets are taken from the
+train split of a prep, as the Amazon ones, or generated at random if no prep is given.
+Run from the root of the project as: python -m benchmarks.ball_embeddings --prep data/prep/amazon/<prep>.pickle
+"""
+import argparse
+import pickle
+import time
+from collections import namedtuple
+
+import numpy as np
+import tensorflow as tf
+
+from rudders.losses import BCELossBatchedNegSample
+from rudders.models import HyperML
+from rudders.optimizers import RiemannianOptimizer
+from rudders.relations import Relations
+
+MODES = (("tangent", None), ("ball-rsgd", "rsgd"), ("ball-radam", "radam"))
+
+
+def get_flags(dims, ball_embeddings, neg_sample_size):
+    Flags = namedtuple("Flags", ['initializer', 'regularizer', 'dims', 'entity_reg', 'relation_reg', 'train_bias',
+                                 'dropout', 'curvature', 'train_c', 'items_chunk_size', 'ball_embeddings',
+                                 'neg_sample_size', 'hyperbolic_model'])
+    return Flags(initializer='GlorotNormal', regularizer='l2', dims=dims, entity_reg=0, relation_reg=0,
+                 train_bias=True, dropout=0, curvature=1., train_c=False, items_chunk_size=1024,
+                 ball_embeddings=ball_embeddings, neg_sample_size=neg_sample_size, hyperbolic_model='poincare')
+
+
+def load_triplets(args):
+    """:return: n_entities, triplets: user-item triplets of the train split of the prep, or random ones"""
+    if args.prep:
+        with tf.io.gfile.GFile(args.prep, 'rb') as f:
+            data = pickle.load(f)
+        train = np.asarray(data["train"], dtype=np.int64)
+        return data["n_entities"], train[train[:, 1] == Relations.USER_ITEM.value]
+    rng = np.random.RandomState(42)
+    n_users = args.n_entities // 2
+    # items are drawn from a power law, as the popularity of items
+    items = n_users + np.minimum(rng.zipf(1.5, size=args.n_triplets) - 1, args.n_entities - n_users - 1)
+    users = rng.randint(n_users, size=args.n_triplets)
+    return args.n_entities, np.stack((users, np.full_like(users, Relations.USER_ITEM.value), items), axis=1)
+
+
+def train(method, args, n_entities, triplets):
+    """:return: mean seconds per training step and the train loss of each epoch"""
+    flags = get_flags(args.dims, method is not None, args.neg_sample_size)
+    model = HyperML(n_entities, 1, list(range(n_entities)), flags)
+    model.build(input_shape=(1, 3))
+    optimizer = tf.keras.optimizers.Adam(learning_rate=args.lr, epsilon=1e-08)
+    if method is not None:
+        optimizer = RiemannianOptimizer(optimizer, model.ball_variables(), model.get_c, method=method)
+    loss_fn = BCELossBatchedNegSample(ini_neg_index=0, end_neg_index=n_entities - 1, args=flags)
+    dataset = tf.data.Dataset.from_tensor_slices(triplets).shuffle(len(triplets), seed=42).batch(args.batch_size)
+
+    @tf.function
+    def train_step(input_batch):
+        with tf.GradientTape() as tape:
+            loss = loss_fn.calculate_loss(model, input_batch)
+        gradients = tape.gradient(loss, model.trainable_variables)
+        optimizer.apply_gradients(zip(gradients, model.trainable_variables))
+        return loss
+
+    train_step(next(iter(dataset)))     # traces the step before timing
+    losses, elapsed, steps = [], 0., 0
+    for _ in range(args.epochs):
+        epoch_losses = []
+        for input_batch in dataset:
+            start = time.perf_counter()
+            epoch_losses.append(train_step(input_batch).numpy())
+            elapsed += time.perf_counter() - start
+            steps += 1
+        losses.append(float(np.mean(epoch_losses)))
+    return elapsed / steps, losses
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark of entities on the ball with Riemannian optimizers")
+    parser.add_argument("--prep", default=None, help="Path to a prep pickle. If not given, triplets are random")
+    parser.add_argument("--dims", default=32, type=int, help="Embeddings dimension")
+    parser.add_argument("--batch_size", default=1000, type=int, help="Batch size")
+    parser.add_argument("--epochs", default=10, type=int, help="Training epochs")
+    parser.add_argument("--lr", default=1e-3, type=float, help="Learning rate")
+    parser.add_argument("--neg_sample_size", default=1, type=int, help="Negative sample size")
+    parser.add_argument("--n_entities", default=50000, type=int, help="Amount of entities of the random triplets")
+    parser.add_argument("--n_triplets", default=200000, type=int, help="Amount of random triplets")
+    args = parser.parse_args()
+
+    tf.keras.backend.set_floatx("float64")
+    n_entities, triplets = load_triplets(args)
+    print(f"{n_entities} entities, {len(triplets)} user-item triplets")
+    for name, method in MODES:
+        tf.random.set_seed(42)
+        step_time, losses = train(method, args, n_entities, triplets)
+        print(f"{name}: {step_time * 1000:.2f} ms/step, train loss by epoch: "
+              f"{', '.join(f'{loss:.4f}' for loss in losses)}")
+
+
+if __name__ == "__main__":
+    main()
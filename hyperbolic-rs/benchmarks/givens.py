@@ -0,0 +1,116 @@
+# Copyright 2017 The Rudders Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Microbenchmark of the training step of RotRef models, comparing the fused rotation and reflection with the
+previous implementation, that applied each transformation with its own slices and concats.
+Run from the root of the project as: python -m benchmarks.givens
+"""
+import argparse
+import time
+from collections import namedtuple
+
+import numpy as np
+import tensorflow as tf
+
+from rudders.math.euclid import apply_rotation, apply_reflection
+from rudders.models import RotRefEuclidean, UserAttentiveEuclidean
+
+
+def get_flags(dims):
+    Flags = namedtuple("Flags", ['initializer', 'regularizer', 'dims', 'entity_reg', 'relation_reg', 'train_bias',
+                                 'dropout', 'ui_weight', 'train_ui_weight', 'items_chunk_size'])
+    return Flags(initializer='GlorotNormal', regularizer='l2', dims=dims, entity_reg=0, relation_reg=0,
+                 train_bias=True, dropout=0, ui_weight=0.75, train_ui_weight=False, items_chunk_size=1024)
+
+
+def legacy_queries(model, heads, rotations, reflections):
+    """Rotated and reflected queries as computed before the fused op: b x 2 x dims"""
+    ref_q = tf.reshape(apply_reflection(reflections, heads), (-1, 1, model.dims))
+    rot_q = tf.reshape(apply_rotation(rotations, heads), (-1, 1, model.dims))
+    return tf.concat([ref_q, rot_q], axis=1)
+
+
+def legacy_attn_mechanism(model, queries, attn_vecs):
+    attn_vecs = tf.reshape(attn_vecs, (-1, 1, model.dims))
+    att_weights = tf.reduce_sum(attn_vecs * queries * model.scale, axis=-1, keepdims=True)
+    att_weights = tf.nn.softmax(att_weights, axis=1)
+    return tf.reduce_sum(att_weights * queries, axis=1)
+
+
+class LegacyRotRefEuclidean(RotRefEuclidean):
+
+    def get_heads(self, input_tensor):
+        heads = self.entities(input_tensor[:, 0])
+        queries = legacy_queries(self, heads, self.rotations(input_tensor[:, 1]), self.reflections(input_tensor[:, 1]))
+        return legacy_attn_mechanism(self, queries, self.attention_lhs(input_tensor[:, 1]))
+
+
+class LegacyUserAttentiveEuclidean(UserAttentiveEuclidean):
+
+    def get_lhs(self, input_tensor):
+        heads = self.entities(input_tensor[:, 0])
+        queries = legacy_queries(self, heads, self.rotations(input_tensor[:, 1]), self.reflections(input_tensor[:, 1]))
+        trf_q = tf.reshape(self.transforms(input_tensor[:, 1]) * heads, (-1, 1, self.dims))
+        queries = tf.concat([queries, trf_q], axis=1)
+        return legacy_attn_mechanism(self, queries, self.attention_lhs(input_tensor[:, 1]))
+
+
+def time_train_step(model_class, args, n_entities, n_relations, batch_size, steps):
+    """:return: mean seconds per training step (forward and backward pass) of the model"""
+    model = model_class(n_entities, n_relations, list(range(n_entities)), get_flags(args.dims))
+    model.build(input_shape=(1, 3))
+    optimizer = tf.keras.optimizers.SGD(learning_rate=1e-3)
+    rng = np.random.RandomState(42)
+    batch = tf.convert_to_tensor(np.stack((rng.randint(n_entities, size=batch_size),
+                                           rng.randint(n_relations, size=batch_size),
+                                           rng.randint(n_entities, size=batch_size)), axis=1))
+
+    @tf.function
+    def train_step(input_batch):
+        with tf.GradientTape() as tape:
+            loss = -tf.reduce_mean(model(input_batch))
+        gradients = tape.gradient(loss, model.trainable_variables)
+        optimizer.apply_gradients(zip(gradients, model.trainable_variables))
+        return loss
+
+    for _ in range(args.warmup):
+        train_step(batch)
+    start = time.perf_counter()
+    for _ in range(steps):
+        train_step(batch).numpy()
+    return (time.perf_counter() - start) / steps
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark of the fused rotation and reflection")
+    parser.add_argument("--dims", default=64, type=int, help="Embeddings dimension")
+    parser.add_argument("--batch_size", default=4096, type=int, help="Batch size")
+    parser.add_argument("--n_entities", default=100000, type=int, help="Amount of entities")
+    parser.add_argument("--n_relations", default=8, type=int, help="Amount of relations")
+    parser.add_argument("--steps", default=100, type=int, help="Timed training steps")
+    parser.add_argument("--warmup", default=5, type=int, help="Training steps before timing")
+    args = parser.parse_args()
+
+    tf.keras.backend.set_floatx("float64")
+    benchmarks = [("RotRefEuclidean", LegacyRotRefEuclidean, RotRefEuclidean),
+                  ("UserAttentiveEuclidean", LegacyUserAttentiveEuclidean, UserAttentiveEuclidean)]
+    for name, legacy_class, fused_class in benchmarks:
+        legacy = time_train_step(legacy_class, args, args.n_entities, args.n_relations, args.batch_size, args.steps)
+        fused = time_train_step(fused_class, args, args.n_entities, args.n_relations, args.batch_size, args.steps)
+        print(f"{name}: legacy {legacy * 1000:.2f} ms/step, fused {fused * 1000:.2f} ms/step, "
+              f"speedup {legacy / fused:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
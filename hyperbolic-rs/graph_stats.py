@@ -16,10 +16,9 @@ from pathlib import Path
 import tensorflow as tf
 import numpy as np
 import pickle
-import networkx as nx
 from absl import app, flags, logging
 from rudders.relations import Relations
-from rudders.graph.seccurv import seccurv
+from rudders.graph.analysis.runner import GraphAnalysis, STATISTICS, save_statistic
 from rudders.utils import set_seed, setup_logger
 
 FLAGS = flags.FLAGS
@@ -31,8 +30,12 @@ flags.DEFINE_boolean('use_cobuy_relation', default=True, help='Whether to use th
 flags.DEFINE_boolean('use_coview_relation', default=True, help='Whether to use this relation or not')
 flags.DEFINE_boolean('use_category_relation', default=True, help='Whether to use this relation or not')
 flags.DEFINE_boolean('use_brand_relation', default=True, help='Whether to use this relation or not')
+flags.DEFINE_list('statistics', default=['seccurvs'], help=f'Statistics to compute, from: {", ".join(STATISTICS)}')
 flags.DEFINE_float('sample_ratio', default=0.2, help='Ratio to sample nodes from graph for seccurv')
 flags.DEFINE_integer('max_neigh_pairs', default=500, help='max neighbor pairs for seccurv')
+flags.DEFINE_integer('max_bfs_nodes', default=4096,
+                     help='Max amount of BFS sources for the distances shared by the statistics. If the graph is '
+                          'larger, sources are sampled. Required for large graphs')
 flags.DEFINE_integer('seed', default=42, help='Random seed')
 flags.DEFINE_boolean('debug', default=True, help='Debug mode')
 
@@ -59,9 +62,10 @@ def setup_relations(train, args):
         allowed_relations.add(Relations.CATEGORY.value)
     if args.use_brand_relation:
         allowed_relations.add(Relations.BRAND.value)
-    filtered_train = [triplet for triplet in train if triplet[1] in allowed_relations]
+    train = np.asarray(train).astype(np.int64)
+    filtered_train = train[np.isin(train[:, 1], list(allowed_relations))]
     all_rels = len(allowed_relations) == 8
-    return np.array(filtered_train).astype(np.int64), all_rels
+    return filtered_train, all_rels
 
 
 def load_data(args):
@@ -78,24 +82,31 @@ def load_data(args):
     return np.concatenate((train, data["dev"], data["test"]), axis=0), all_rels
 
 
-def build_graph(triplets):
-    g = nx.Graph()
-    for triplet in triplets:
-        src, dst = triplet[0], triplet[-1]
-        g.add_edge(src, dst)
-    return g
+STAT_FILES = {"degrees": [("degrees", "npy")], "seccurvs": [("seccurv", "npy")],
+              "hyperbolicities": [("hyp-values", "npy"), ("hyp-counts", "npy")], "ricci": [("ricci", "npz")],
+              "layer_nodes": [("layer-nodes", "npy")]}
 
 
 def main(_):
+    unknown = [statistic for statistic in FLAGS.statistics if statistic not in STAT_FILES]
+    if unknown:
+        raise ValueError(f"Unknown statistics {unknown}. Choose from: {', '.join(STAT_FILES)}")
     setup_logger(print_logs=True, save_logs=False, save_path="", run_id="")
     set_seed(FLAGS.seed, set_tf_seed=False)
     triplets, all_rels = load_data(FLAGS)
-    graph = build_graph(triplets)
-    logging.info(nx.info(graph))
-
-    curvatures = seccurv(graph, sample_ratio=FLAGS.sample_ratio, max_neigh_pairs=FLAGS.max_neigh_pairs)
-    out_file = f"outseccurv-{FLAGS.prep_name.split('-')[0]}-{'all' if all_rels else 'no'}rel"
-    np.save(out_file, curvatures)
+    analysis, _ = GraphAnalysis.from_edges(triplets[:, 0], triplets[:, -1], min_num_nodes=100,
+                                           max_bfs_nodes=FLAGS.max_bfs_nodes)
+    logging.info(f"Largest connected component: {analysis.graph.n_nodes} nodes, {analysis.graph.n_edges} edges")
+    stats_kwargs = {"seccurvs": {"sample_ratio": FLAGS.sample_ratio, "max_neigh_pairs": FLAGS.max_neigh_pairs,
+                                 "nodes_ratio": FLAGS.sample_ratio}}
+    suffix = f"{FLAGS.prep_name.split('-')[0]}-{'all' if all_rels else 'no'}rel"
+    for statistic in FLAGS.statistics:
+        logging.info(f"Computing {statistic}")
+        result = getattr(analysis, statistic)(**stats_kwargs.get(statistic, {}))
+        if statistic == "seccurvs":
+            logging.info(f"Sectional curvature: {np.mean(result):.2f} +- {np.std(result):.2f}")
+        files = [f"out{name}-{suffix}.{ext}" for name, ext in STAT_FILES[statistic]]
+        save_statistic(files, statistic, result)
 
 
 if __name__ == '__main__':
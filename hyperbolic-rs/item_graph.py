@@ -15,14 +15,19 @@
 
 from absl import app, flags
 from pathlib import Path
+import os
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
 import json
+import tempfile
 from tqdm import tqdm
-import networkx as nx
 import numpy as np
 import tensorflow as tf
-from tensorflow.keras.metrics import CosineSimilarity
 import tensorflow_hub as hub
 from rudders.utils import save_as_pickle
+from rudders.embedding_store import EmbeddingStore
+from rudders.similarity import threshold_edges, knn_edges
+from rudders.graph.csr import CSRGraph
 from rudders.datasets import keen, movielens, amazon, synopsis
 
 
@@ -35,16 +40,34 @@ flags.DEFINE_string('amazon_reviews', default='Musical_Instruments_5.json.gz',
                     help='Name of the 5-core amazon reviews file')
 flags.DEFINE_string('amazon_meta', default='meta_Musical_Instruments.json.gz',
                     help='Name of the product metadata file in the Amazon dataset')
-flags.DEFINE_string('text_embeddings', default='', help='If provided, it takes embeddings from file')
+flags.DEFINE_string('text_embeddings', default='',
+                    help='If provided, it takes embeddings from this embedding store directory (or legacy CSV file)')
+flags.DEFINE_string('embeds_dtype', default='float32', help='Precision to store text embeddings: float32 or float16')
+flags.DEFINE_integer('embed_batch_size', default=512,
+                     help='Amount of sentences, taken from many items, that are encoded at once by the USE model')
+flags.DEFINE_integer('embed_workers', default=4, help='Number of threads running the USE model concurrently')
+flags.DEFINE_string('embed_cache', default='',
+                    help='Directory to cache text embeddings, keyed by the hash of the item text. Only new or changed '
+                         'items are encoded in later runs. By default: <dataset_path>/<item>_embeds_cache')
 flags.DEFINE_float('threshold', default=0.6, help='Cosine similarity threshold to add edges')
 flags.DEFINE_string('use_model_url', default="https://tfhub.dev/google/universal-sentence-encoder-large/5",
                     help='URL of Universal Sentence Encoder Model')
-flags.DEFINE_integer('max_embedding_len', default=65536,
-                     help='If there are less embeddings than max_embedding_len, it will compute the similarity'
-                          'all at once using matrix multiplication. This is faster but much more memory expensive. '
-                          'If not, it will compute it "on the fly", which does not take as much memory but it is'
-                          'way slower.')
+flags.DEFINE_integer('tile_size', default=4096,
+                     help='The cosine similarity matrix is computed by tiles of tile_size x tile_size, so the memory '
+                          'used is bounded by the tile size and not by the amount of items')
+flags.DEFINE_integer('similarity_workers', default=os.cpu_count(),
+                     help='Number of threads computing tiles of the similarity matrix')
+flags.DEFINE_enum('graph_mode', default='threshold', enum_values=['threshold', 'knn'],
+                  help='threshold: exact graph with all pairs of items above the similarity threshold. '
+                       'knn: approximate graph with the knn_k most similar items of each item (also above the '
+                       'threshold), found with an inverted file index in sub-quadratic time')
+flags.DEFINE_integer('knn_k', default=20, help='Neighbors per item in the kNN graph mode')
+flags.DEFINE_integer('knn_lists', default=0, help='Inverted lists of the kNN index. If 0, it is sqrt(#items)')
+flags.DEFINE_integer('knn_probe', default=8,
+                     help='Inverted lists searched per item in the kNN graph mode. More lists give better recall')
 flags.DEFINE_boolean('use_distance', default=True, help='Whether to use cosine distance as weight or each edge is 1')
+flags.DEFINE_boolean('export_edgelist', default=True,
+                     help='Whether to also export the graph as a text weighted edge list, besides the binary format')
 flags.DEFINE_boolean('plot', default=False, help='Whether to plot item-item graph or not')
 flags.DEFINE_boolean('debug', default=True, help='Debug mode with very few embeddings')
 
@@ -57,7 +80,49 @@ def load_jsonl(path):
     return data
 
 
-def build_item_embeds(item_text, use_url, weight_first_embedding=False):
+def hash_item_text(sents, use_url, first_embed_weight):
+    """Hash that identifies the embedding of an item: it changes if the text, the model or the weighting change"""
+    text = "\n".join([use_url, str(first_embed_weight)] + list(sents))
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def embed_items(item_sents, encode_fn, pool, batch_size, first_embed_weight):
+    """
+    Encodes the sentences of many items packed together in batches of batch_size and reduces them into one
+    embedding per item.
+    The embedding of each item is the weighted mean of the embeddings of its sentences, where the weights are the
+    softmax of [first_embed_weight, 1, ..., 1].
+
+    :param item_sents: list of lists of sentences, one list per item
+    :param encode_fn: function that maps a list of sentences to a numpy array of len(sentences) x embed_dim
+    :param pool: executor to run encode_fn concurrently over the batches
+    :param batch_size: amount of sentences to encode at once
+    :param first_embed_weight: weight of the first sentence of each item before applying the softmax
+    :return: numpy array of len(item_sents) x embed_dim. Items without sentences get a zero vector
+    """
+    sents = [sent for item in item_sents for sent in item]
+    if not sents:
+        # only encodes an empty sentence to find out the dimension and dtype of the embeddings
+        probe = encode_fn([""])
+        return np.zeros((len(item_sents), probe.shape[-1]), dtype=probe.dtype)
+    lengths = np.array([len(item) for item in item_sents])
+    segment_ids = np.repeat(np.arange(len(item_sents)), lengths)
+    starts = np.cumsum(lengths) - lengths
+    is_first = np.zeros(len(sents), dtype=bool)
+    is_first[starts[lengths > 0]] = True
+
+    batches = [sents[i:i + batch_size] for i in range(0, len(sents), batch_size)]
+    embeds = np.concatenate(list(pool.map(encode_fn, batches)), axis=0)
+
+    # softmax of the weights within each item
+    exp_weights = np.exp(np.where(is_first, first_embed_weight, 1.)).astype(embeds.dtype)
+    weights = exp_weights / np.bincount(segment_ids, weights=exp_weights)[segment_ids].astype(embeds.dtype)
+    item_embeds = tf.math.unsorted_segment_sum(weights[:, None] * embeds, segment_ids, num_segments=len(item_sents))
+    return item_embeds.numpy()
+
+
+def build_item_embeds(item_text, use_url, weight_first_embedding=False, batch_size=512, n_workers=4, cache_dir=None,
+                      batches_per_checkpoint=50, dtype="float32"):
     """
     Build item embeddings based on the text they contain.
     It uses the Universal Sentence Encoder to get embeddings from text.
@@ -69,50 +134,85 @@ def build_item_embeds(item_text, use_url, weight_first_embedding=False):
     To get the Gem embedding, it creates a text embedding from the gem text, link's title and
     link's description. In that case, the final embedding is just the average of the previous
     embeddings, without any special weight.
-    """
-    use_model = hub.load(use_url)
-    result = {}
-    first_embed_weight = 2 if weight_first_embedding else 1     # gives higher weight to first embedding
-    for iid, sents in tqdm(item_text.items(), total=len(item_text)):
-        embs = use_model(sents)
 
-        weights = np.ones([1, len(embs)])
-        weights[0, 0] = first_embed_weight
-        weights = tf.convert_to_tensor(weights, dtype=tf.float32)
-        weights = tf.keras.activations.softmax(weights, axis=-1)
-        item_embeds = tf.transpose(weights) * embs
-        # Takes mean of weighted embeddings
-        item_embeds = tf.reduce_sum(item_embeds, axis=0, keepdims=True)
-        result[iid] = item_embeds
-    return result
+    Sentences from many items are packed in batches of batch_size and encoded by n_workers threads.
+    Embeddings are cached in an embedding store keyed by the hash of the item text, so only new or changed items
+    are encoded. The store is appended every batches_per_checkpoint batches. If cache_dir is not given, the cache
+    only lives during this call.
 
+    :return: iids, embeds: list of item ids and numpy array of len(iids) x embed_dim
+    """
+    if not item_text:
+        return [], np.empty((0, 0), dtype=dtype)
+    if cache_dir is None:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            return build_item_embeds(item_text, use_url, weight_first_embedding, batch_size, n_workers,
+                                     cache_dir=tmp_dir, batches_per_checkpoint=batches_per_checkpoint, dtype=dtype)
 
-def export_text_embeddings(embeds, dst_path, item):
-    """Export embeddings in CSV format emulating GloVe format"""
-    with open(str(dst_path / f"{item}_text_embeddings.csv"), "w") as f:
-        for iid, vec in embeds.items():
-            values = ",".join([str(x) for x in vec[0].numpy()])
-            f.write(f"{iid},{values}\n")
+    first_embed_weight = 2 if weight_first_embedding else 1     # gives higher weight to first embedding
+    keys = {iid: hash_item_text(sents, use_url, first_embed_weight) for iid, sents in item_text.items()}
+    cache = EmbeddingStore(cache_dir) if EmbeddingStore.exists(cache_dir) else None
+    pending = [iid for iid, key in keys.items() if cache is None or key not in cache]
+    print(f"Items to encode: {len(pending)}/{len(item_text)}")
+
+    if pending:
+        use_model = hub.load(use_url)
+        encode_fn = lambda sents: use_model(sents).numpy()
+        sents_per_checkpoint = batch_size * batches_per_checkpoint
+        with ThreadPoolExecutor(max_workers=n_workers) as pool, tqdm(total=len(pending)) as progress:
+            ini = 0
+            while ini < len(pending):
+                # takes items until completing the sentences of a checkpoint
+                end, n_sents = ini, 0
+                while end < len(pending) and (n_sents < sents_per_checkpoint or end == ini):
+                    n_sents += len(item_text[pending[end]])
+                    end += 1
+                chunk = pending[ini:end]
+                embeds = embed_items([item_text[iid] for iid in chunk], encode_fn, pool, batch_size,
+                                     first_embed_weight)
+                if cache is None:
+                    cache = EmbeddingStore(cache_dir, dims=embeds.shape[-1], dtype=dtype)
+                cache.append([keys[iid] for iid in chunk], embeds)
+                progress.update(len(chunk))
+                ini = end
+
+    iids = list(keys.keys())
+    return iids, cache.get([keys[iid] for iid in iids])
+
+
+def export_text_embeddings(iids, embeds, dst_path, item, dtype="float32"):
+    """Exports embeddings to a binary embedding store. If the store already exists, it is replaced"""
+    store_path = Path(dst_path) / f"{item}_text_embeddings"
+    if EmbeddingStore.exists(store_path):
+        EmbeddingStore.delete(store_path)
+    store = EmbeddingStore(store_path, dims=embeds.shape[-1], dtype=dtype)
+    store.append(iids, embeds)
+    return store_path
 
 
 def load_text_embeddings(text_embeddings_path):
-    """Loads pre-computed text embeddings. They must be persisted in CSV format"""
-    embeds = {}
+    """
+    Loads pre-computed text embeddings. They must be persisted in an embedding store or in the legacy CSV format,
+    emulating the GloVe format.
+
+    :return: iids, embeds: list of item ids and numpy array of len(iids) x embed_dim. If it is loaded from an
+    embedding store the array is memory mapped.
+    """
+    if EmbeddingStore.exists(text_embeddings_path):
+        return EmbeddingStore(text_embeddings_path).to_arrays()
+
+    iids, values = [], []
     with open(text_embeddings_path, "r") as f:
         for line in f:
-            data = line.strip().split(",")
-            iid = data[0]
-            emb = tf.convert_to_tensor([[float(x) for x in data[1:]]])
-            embeds[iid] = emb
-    return embeds
+            iid, vec = line.strip().split(",", 1)
+            iids.append(iid)
+            values.append(vec)
+    return iids, np.loadtxt(values, delimiter=",", dtype=np.float32, ndmin=2)
 
 
-def build_cossim_matrix(item_embeds):
-    iids = list(item_embeds.keys())
-    embeds = tf.cast(tf.concat([item_embeds[k] for k in iids], axis=0), tf.float16)    # len(item_embeds) x embed_dim
-    embeds = tf.math.l2_normalize(embeds, axis=1)
-    cossim_matrix = embeds @ tf.transpose(embeds)
-    return iids, tf.clip_by_value(cossim_matrix, -1.0, 1.0)
+def edge_weights(sims, use_distance):
+    """Cosine distance of each edge if use_distance is True, otherwise each edge counts as 1"""
+    return 1 - sims if use_distance else np.ones_like(sims)
 
 
 def build_graph(iids, cossim_matrix, threshold, use_distance):
@@ -125,46 +225,50 @@ def build_graph(iids, cossim_matrix, threshold, use_distance):
     :param threshold: only pairs of items with similarity above threshold will be added to the graph
     :param use_distance: if True, the cosine similarity is converted to cosine distance and added
     as the edge weight. If False, the edge weight is 1.
+    :return: networkx graph
+    """
+    cossim_matrix = np.asarray(cossim_matrix)
+    src, dst = np.nonzero(np.triu(cossim_matrix > np.asarray(threshold, dtype=cossim_matrix.dtype), k=1))
+    sims = cossim_matrix[src, dst].astype(np.float32)
+    graph = CSRGraph.from_edges(src, dst, edge_weights(sims, use_distance), n_nodes=len(iids))
+    return graph.to_networkx(iids)
+
+
+def build_graph_from_embeds(embeds, threshold, use_distance, tile_size=4096, n_workers=os.cpu_count()):
     """
-    threshold = tf.convert_to_tensor(threshold, dtype=tf.float16)
-    graph = nx.Graph()
-    for i in tqdm(range(len(iids)), desc="build_graph"):
-        for j in range(i + 1, len(iids)):
-            similarity = cossim_matrix[i, j]
-            if similarity > threshold:
-                ki, kj = iids[i], iids[j]
-                weight = 1 - similarity.numpy().item() if use_distance else 1
-                graph.add_edge(ki, kj, weight=weight)
-                graph.add_edge(kj, ki, weight=weight)
-    return graph
-
-
-def build_graph_from_embeds(item_embeds, threshold, use_distance):
+    Builds graph connecting items only if the cosine similarity of their embeddings is above 'threshold'.
+    The similarity matrix is never materialized: it is computed by tiles, and only the edges above the
+    threshold are kept.
+
+    :param embeds: numpy array of n_items x embed_dim
+    :return: CSRGraph where the node i is the item of the i-th embedding
+    """
+    src, dst, sims = threshold_edges(embeds, threshold, tile_size=tile_size, n_workers=n_workers)
+    return CSRGraph.from_edges(src, dst, edge_weights(sims, use_distance), n_nodes=len(embeds))
+
+
+def build_knn_graph_from_embeds(embeds, k, threshold, use_distance, n_lists=0, n_probe=8, tile_size=4096,
+                                n_workers=os.cpu_count()):
     """
-    This function has the same functionality than 'build_graph' but instead of receiving the cossim_matrix
-    as a parameter, it calculates the cosine similarity between each pair of embeddings in place.
+    Builds graph connecting each item with its k most similar items, as long as their cosine similarity is above
+    'threshold'. Neighbors are found with an approximate inverted file index.
 
-    In case that the cossim_matrix is too large and it doesn't fit in memory, this method should be used.
-    However, this method is much slower than precomputing the cossim_matrix.
+    :param embeds: numpy array of n_items x embed_dim
+    :return: CSRGraph where the node i is the item of the i-th embedding
     """
-    cossim = CosineSimilarity()
-    iids = list(item_embeds.keys())
-    graph = nx.Graph()
-    for i in tqdm(range(len(iids)), desc="build_graph_from_embeds"):
-        emb_i = item_embeds[iids[i]]
-        for j in range(i + 1, len(iids)):
-            emb_j = item_embeds[iids[j]]
-            similarity = cossim(emb_i, emb_j)
-            if similarity > threshold:
-                ki, kj = iids[i], iids[j]
-                weight = 1 - similarity.numpy().item() if use_distance else 1
-                graph.add_edge(ki, kj, weight=weight)
-                graph.add_edge(kj, ki, weight=weight)
-    return graph
+    src, dst, sims = knn_edges(embeds, k, n_lists=n_lists, n_probe=n_probe, tile_size=tile_size, n_workers=n_workers)
+    above = sims > threshold
+    src, dst, sims = src[above], dst[above], sims[above]
+    # the same pair might be found from both ends
+    low, high = np.minimum(src, dst), np.maximum(src, dst)
+    _, unique = np.unique(low * len(embeds) + high, return_index=True)
+    return CSRGraph.from_edges(low[unique], high[unique], edge_weights(sims[unique], use_distance),
+                               n_nodes=len(embeds))
 
 
 def plot_graph(graph, dst_path):
     import matplotlib.pyplot as plt
+    import networkx as nx
 
     fig = plt.figure()
     pos = nx.spring_layout(graph, iterations=100)
@@ -172,19 +276,21 @@ def plot_graph(graph, dst_path):
     plt.savefig(str(dst_path))
 
 
-def get_neighbors_with_distances(graph):
+def get_neighbors_with_distances(graph, node_labels):
     """
     Gets the neighbors from each node in the graph and returns it as a dictionary
 
-    :param graph:
-    :return: dict of nodes: [(neigh, distance)]
+    :param graph: CSRGraph
+    :param node_labels: list with the label of each node of the graph
+    :return: dict of nodes: [(neigh, distance)], only for nodes with at least one neighbor
     """
+    node_labels = np.asarray(node_labels, dtype=object)
+    indptr, neigh_labels, weights = graph.indptr, node_labels[graph.indices].tolist(), graph.weights.tolist()
     neighs_with_dists = {}
-    for src_node in tqdm(graph.nodes(), total=len(graph), desc="neighs_and_dists"):
-        neighs = [(dst_nei, edge["weight"]) for dst_nei, edge in graph[src_node].items()]
-        if neighs:
-            neighs_with_dists[src_node] = neighs
-    print(f"Nodes without neighbors: {len(graph) - len(neighs_with_dists)}/{len(graph)}")
+    for node in tqdm(np.flatnonzero(graph.degrees()), desc="neighs_and_dists"):
+        ini, end = indptr[node], indptr[node + 1]
+        neighs_with_dists[node_labels[node]] = list(zip(neigh_labels[ini:end], weights[ini:end]))
+    print(f"Nodes without neighbors: {graph.n_nodes - len(neighs_with_dists)}/{graph.n_nodes}")
     return neighs_with_dists
 
 
@@ -220,34 +326,41 @@ def main(_):
         print(list(texts.items())[:3])
 
         weight_first_embed = FLAGS.item == "keen" or "amazon" in FLAGS.dataset_path
-        embeds = build_item_embeds(texts, FLAGS.use_model_url, weight_first_embedding=weight_first_embed)
-        export_text_embeddings(embeds, dataset_path, item_name)
+        cache_dir = FLAGS.embed_cache if FLAGS.embed_cache else dataset_path / f"{item_name}_embeds_cache"
+        item_ids, embeds = build_item_embeds(texts, FLAGS.use_model_url, weight_first_embedding=weight_first_embed,
+                                             batch_size=FLAGS.embed_batch_size, n_workers=FLAGS.embed_workers,
+                                             cache_dir=cache_dir, dtype=FLAGS.embeds_dtype)
+        export_text_embeddings(item_ids, embeds, dataset_path, item_name, dtype=FLAGS.embeds_dtype)
     else:
-        embeds = load_text_embeddings(FLAGS.text_embeddings)
+        item_ids, embeds = load_text_embeddings(FLAGS.text_embeddings)
 
     if FLAGS.debug:
-        embeds = {k: v for k, v in list(embeds.items())[:50]}
+        item_ids, embeds = item_ids[:50], embeds[:50]
 
-    if len(embeds) < FLAGS.max_embedding_len:
-        item_ids, cossim_matrix = build_cossim_matrix(embeds)
-        graph = build_graph(item_ids, cossim_matrix, FLAGS.threshold, FLAGS.use_distance)
+    if FLAGS.graph_mode == "knn":
+        adjacency = build_knn_graph_from_embeds(embeds, FLAGS.knn_k, FLAGS.threshold, FLAGS.use_distance,
+                                                n_lists=FLAGS.knn_lists, n_probe=FLAGS.knn_probe,
+                                                tile_size=FLAGS.tile_size, n_workers=FLAGS.similarity_workers)
     else:
-        # if there are N embeddings, the cossim_matrix is N^2, which might not fit in memory for large values of N.
-        # In this case, we compute the cosine similarity for each pair of embeddings, but this is deadly slow
-        graph = build_graph_from_embeds(embeds, FLAGS.threshold, FLAGS.use_distance)
+        adjacency = build_graph_from_embeds(embeds, FLAGS.threshold, FLAGS.use_distance, tile_size=FLAGS.tile_size,
+                                            n_workers=FLAGS.similarity_workers)
+    graph_name = f"{item_name}_th{FLAGS.threshold}" + (f"_knn{FLAGS.knn_k}" if FLAGS.graph_mode == "knn" else "")
 
-    print(f"Graph info:\n{nx.info(graph)}")
+    print(f"Graph info:\nNodes: {adjacency.n_nodes}\nEdges: {adjacency.n_edges}\n"
+          f"Average degree: {adjacency.degrees().mean() if adjacency.n_nodes else 0:.4f}")
     if FLAGS.plot:
-        plot_graph(graph, dataset_path / f'{FLAGS.item}_{FLAGS.item}_graph_th{FLAGS.threshold}.png')
+        plot_graph(adjacency.to_networkx(item_ids),
+                   dataset_path / f'{FLAGS.item}_{FLAGS.item}_graph_th{FLAGS.threshold}.png')
 
-    neighs_and_dists = get_neighbors_with_distances(graph)
+    neighs_and_dists = get_neighbors_with_distances(adjacency, item_ids)
     result = {"item_item_distances": neighs_and_dists}
 
     # stores graph
-    graph_file_name = f'{item_name}_th{FLAGS.threshold}_graph.edgelist'
-    nx.write_weighted_edgelist(graph, str(dataset_path / graph_file_name))
+    adjacency.save(dataset_path / f'{graph_name}_graph.npz', node_labels=item_ids)
+    if FLAGS.export_edgelist:
+        adjacency.write_edgelist(dataset_path / f'{graph_name}_graph.edgelist', node_labels=item_ids)
     # stores distances for preprocessing
-    file_name = f'{item_name}_th{FLAGS.threshold}_{"cos" if FLAGS.use_distance else "hop"}distances.pickle'
+    file_name = f'{graph_name}_{"cos" if FLAGS.use_distance else "hop"}distances.pickle'
     save_as_pickle(dataset_path / file_name, result)
 
 
@@ -19,6 +19,7 @@ the coordinates of the embeddings in the appropriate format to visualize
 them with https://projector.tensorflow.org/"""
 
 import argparse
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 import h5py
 import tensorflow as tf
@@ -29,6 +30,7 @@ from collections import namedtuple
 import rudders.models as models
 from rudders.math.hyperb import expmap0, hyp_distance_all_pairs
 from rudders.math.euclid import euclidean_distance
+from rudders.math import lorentz
 import os
 import matplotlib as mpl
 if os.environ.get('DISPLAY') is None:  # NOQA
@@ -66,11 +68,28 @@ def to_hyperbolic(embeds, c_value):
     return expmap0(tf.convert_to_tensor(embeds), tf.convert_to_tensor([c_value], dtype=tf.float64)).numpy()
 
 
+def title_array(id2title, default="None", tab_replacement=""):
+    """
+    :return: numpy array of strings where the position item_id has the title of the item, with its tabs replaced
+    by tab_replacement
+    """
+    titles = np.full(max(id2title.keys(), default=-1) + 1, default, dtype=object)
+    for item_id, title in id2title.items():
+        titles[item_id] = title.replace("\t", tab_replacement)
+    return titles
+
+
+def join_titles(titles):
+    """:return: list with the titles of each row joined by '//'"""
+    return ["//".join(row) for row in titles]
+
+
 def export_for_projector(filename, user_embeds, item_embeds, id2title, samples, closest_user_item, closest_item_item,
-                         user_ids, item_ids):
+                         user_ids, item_ids, chunk_size=10000):
     """
     Exports coordinates and metadata of points in tsv following the guidelines to be plotted on
     the Tensorflow embedding projector.
+    Lines are assembled and written by chunks of chunk_size points, so the files are streamed to disk.
 
     :param filename: to export the final files of coords and metadata
     :param user_embeds, item_embeds: 2D embeddings
@@ -79,40 +98,34 @@ def export_for_projector(filename, user_embeds, item_embeds, id2title, samples,
     :param closest_user_item, closest_item_item: to be added as metadata
     :param user_ids, item_ids: aligned to the user/item embeds, to know to which entity we refer
     """
-    meta, coords = ["type\ttitle\tinteractions\tclosest"], []
-    for i, embed in enumerate(user_embeds):
-        user_id = user_ids[i]
-        coords.append("\t".join([str(x) for x in embed]))
-        # interactions are the items that each user is interacting with
-        # samples contain the ids of the items, and id2title the title of each item
-        interactions = [id2title.get(item_id, "None").replace("\t", "") for item_id in samples[user_id]]
-        interactions = "//".join(interactions)
-
-        closests = [id2title.get(item_ids[neigh_id], "None").replace("\t", "") for neigh_id in closest_user_item[i]]
-        closests = "//".join(closests)
-
-        meta.append(f"user\tu_{user_id}\t{interactions}\t{closests}")
-
-    for i, embed in enumerate(item_embeds):
-        item_id = item_ids[i]
-        coords.append("\t".join([str(x) for x in embed]))
-        title = id2title[item_id].replace("\t", "-")
-
-        closests = [id2title[item_ids[neig_id]].replace("\t", "") for neig_id in closest_item_item[i]]
-        closests = "//".join(closests)
-
-        meta.append(f"item\t{title}\t-\t{closests}")
-
+    item_ids = np.asarray(item_ids, dtype=np.int64)
+    missing = [item_id for item_id in item_ids.tolist() if item_id not in id2title]
+    if missing:
+        # items are expected to have a title, so it fails before writing any file
+        raise KeyError(f"Items without title: {missing[:10]}")
+    titles = title_array(id2title)
+    item_titles = title_array(id2title, tab_replacement="-")
     model_name = filename.split("/")[-1]
     coord_path = EXPORT_PATH / f"{model_name}-coords.tsv"
     meta_path = EXPORT_PATH / f"{model_name}-meta.tsv"
-    write_file(coord_path, coords)
-    write_file(meta_path, meta)
-
-
-def write_file(path, data):
-    with open(path, "w") as f:
-        f.write("\n".join(data))
+    with open(coord_path, "w") as coord_file, open(meta_path, "w") as meta_file:
+        meta_file.write("type\ttitle\tinteractions\tclosest\n")
+        for ini in range(0, len(user_embeds), chunk_size):
+            end = ini + chunk_size
+            np.savetxt(coord_file, user_embeds[ini:end], fmt="%.9g", delimiter="\t")
+            # interactions are the items that each user is interacting with
+            # samples contain the ids of the items, and titles the title of each item
+            interactions = join_titles(titles[samples[user_id]] for user_id in user_ids[ini:end])
+            closests = join_titles(titles[item_ids[closest_user_item[ini:end]]])
+            meta_file.writelines(f"user\tu_{user_id}\t{inter}\t{closest}\n"
+                                 for user_id, inter, closest in zip(user_ids[ini:end], interactions, closests))
+
+        for ini in range(0, len(item_embeds), chunk_size):
+            end = ini + chunk_size
+            np.savetxt(coord_file, item_embeds[ini:end], fmt="%.9g", delimiter="\t")
+            closests = join_titles(titles[item_ids[closest_item_item[ini:end]]])
+            meta_file.writelines(f"item\t{title}\t-\t{closest}\n"
+                                 for title, closest in zip(item_titles[item_ids[ini:end]], closests))
 
 
 def project_to_2d(user_embeds, item_embeds, hyperbolic=True, scale=False, n_neighbors=5, min_dist=0.1):
@@ -209,24 +222,58 @@ def hyperbolic_distance(x, y):
     return 2 * dist / sqrt_c
 
 
-def get_closest_points(src_embeds, dst_embeds, hyperbolic, curvature, top_k=15):
-    src_embeds, dst_embeds = tf.convert_to_tensor(src_embeds), tf.convert_to_tensor(dst_embeds)
-    if hyperbolic:
-        distances = hyp_distance_all_pairs(src_embeds, dst_embeds, tf.convert_to_tensor([curvature], dtype=tf.float64))
-    else:
-        distances = euclidean_distance(src_embeds, dst_embeds, all_pairs=True)
-
-    closest_indexes = tf.math.top_k(-distances, k=top_k + 1)[1]
-    closest_indexes = closest_indexes.numpy()
-    return closest_indexes
-
+def get_closest_points(src_embeds, dst_embeds, hyperbolic, curvature, top_k=15, chunk_size=1024):
+    """
+    Finds the top_k + 1 closest dst embeddings to each src embedding.
+    Distances are computed by chunks of chunk_size x chunk_size, keeping a running top-k for each chunk of src
+    embeddings, so the full distance matrix between src and dst is never built.
 
-def load_model(ckpt_path, model_class, curvature, prep_data):
+    :return: numpy array of len(src_embeds) x min(top_k + 1, len(dst_embeds)) with the indexes of the closest dst
+    embeddings, from the closest to the farthest
+    """
+    # with fewer dst embeddings, the padding ids of the running top-k would be returned as neighbors
+    k = min(top_k + 1, len(dst_embeds))
+    c = tf.convert_to_tensor([curvature], dtype=tf.float64)
+    dst_embeds = tf.convert_to_tensor(dst_embeds)
+    closest_indexes = []
+    for ini in range(0, len(src_embeds), chunk_size):
+        src_chunk = tf.convert_to_tensor(src_embeds[ini:ini + chunk_size])
+        best_dists = tf.fill((src_chunk.shape[0], k), tf.constant(np.inf, dtype=dst_embeds.dtype))
+        best_ids = tf.fill((src_chunk.shape[0], k), -1)
+        for dst_ini in range(0, dst_embeds.shape[0], chunk_size):
+            dst_chunk = dst_embeds[dst_ini:dst_ini + chunk_size]
+            if hyperbolic:
+                distances = hyp_distance_all_pairs(src_chunk, dst_chunk, c)
+            else:
+                distances = euclidean_distance(src_chunk, dst_chunk, all_pairs=True)
+            ids = tf.broadcast_to(tf.range(dst_ini, dst_ini + dst_chunk.shape[0]), tf.shape(distances))
+            # merges the distances of this chunk with the best ones so far
+            distances = tf.concat((best_dists, distances), axis=1)
+            ids = tf.concat((best_ids, ids), axis=1)
+            top = tf.math.top_k(-distances, k=k)[1]
+            best_dists = tf.gather(distances, top, batch_dims=1)
+            best_ids = tf.gather(ids, top, batch_dims=1)
+        closest_indexes.append(best_ids.numpy())
+    return np.concatenate(closest_indexes + [np.empty((0, k), dtype=np.int32)], axis=0)
+
+
+def get_all_closest_points(user_embeds, item_embeds, hyperbolic, curvature, chunk_size):
+    """:return: closest_user_item, closest_item_item: indexes of the closest items to each user and item"""
+    closest_user_item = get_closest_points(user_embeds, item_embeds, hyperbolic=hyperbolic, curvature=curvature,
+                                           top_k=9, chunk_size=chunk_size)
+    closest_item_item = get_closest_points(item_embeds, item_embeds, hyperbolic=hyperbolic, curvature=curvature,
+                                           chunk_size=chunk_size)[:, 1:]
+    return closest_user_item, closest_item_item
+
+
+def load_model(ckpt_path, model_class, curvature, prep_data, ball_embeddings=False, hyperbolic_model='poincare'):
     """
     :param ckpt_path: path to h5 exported model after training 
     :param model_class: class name of the model
     :param curvature: hyperparameter used to train the model (in case it is a hyperbolic model)
     :param prep_data: prep_data used to train the model
+    :param ball_embeddings: whether the model was trained with its entities on the ball
+    :param hyperbolic_model: model of hyperbolic space used to train the model: poincare or lorentz
     :return: an instance of 'model_class' with weights taken from the specified ckpt
     """
     model_data = h5py.File(ckpt_path, "r")
@@ -237,7 +284,8 @@ def load_model(ckpt_path, model_class, curvature, prep_data):
     Flags = namedtuple("Flags",
                        ['initializer', 'entity_init', 'relation_init', 'regularizer', 'dims', 'neg_sample_size',
                         'entity_reg', 'relation_reg', 'batch_size', 'curvature', 'train_c', 'dtype',
-                        'ui_weight', 'train_ui_weight'])
+                        'ui_weight', 'train_ui_weight', 'items_chunk_size', 'ball_embeddings',
+                        'hyperbolic_model'])
     initializer = "GlorotNormal"
     regularizer = "l2"
     args = Flags(
@@ -254,7 +302,10 @@ def load_model(ckpt_path, model_class, curvature, prep_data):
         train_c=False,
         dtype='float64',
         ui_weight=0.75,
-        train_ui_weight=False
+        train_ui_weight=False,
+        items_chunk_size=1024,
+        ball_embeddings=ball_embeddings,
+        hyperbolic_model=hyperbolic_model
     )
 
     tf.keras.backend.set_floatx(args.dtype)
@@ -266,20 +317,22 @@ def load_model(ckpt_path, model_class, curvature, prep_data):
     return model
 
 
-def get_embeds(model, prep_data, is_debug):
+def get_embeds(model, prep_data, is_debug, batch_size=4096):
     """Computes embeddings by using the left and right hand side model representations.
     It uses users and items on the dev set.
-    Returns the embeddings of users and items, and to which id they correspond to"""
-    split = prep_data["dev"][:100] if is_debug else prep_data["dev"]
-    bs = 100
+    Returns the embeddings of users and items, and to which id they correspond to.
+    Points of the Lorentz model are mapped to the Poincare ball, where they are projected and compared"""
+    split = np.asarray(prep_data["dev"][:100] if is_debug else prep_data["dev"])
     user_embeds, item_embeds = [], []
-    user_ids, item_ids = [], []
-    for input_tensor in tf.data.Dataset.from_tensor_slices(split).batch(bs):
-        user_embeds.append(model.get_lhs(input_tensor))
-        item_embeds.append(model.get_rhs(input_tensor))
-        user_ids.extend(input_tensor[:, 0].numpy().tolist())
-        item_ids.extend(input_tensor[:, -1].numpy().tolist())
-    return tf.concat(user_embeds, axis=0).numpy(), tf.concat(item_embeds, axis=0).numpy(), user_ids, item_ids
+    for ini in range(0, len(split), batch_size):
+        input_tensor = tf.convert_to_tensor(split[ini:ini + batch_size])
+        lhs, rhs = model.get_lhs(input_tensor), model.get_rhs(input_tensor)
+        if getattr(model, "manifold", None) is lorentz:
+            lhs, rhs = lorentz.to_poincare(lhs, model.get_c()), lorentz.to_poincare(rhs, model.get_c())
+        user_embeds.append(lhs.numpy())
+        item_embeds.append(rhs.numpy())
+    return np.concatenate(user_embeds, axis=0), np.concatenate(item_embeds, axis=0), split[:, 0].tolist(), \
+        split[:, -1].tolist()
 
 
 def main():
@@ -294,24 +347,36 @@ def main():
     parser.add_argument("--hyperbolic", default=1, type=int,
                         help="Whether the points are on a hyperbolic space or not, for the projection.")
     parser.add_argument("--curvature", default=1, type=float, help="Curvature of hyperbolic space.")
+    parser.add_argument("--ball_embeddings", default=0, type=int,
+                        help="If ball_embeddings=1, the model was trained with its entities on the ball")
+    parser.add_argument("--hyperbolic_model", default="poincare",
+                        help="Model of hyperbolic space used to train the model: poincare or lorentz")
     parser.add_argument("--debug", default=1, type=int, help="If debug is 1, uses only a few embeddings")
+    parser.add_argument("--batch_size", default=4096, type=int, help="Batch size to compute the embeddings")
+    parser.add_argument("--chunk_size", default=1024, type=int,
+                        help="Size of the chunks of embeddings to compute the closest points by parts")
 
     EXPORT_PATH.mkdir(parents=True, exist_ok=True)
     args = parser.parse_args()
 
     prep_data = load_prep(args.prep)
-    model = load_model(args.ckpt_path, args.model_class, args.curvature, prep_data)
-
-    user_embeds, item_embeds, user_ids, item_ids = get_embeds(model, prep_data, args.debug == 1)
+    model = load_model(args.ckpt_path, args.model_class, args.curvature, prep_data,
+                       ball_embeddings=args.ball_embeddings == 1, hyperbolic_model=args.hyperbolic_model)
 
-    user_embeds_2d, item_embeds_2d = project_to_2d(user_embeds, item_embeds, hyperbolic=args.hyperbolic == 1)
+    user_embeds, item_embeds, user_ids, item_ids = get_embeds(model, prep_data, args.debug == 1, args.batch_size)
 
     if args.matplot == 1:
+        user_embeds_2d, item_embeds_2d = project_to_2d(user_embeds, item_embeds, hyperbolic=args.hyperbolic == 1)
         plot(args.ckpt_path, user_embeds_2d, item_embeds_2d)
         return
 
-    closest_user_item = get_closest_points(user_embeds, item_embeds, hyperbolic=args.hyperbolic == 1, curvature=args.curvature, top_k=9)
-    closest_item_item = get_closest_points(item_embeds, item_embeds, hyperbolic=args.hyperbolic == 1, curvature=args.curvature)[:, 1:]
+    # the UMAP projection and the closest points are independent, so they are computed concurrently
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        projection = pool.submit(project_to_2d, user_embeds, item_embeds, hyperbolic=args.hyperbolic == 1)
+        closest = pool.submit(get_all_closest_points, user_embeds, item_embeds, args.hyperbolic == 1, args.curvature,
+                              args.chunk_size)
+        user_embeds_2d, item_embeds_2d = projection.result()
+        closest_user_item, closest_item_item = closest.result()
     id2title, samples = load_id2title(prep_data)
     export_for_projector(args.ckpt_path, user_embeds_2d, item_embeds_2d, id2title, samples, closest_user_item,
                          closest_item_item, user_ids, item_ids)
@@ -25,6 +25,8 @@ CONFIG = {
         'initializer': ('Which initializer to use', 'GlorotNormal'),
         'regularizer': ('Regularizer', 'l2'),
         'optimizer': ('Optimizer', 'adam'),
+        'hyperbolic_model': ('Model of hyperbolic space of hyperbolic models: poincare or lorentz', 'poincare'),
+        'riemannian_optimizer': ('Optimizer for entities on the ball if ball_embeddings: rsgd or radam', 'radam'),
         'dtype': ('Precision to use', 'float64'),
         'results_file': ('Name of file to export results', 'results'),
     },
@@ -48,6 +50,7 @@ CONFIG = {
         'dims': ('Embeddings dimension', 32),
         'batch_size': ('Batch size', 1000),
         'eval_batch_size': ('Eval Batch size', 75),
+        'items_chunk_size': ('Amount of items scored at once by user attentive models in evaluation', 1024),
         'neg_sample_size': ('Negative sample size, -1 to use loss without negative sampling', 1),
         'seed': ('Random seed', 42),
         'gpu_index': ('GPU index, in case of working with more than one', 0),
@@ -57,6 +60,8 @@ CONFIG = {
         'save_logs': ('Whether to save the training logs or not', True),
         'print_logs': ('Whether to print the training logs to stdout', True),
         'save_model': ('Whether to save the model weights', True),
+        'export_inference': ('Whether to export the best weights to a npz file, to score with the NumPy models of '
+                             'rudders.inference', False),
         'invert_relations': ('For each triple (h, r, t) it also adds (t, r^-1, h)', True),
         'use_semantic_relation': ('Whether to use this relation or not', False),
         'use_cobuy_relation': ('Whether to use this relation or not', False),
@@ -66,6 +71,8 @@ CONFIG = {
         'unique_relation': ('Whether to convert allowed relations into only one', False),
         'train_ui_weight': ('Whether to train weight between combined and reg embeds in UI rel', False),
         'train_c': ('Whether to train the hyperbolic curvature or not', False),
+        'ball_embeddings': ('Whether hyperbolic entity embeddings live on the ball and are trained with a '
+                            'Riemannian optimizer, instead of in tangent space', False),
         'train_bias': ('Whether to train added bias for scoring function or not', True),
     }
 }
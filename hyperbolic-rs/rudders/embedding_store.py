@@ -0,0 +1,139 @@
+# Copyright 2017 The Rudders Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Binary store of embeddings indexed by id"""
+
+import json
+from pathlib import Path
+import numpy as np
+
+MATRIX_FILE = "embeddings.bin"
+IDS_FILE = "ids.txt"
+META_FILE = "meta.json"
+
+
+class EmbeddingStore:
+    """
+    Append-only store of embeddings indexed by id, persisted in a directory with:
+        - embeddings.bin: raw n x dims matrix in row-major order.
+        - ids.txt: one id per line, aligned with the rows of the matrix.
+        - meta.json: dims and dtype of the matrix.
+
+    The matrix is memory mapped, so loading is zero-copy and rows are read from disk on access.
+    If an id is appended more than once, the last row is the one that is kept.
+    Rows are written before their ids, so a store that was interrupted while appending remains consistent.
+    """
+
+    def __init__(self, path, dims=None, dtype="float32"):
+        """
+        :param path: directory of the store. It is created if it does not exist.
+        :param dims: dimension of the embeddings. Only required to create a new store.
+        :param dtype: dtype of the embeddings, usually float32 or float16. Only used to create a new store.
+        """
+        self.path = Path(path)
+        meta_path = self.path / META_FILE
+        if meta_path.exists():
+            with open(meta_path, "r") as f:
+                meta = json.load(f)
+            dims, dtype = meta["dims"], meta["dtype"]
+        else:
+            if dims is None:
+                raise ValueError(f"Embedding store not found in {self.path} and no dims were given to create it")
+            self.path.mkdir(parents=True, exist_ok=True)
+            with open(meta_path, "w") as f:
+                json.dump({"dims": int(dims), "dtype": np.dtype(dtype).name}, f)
+            (self.path / MATRIX_FILE).touch()
+            (self.path / IDS_FILE).touch()
+        self.dims = int(dims)
+        self.dtype = np.dtype(dtype)
+
+        with open(self.path / IDS_FILE, "r") as f:
+            self.row_ids = [line.rstrip("\n") for line in f]
+        self.id2row = {iid: row for row, iid in enumerate(self.row_ids)}
+        self._matrix = None
+
+    @staticmethod
+    def exists(path):
+        return (Path(path) / META_FILE).exists()
+
+    @staticmethod
+    def delete(path):
+        """Removes the files of the store in path"""
+        for file_name in (MATRIX_FILE, IDS_FILE, META_FILE):
+            try:
+                (Path(path) / file_name).unlink()
+            except FileNotFoundError:
+                pass
+
+    def __len__(self):
+        return len(self.id2row)
+
+    def __contains__(self, iid):
+        return iid in self.id2row
+
+    def __getitem__(self, iid):
+        return self.matrix[self.id2row[iid]]
+
+    @property
+    def ids(self):
+        """List of ids, each one aligned to the row in 'rows'"""
+        return list(self.id2row.keys())
+
+    @property
+    def rows(self):
+        """Array with the row in the matrix of each id in 'ids'"""
+        return np.fromiter(self.id2row.values(), dtype=np.int64, count=len(self.id2row))
+
+    @property
+    def matrix(self):
+        """Memory mapped matrix of all appended rows (including overwritten ones)"""
+        if self._matrix is None:
+            if not self.row_ids:
+                return np.empty((0, self.dims), dtype=self.dtype)
+            self._matrix = np.memmap(self.path / MATRIX_FILE, dtype=self.dtype, mode="r",
+                                     shape=(len(self.row_ids), self.dims))
+        return self._matrix
+
+    def get(self, ids):
+        """:return: numpy array of len(ids) x dims"""
+        return self.matrix[[self.id2row[iid] for iid in ids]]
+
+    def to_arrays(self):
+        """
+        :return: ids, embeds: list of ids and the n x dims matrix of their embeddings. If no id was overwritten, the
+        matrix is the memory mapped one, without copying it.
+        """
+        if len(self.id2row) == len(self.row_ids):
+            return self.row_ids, self.matrix
+        return self.ids, self.matrix[self.rows]
+
+    def append(self, ids, embeds):
+        """
+        Appends embeddings to the store
+
+        :param ids: list of n ids
+        :param embeds: numpy array of n x dims
+        """
+        embeds = np.ascontiguousarray(embeds, dtype=self.dtype)
+        if embeds.shape != (len(ids), self.dims):
+            raise ValueError(f"Expected embeddings of shape {(len(ids), self.dims)} but got {embeds.shape}")
+        with open(self.path / MATRIX_FILE, "ab") as f:
+            # drops rows of a previous append that was interrupted before writing their ids
+            f.truncate(len(self.row_ids) * self.dims * self.dtype.itemsize)
+            embeds.tofile(f)
+        with open(self.path / IDS_FILE, "a") as f:
+            f.writelines(f"{iid}\n" for iid in ids)
+        for iid in ids:
+            self.id2row[iid] = len(self.row_ids)
+            self.row_ids.append(iid)
+        self._matrix = None
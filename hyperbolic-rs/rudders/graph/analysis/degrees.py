@@ -1,12 +1,10 @@
+"""
+Computes the graph degrees with the analysis runner.
+Run from the root of the project as: python -m rudders.graph.analysis.degrees --input <graph.edgelist>
+"""
 import argparse
-import logging
-import os
-import sys
 
-import networkx as nx
-import numpy as np
-
-from utils import np_output_filename
+from rudders.graph.analysis import runner
 
 parser = argparse.ArgumentParser(description='Compute graph degrees')
 parser.add_argument('--input', type=str, required=True, help='The input graph.')
@@ -18,11 +16,4 @@ parser.add_argument(
         'from the input.')
 args = parser.parse_args()
 
-out_file = np_output_filename(args.input, 'degrees', args.inherit_filename)
-if os.path.isfile(out_file) and not args.force:
-    logging.warning('The degrees already exist: %s', out_file)
-    sys.exit(0)
-
-g = nx.convert_node_labels_to_integers(nx.read_edgelist(args.input))
-degrees = np.asarray(list(dict(g.degree()).values()))
-np.save(out_file, degrees)
+runner.run(args.input, ['degrees'], force=args.force, inherit=args.inherit_filename, min_num_nodes=0)
@@ -1,16 +1,11 @@
+"""
+Computes the distribution of delta-hyperbolicities with the analysis runner, without SageMath.
+Run from the root of the project as: python -m rudders.graph.analysis.hyperbolicities --input <graph.edgelist>
+"""
 import argparse
-import logging
-import os
-import sys
+import multiprocessing
 
-import networkx as nx
-import numpy as np
-
-import sage.all
-from sage.graphs.graph import Graph
-import sage.graphs.hyperbolicity as sage_hyp
-
-from utils import np_output_filename
+from rudders.graph.analysis import runner
 
 parser = argparse.ArgumentParser(description='Compute delta-hyperbolicities')
 parser.add_argument('--input', type=str, required=True, help='The input graph.')
@@ -26,6 +21,23 @@ parser.add_argument(
         type=int,
         default=int(1e8),
         help='The sampling size used in the hyperbolicity distribution.')
+parser.add_argument(
+        '--max_nodes',
+        type=int,
+        default=8192,
+        help='If the graph is larger, quadruples are sampled from a random '
+        'subset of max_nodes nodes.')
+parser.add_argument(
+        '--tolerance',
+        type=float,
+        default=1e-4,
+        help='Sampling stops when the relative frequencies change less than '
+        'this. Use 0 to take all the samples.')
+parser.add_argument(
+        '--n_cpus',
+        type=int,
+        default=multiprocessing.cpu_count(),
+        help='The number of CPUs used for parallelization.')
 parser.add_argument(
         '--inherit_filename',
         action='store_true',
@@ -33,40 +45,7 @@ parser.add_argument(
         'from the input.')
 args = parser.parse_args()
 
-values_file = np_output_filename(args.input, 'hyp-values',
-                                 args.inherit_filename)
-counts_file = np_output_filename(args.input, 'hyp-counts',
-                                 args.inherit_filename)
-if os.path.isfile(values_file) and os.path.isfile(counts_file) and \
-        not args.force:
-    logging.warning('The hyperbolicities already exist: %s', values_file)
-    sys.exit(0)
-
-g = nx.convert_node_labels_to_integers(nx.read_edgelist(args.input))
-connected_components = list(nx.connected_components(g))
-if len(connected_components) == 0:
-    logging.fatal('Empty graph. This is most probably due to a too small a '
-                  'distance threshold.')
-    sys.exit(1)
-if len(connected_components) > 1:
-    logging.warning('The input graph has %d connected components. ',
-                    len(connected_components))
-    g = g.subgraph(max(connected_components, key=len))
-    g = nx.convert_node_labels_to_integers(g)
-    num_nodes = g.number_of_nodes()
-    if num_nodes > args.min_num_nodes:
-        logging.warning('Keeping the largest only with %d nodes.', num_nodes)
-    else:
-        logging.fatal(
-                'The largest connected component has %d nodes. Dropping '
-                'this scenario.', num_nodes)
-        sys.exit(1)
-
-sage_graph = Graph(g)
-h_dict = sage_hyp.hyperbolicity_distribution(
-        sage_graph, sampling_size=args.sampling_size)
-values = np.asarray([float(h) for h, _ in h_dict.items()])
-counts = np.asarray([int(c * args.sampling_size) for _, c in h_dict.items()])
-
-np.save(values_file, values)
-np.save(counts_file, counts)
+runner.run(args.input, ['hyperbolicities'], force=args.force, inherit=args.inherit_filename,
+           min_num_nodes=args.min_num_nodes, max_bfs_nodes=args.max_nodes, n_cpus=args.n_cpus,
+           stats_kwargs={'hyperbolicities': {'sampling_size': args.sampling_size,
+                                             'tolerance': args.tolerance}})
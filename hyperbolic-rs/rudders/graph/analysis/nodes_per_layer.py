@@ -1,18 +1,26 @@
+"""
+Computes the nodes per BFS layer with the analysis runner, without graphembed.
+Run from the root of the project as: python -m rudders.graph.analysis.nodes_per_layer --input <graph.edgelist>
+"""
 import argparse
-import logging
-import os
-import sys
+import multiprocessing
 
-import networkx as nx
-import numpy as np
-
-from graphembed.pyx import FastPrecision
-
-from utils import np_output_filename
+from rudders.graph.analysis import runner
 
 parser = argparse.ArgumentParser(description='Compute the nodes per layer.')
 parser.add_argument('--input', type=str, required=True, help='The input graph.')
 parser.add_argument('--force', action='store_true', help='Re-generate them.')
+parser.add_argument(
+        '--max_sources',
+        type=int,
+        default=None,
+        help='If given and the graph is larger, the BFS runs from this amount '
+        'of sampled source nodes only.')
+parser.add_argument(
+        '--n_cpus',
+        type=int,
+        default=multiprocessing.cpu_count(),
+        help='The number of CPUs used for parallelization.')
 parser.add_argument(
         '--inherit_filename',
         action='store_true',
@@ -20,11 +28,5 @@ parser.add_argument(
         'from the input.')
 args = parser.parse_args()
 
-out_file = np_output_filename(args.input, 'layer-nodes', args.inherit_filename)
-if os.path.isfile(out_file) and not args.force:
-    logging.warning('The file already exists: %s', out_file)
-    sys.exit(0)
-
-g = nx.convert_node_labels_to_integers(nx.read_edgelist(args.input))
-fp = FastPrecision(g)
-np.save(out_file, fp.nodes_per_layer())
+runner.run(args.input, ['layer_nodes'], force=args.force, inherit=args.inherit_filename, min_num_nodes=0,
+           n_cpus=args.n_cpus, stats_kwargs={'layer_nodes': {'max_sources': args.max_sources}})
@@ -8,7 +8,7 @@ import matplotlib
 import matplotlib.pyplot as plt
 from mpl_toolkits.axes_grid1 import make_axes_locatable
 
-from utils import remove_extensions
+from rudders.graph.analysis.utils import remove_extensions
 
 matplotlib.rcParams.update({'font.size': 20})
 
@@ -16,27 +16,16 @@ matplotlib.rcParams.update({'font.size': 20})
 def main():
     set_seeds(args.random_seed)
 
-    # Load the graph and sub-sample the nodes.
-    g = nx.convert_node_labels_to_integers(nx.nx_pydot.read_dot(args.input))
+    # Load the graph with its curvatures and sub-sample the nodes.
+    g = load_curvatures(args.input)
     if args.nodes_sampling_percentage < 0.99:
         g = subsample(g)
 
-    # Properties of the drawing.
-    def read_curv(attrs):
-        curv = attrs[args.curv_property]
-        if curv.startswith('"'):
-            curv = attrs[args.curv_property][1:-1]
-        return float(curv)
-
     nodes = [n[0] for n in g.degree]
     edges = list(g.edges())
     degrees = np.array([n[1] for n in g.degree])
-    edge_curvs = np.ndarray(shape=(len(edges)))
-    node_curvs = np.ndarray(shape=(len(nodes)))
-    for i, (_, _, attrs) in enumerate(g.edges(data=True)):
-        edge_curvs[i] = read_curv(attrs)
-    for i, (_, attrs) in enumerate(g.nodes(data=True)):
-        node_curvs[i] = read_curv(attrs)
+    edge_curvs = np.array([attrs['ricciCurvature'] for _, _, attrs in g.edges(data=True)])
+    node_curvs = np.array([attrs['ricciCurvature'] for _, attrs in g.nodes(data=True)])
 
     # Show negative and positive curvatures with diverging color scheme:
     # make sure we normalize them so that transparent edges correspond to 0.
@@ -109,7 +98,19 @@ def main():
             os.path.basename(args.input).split('.')[0] + '+cbar.pdf')
 
     # Save it
-    fig.savefig(args.input.replace('dot', 'pdf'), bbox_inches='tight')
+    fig.savefig(args.input.replace('npz', 'pdf'), bbox_inches='tight')
+
+
+def load_curvatures(path):
+    """Builds a networkx graph from the .npz file of ricci_curv.py, with the curvatures as attributes"""
+    with np.load(path) as data:
+        edges, edge_curvs, node_curvs = data['edges'], data['edge_curvs'], data['node_curvs']
+    g = nx.Graph()
+    g.add_nodes_from((node, {'ricciCurvature': float(node_curvs[node])})
+                     for node in np.unique(edges).tolist())
+    g.add_edges_from((src, dst, {'ricciCurvature': curv})
+                     for (src, dst), curv in zip(edges.tolist(), edge_curvs.tolist()))
+    return g
 
 
 def subsample(g):
@@ -149,12 +150,7 @@ def parse_args():
             '--input',
             type=str,
             required=True,
-            help='The input .dot graph file.')
-    parser.add_argument(
-            '--curv_property',
-            type=str,
-            default='ricciCurvature',
-            help='The name of the curvature property in the graph.')
+            help='The input .npz file with the curvatures from ricci_curv.py.')
     parser.add_argument(
             '--nodes_sampling_percentage',
             type=float,
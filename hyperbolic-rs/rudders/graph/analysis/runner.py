@@ -0,0 +1,257 @@
+# Copyright 2017 The Rudders Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Computes any subset of graph statistics in one process, loading the graph only once.
+Run from the root of the project as:
+    python -m rudders.graph.analysis.runner --input <graph.edgelist> --stats degrees,seccurvs,hyperbolicities,ricci,layer_nodes
+"""
+import argparse
+import logging
+import multiprocessing
+import os
+
+import numpy as np
+
+from rudders.graph.analysis.utils import np_output_filename, _output_filename
+from rudders.graph.bfs import multi_source_bfs, nodes_per_layer
+from rudders.graph.csr import CSRGraph
+from rudders.graph.hyperbolicity import hyperbolicity_distribution
+from rudders.graph.ricci import ricci_curvature
+from rudders.graph.seccurv import sectional_curvatures
+from rudders.graph.utils import largest_connected_component, read_edgelist, unique_edges
+
+STATISTICS = ('degrees', 'seccurvs', 'hyperbolicities', 'ricci', 'layer_nodes')
+
+
+class GraphAnalysis:
+    """
+    Statistics of the largest connected component of a graph.
+    The component is kept as a CSRGraph, and the BFS distances from a sample of nodes are computed at most once and
+    shared by all the statistics that need them.
+    """
+
+    def __init__(self, graph, degrees, max_bfs_nodes=8192, n_cpus=multiprocessing.cpu_count()):
+        """
+        :param graph: connected CSRGraph
+        :param degrees: array with the degrees of all the nodes of the original graph
+        :param max_bfs_nodes: max amount of source nodes for the shared BFS distances. If the graph is larger,
+        the sources are sampled
+        :param n_cpus: The number of CPUs used for parallelization.
+        """
+        self.graph = graph
+        self.all_degrees = degrees
+        self.max_bfs_nodes = max_bfs_nodes
+        self.n_cpus = n_cpus
+        self._distances = None
+
+    @classmethod
+    def from_edges(cls, src, dst, min_num_nodes=0, **kwargs):
+        """
+        :param src, dst: arrays with the ids or labels of the ends of each edge, for instance the head and tail
+        columns of the triplets
+        :param min_num_nodes: The minimum number of nodes in the largest connected component to keep.
+        :return: GraphAnalysis, node_ids: the analysis of the largest connected component and the original id of
+        each of its nodes
+        """
+        node_ids, inverse = np.unique(np.concatenate((src, dst)), return_inverse=True)
+        edges_src, edges_dst = unique_edges(inverse[:len(src)], inverse[len(src):])
+        degrees = np.bincount(np.concatenate((edges_src, edges_dst)), minlength=len(node_ids))
+        graph, lcc_ids = largest_connected_component(src, dst)
+        if graph.n_nodes < len(node_ids):
+            logging.warning('Keeping the largest connected component only with %d nodes.', graph.n_nodes)
+        if graph.n_nodes <= min_num_nodes:
+            raise ValueError(f"min_num_nodes = {min_num_nodes} but largest connected component has "
+                             f"{graph.n_nodes} nodes")
+        return cls(graph, degrees, **kwargs), lcc_ids
+
+    @classmethod
+    def from_networkx(cls, g, min_num_nodes=0, **kwargs):
+        """:return: GraphAnalysis, node_labels: as 'from_edges', for the edges of a networkx graph"""
+        node_labels = np.asarray(list(g.nodes()), dtype=object)
+        index = {node: i for i, node in enumerate(g.nodes())}
+        edges = np.array([(index[u], index[v]) for u, v in g.edges()], dtype=np.int64).reshape(-1, 2)
+        analysis, lcc_ids = cls.from_edges(edges[:, 0], edges[:, 1], min_num_nodes=min_num_nodes, **kwargs)
+        return analysis, node_labels[lcc_ids].tolist()
+
+    @classmethod
+    def from_edgelist(cls, path, min_num_nodes=0, use_cache=True, **kwargs):
+        """
+        Loads the graph from an edge list and keeps its largest connected component.
+        The component is cached next to the edge list as '<name>+lcc.npz', so following runs do not parse the
+        edge list again. The cache stores the size and modification time of the edge list, and it is rebuilt if
+        the edge list changed.
+        """
+        cache_file = _output_filename(path, 'lcc', True, 'npz')
+        stat = os.stat(path)
+        source = np.array([stat.st_size, stat.st_mtime_ns], dtype=np.int64)
+        if use_cache and os.path.isfile(cache_file):
+            with np.load(cache_file) as data:
+                is_stale = 'source' not in data.files or not np.array_equal(data['source'], source)
+                if not is_stale:
+                    graph = CSRGraph(data['indptr'], data['indices'], data['weights'])
+                    degrees = data['degrees']
+            if is_stale:
+                logging.info('Edge list %s changed since %s was built, rebuilding it', path, cache_file)
+            else:
+                if graph.n_nodes <= min_num_nodes:
+                    raise ValueError(f"min_num_nodes = {min_num_nodes} but largest connected component has "
+                                     f"{graph.n_nodes} nodes")
+                return cls(graph, degrees, **kwargs)
+
+        src, dst = read_edgelist(path)
+        if len(src) == 0:
+            raise ValueError('Empty graph. This is most probably due to a too small a distance threshold.')
+        analysis, _ = cls.from_edges(src, dst, min_num_nodes=min_num_nodes, **kwargs)
+        if use_cache:
+            np.savez(cache_file, indptr=analysis.graph.indptr, indices=analysis.graph.indices,
+                     weights=analysis.graph.weights, degrees=analysis.all_degrees, source=source)
+        return analysis
+
+    def distances(self):
+        """
+        :return: nodes, dists: sources of the BFS and the matrix of len(nodes) x n_nodes with their distances to
+        all the nodes. All the nodes are sources if the graph has at most max_bfs_nodes nodes.
+        """
+        if self._distances is None:
+            nodes = np.arange(self.graph.n_nodes)
+            if self.graph.n_nodes > self.max_bfs_nodes:
+                nodes = np.sort(np.random.choice(self.graph.n_nodes, self.max_bfs_nodes, replace=False))
+            logging.info('Running BFS from %d nodes', len(nodes))
+            self._distances = nodes, multi_source_bfs(self.graph, nodes, verbose=True)
+        return self._distances
+
+    def degrees(self):
+        """:return: degrees of all the nodes of the original graph"""
+        return self.all_degrees
+
+    def seccurvs(self, sample_ratio=0.5, max_neigh_pairs=int(1e4), nodes_ratio=1.):
+        """
+        Sectional curvatures of int(nodes_ratio * n_nodes) sampled nodes, with int(sample_ratio * n_nodes) reference
+        nodes for each one
+        """
+        num_ref_nodes = int(sample_ratio * self.graph.n_nodes)
+        m_nodes = np.arange(self.graph.n_nodes)
+        if nodes_ratio < 1:
+            m_nodes = np.random.choice(self.graph.n_nodes, int(nodes_ratio * self.graph.n_nodes), replace=False)
+        return sectional_curvatures(self.graph, m_nodes, num_ref_nodes, max_neigh_pairs, n_cpus=self.n_cpus,
+                                    ref_distances=self.distances())
+
+    def hyperbolicities(self, sampling_size=int(1e8), tolerance=1e-4):
+        """:return: values, counts: distribution of delta-hyperbolicities of sampled quadruples"""
+        return hyperbolicity_distribution(self.graph, sampling_size=sampling_size, tolerance=tolerance,
+                                          n_cpus=self.n_cpus, distances=self.distances())
+
+    def ricci(self, alpha=0.999, epsilon=0.05):
+        """:return: edges, edge_curvs, node_curvs: Ollivier-Ricci curvatures"""
+        return ricci_curvature(self.graph, alpha=alpha, epsilon=epsilon, n_cpus=self.n_cpus)
+
+    def layer_nodes(self, max_sources=None):
+        """
+        :param max_sources: if given and the graph is larger, the BFS runs from max_sources sampled nodes only
+        :return: array with the amount of nodes in each BFS layer, starting from layer 1, added over all the sources
+        """
+        sources = None
+        if max_sources is not None and self.graph.n_nodes > max_sources:
+            sources = np.sort(np.random.choice(self.graph.n_nodes, max_sources, replace=False))
+        return nodes_per_layer(self.graph, sources, n_cpus=self.n_cpus)
+
+
+def output_files(input_path, statistic, inherit):
+    """:return: list of the files where a statistic is stored"""
+    if statistic == 'hyperbolicities':
+        return [np_output_filename(input_path, 'hyp-values', inherit),
+                np_output_filename(input_path, 'hyp-counts', inherit)]
+    if statistic == 'ricci':
+        return [_output_filename(input_path, 'ricci', inherit, 'npz')]
+    if statistic == 'layer_nodes':
+        return [np_output_filename(input_path, 'layer-nodes', inherit)]
+    return [np_output_filename(input_path, statistic, inherit)]
+
+
+def save_statistic(files, statistic, result):
+    if statistic == 'hyperbolicities':
+        np.save(files[0], result[0])
+        np.save(files[1], result[1])
+    elif statistic == 'ricci':
+        edges, edge_curvs, node_curvs = result
+        np.savez(files[0], edges=edges, edge_curvs=edge_curvs, node_curvs=node_curvs)
+    else:
+        np.save(files[0], result)
+
+
+def run(input_path, statistics, force=False, inherit=False, min_num_nodes=100, stats_kwargs=None, **kwargs):
+    """
+    Computes and stores the given statistics of the graph in input_path, skipping the ones already stored.
+
+    :param statistics: list of names from STATISTICS
+    :param force: whether to compute statistics that were already stored
+    :param inherit: whether the output files inherit the name of the input
+    :param stats_kwargs: dict of statistic: dict with the parameters of the statistic
+    :param kwargs: parameters of GraphAnalysis
+    """
+    stats_kwargs = stats_kwargs or {}
+    pending = {}
+    for statistic in statistics:
+        files = output_files(input_path, statistic, inherit)
+        if all(os.path.isfile(f) for f in files) and not force:
+            logging.warning('The %s already exist: %s', statistic, files[0])
+        else:
+            pending[statistic] = files
+    if not pending:
+        return
+    analysis = GraphAnalysis.from_edgelist(input_path, min_num_nodes=min_num_nodes, **kwargs)
+    for statistic, files in pending.items():
+        logging.info('Computing %s', statistic)
+        result = getattr(analysis, statistic)(**stats_kwargs.get(statistic, {}))
+        save_statistic(files, statistic, result)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Compute graph statistics')
+    parser.add_argument('--input', type=str, required=True, help='The input graph.')
+    parser.add_argument(
+            '--stats',
+            type=str,
+            default=','.join(STATISTICS),
+            help=f'Comma separated statistics to compute, from: {", ".join(STATISTICS)}.')
+    parser.add_argument('--force', action='store_true', help='Re-generate them.')
+    parser.add_argument(
+            '--min_num_nodes',
+            type=int,
+            default=100,
+            help='The minimum number of nodes in the largest connected '
+            'component to keep.')
+    parser.add_argument(
+            '--max_bfs_nodes',
+            type=int,
+            default=8192,
+            help='Max amount of BFS sources for the distances shared by the '
+            'statistics. If the graph is larger, sources are sampled.')
+    parser.add_argument(
+            '--inherit_filename',
+            action='store_true',
+            help='Whether the file format of the output files should be '
+            'inheritted from the input.')
+    parser.add_argument(
+            '--n_cpus',
+            type=int,
+            default=multiprocessing.cpu_count(),
+            help='The number of CPUs used for parallelization.')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    run(args.input, args.stats.split(','), force=args.force, inherit=args.inherit_filename,
+        min_num_nodes=args.min_num_nodes, max_bfs_nodes=args.max_bfs_nodes, n_cpus=args.n_cpus)
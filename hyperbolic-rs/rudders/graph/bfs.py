@@ -0,0 +1,138 @@
+# Copyright 2017 The Rudders Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Multi-source breadth first search over CSR graphs"""
+
+import multiprocessing
+import numpy as np
+from tqdm import tqdm
+from rudders.graph.csr import CSRGraph
+from rudders.graph.shared import SharedArrays
+
+SOURCES_PER_WORD = 64
+
+# graph attached by the worker processes of the pool
+_WORKER_STATE = {}
+
+
+def _bfs_levels(graph, group):
+    """
+    Runs the BFS from a group of at most 64 sources at the same time.
+    Each node keeps a uint64 bitset with the sources that reached it, so one BFS level for the whole group costs a
+    single pass over the edges of the graph.
+
+    :param group: array of at most 64 different node ids
+    :return: generator of (level, frontier): frontier is the array of n_nodes bitsets with the bit i set for the
+    nodes at distance level from group[i]. It starts with level 0.
+    """
+    has_neighbors = graph.degrees() > 0
+    starts = graph.indptr[:-1][has_neighbors]
+    frontier = np.zeros(graph.n_nodes, dtype=np.uint64)
+    frontier[group] = np.left_shift(np.uint64(1), np.arange(len(group), dtype=np.uint64))
+    visited = frontier.copy()
+    level = 0
+    while frontier.any():
+        yield level, frontier
+        level += 1
+        reached = np.zeros(graph.n_nodes, dtype=np.uint64)
+        if len(starts):
+            reached[has_neighbors] = np.bitwise_or.reduceat(frontier[graph.indices], starts)
+        frontier = reached & ~visited
+        visited |= frontier
+
+
+def multi_source_bfs(graph, sources, dtype=np.uint16, verbose=False, out=None):
+    """
+    Computes the hop distances from each source node to all the nodes of the graph.
+    Sources are processed in groups of 64 with bitset frontiers (see _bfs_levels).
+
+    :param graph: CSRGraph
+    :param sources: array of different node ids
+    :param dtype: unsigned integer dtype of the distances. Unreachable nodes get the max value of the dtype.
+    :param out: optional array of len(sources) x n_nodes where the distances are written, for instance a shared
+    memory array. If given, dtype is taken from it.
+    :return: numpy array of len(sources) x n_nodes with the distance from each source to each node
+    """
+    sources = np.asarray(sources, dtype=np.int64)
+    if out is None:
+        dists = np.empty((len(sources), graph.n_nodes), dtype=dtype)
+    else:
+        dists = out
+    dists[:] = np.iinfo(dists.dtype).max
+    groups = range(0, len(sources), SOURCES_PER_WORD)
+    for ini in tqdm(groups, desc="multi_source_bfs", disable=not verbose):
+        group = sources[ini:ini + SOURCES_PER_WORD]
+        shifts = np.arange(len(group), dtype=np.uint64)
+        for level, frontier in _bfs_levels(graph, group):
+            nodes = np.flatnonzero(frontier)
+            # unpacks the bitsets of the new nodes into (source, node) pairs
+            bits = (frontier[nodes][None, :] >> shifts[:, None]) & np.uint64(1)
+            group_idx, node_idx = np.nonzero(bits)
+            dists[ini + group_idx, nodes[node_idx]] = level
+    return dists
+
+
+def layer_counts(graph, sources):
+    """
+    Counts the nodes in each BFS layer of the sources, without storing their distances.
+
+    :param graph: CSRGraph
+    :param sources: array of different node ids
+    :return: int64 array where the position l has the amount of pairs (source, node) at distance l
+    """
+    sources = np.asarray(sources, dtype=np.int64)
+    counts = []
+    for ini in range(0, len(sources), SOURCES_PER_WORD):
+        for level, frontier in _bfs_levels(graph, sources[ini:ini + SOURCES_PER_WORD]):
+            if level == len(counts):
+                counts.append(0)
+            # popcount of all the bitsets of the frontier
+            counts[level] += int(np.unpackbits(frontier[frontier != 0].view(np.uint8)).sum())
+    return np.array(counts, dtype=np.int64)
+
+
+def nodes_per_layer(graph, sources=None, n_cpus=multiprocessing.cpu_count(), groups_per_task=4):
+    """
+    Computes the BFS layer profile of the graph: the amount of nodes at each distance from the sources, added over
+    all the sources. Groups of 64 sources are processed in parallel. The CSR arrays are put in shared memory once,
+    and tasks only carry source ids.
+
+    :param graph: CSRGraph
+    :param sources: array of different source nodes. If None, all the nodes of the graph are sources.
+    :param n_cpus: The number of CPUs used for parallelization.
+    :param groups_per_task: amount of groups of 64 sources processed by each task of the pool
+    :return: int64 array where the position l has the amount of pairs (source, node) at distance l + 1
+    """
+    sources = np.arange(graph.n_nodes) if sources is None else np.asarray(sources, dtype=np.int64)
+    task_size = SOURCES_PER_WORD * groups_per_task
+    tasks = [sources[ini:ini + task_size] for ini in range(0, len(sources), task_size)]
+    with SharedArrays() as shared:
+        shared.add("indptr", graph.indptr)
+        shared.add("indices", graph.indices)
+        shared.add("weights", graph.weights)
+        with multiprocessing.Pool(n_cpus, initializer=_init_worker, initargs=(shared.paths,)) as pool:
+            results = list(tqdm(pool.imap_unordered(_layer_counts_task, tasks), total=len(tasks),
+                                desc="nodes_per_layer"))
+    counts = np.zeros(max([len(r) for r in results] + [1]), dtype=np.int64)
+    for result in results:
+        counts[:len(result)] += result
+    return counts[1:]
+
+
+def _init_worker(paths):
+    arrays = SharedArrays.attach(paths)
+    _WORKER_STATE["graph"] = CSRGraph(arrays["indptr"], arrays["indices"], arrays["weights"])
+
+
+def _layer_counts_task(sources):
+    return layer_counts(_WORKER_STATE["graph"], sources)
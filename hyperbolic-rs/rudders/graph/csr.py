@@ -0,0 +1,153 @@
+# Copyright 2017 The Rudders Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Undirected graphs stored as compressed sparse row (CSR) numpy arrays"""
+
+import numpy as np
+
+
+class CSRGraph:
+    """
+    Undirected graph with nodes 0, ..., n_nodes - 1 in CSR format.
+    The neighbors of node u are indices[indptr[u]:indptr[u + 1]], sorted in ascending order, and the weights of
+    the edges to them are weights[indptr[u]:indptr[u + 1]]. Each undirected edge is stored in both directions.
+    """
+
+    def __init__(self, indptr, indices, weights=None):
+        self.indptr = np.asarray(indptr, dtype=np.int64)
+        self.indices = np.asarray(indices)
+        self.weights = np.ones(len(self.indices), dtype=np.float32) if weights is None else np.asarray(weights)
+
+    @classmethod
+    def from_edges(cls, src, dst, weights=None, n_nodes=None):
+        """
+        Builds the graph from a list of undirected edges in COO format.
+        Each edge must appear only once, in either direction, and without self loops.
+
+        :param src, dst: arrays of node ids with the ends of each edge
+        :param weights: array with the weight of each edge. If None, every edge has weight 1
+        :param n_nodes: amount of nodes. If None, it is the max node id + 1
+        """
+        src, dst = np.asarray(src, dtype=np.int64), np.asarray(dst, dtype=np.int64)
+        if n_nodes is None:
+            n_nodes = int(max(src.max(initial=-1), dst.max(initial=-1))) + 1
+        weights = np.ones(len(src), dtype=np.float32) if weights is None else np.asarray(weights)
+
+        rows = np.concatenate((src, dst))
+        cols = np.concatenate((dst, src))
+        order = np.lexsort((cols, rows))
+        indptr = np.zeros(n_nodes + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=n_nodes), out=indptr[1:])
+        indices = cols[order].astype(np.int32 if n_nodes < np.iinfo(np.int32).max else np.int64)
+        return cls(indptr, indices, np.concatenate((weights, weights))[order])
+
+    @classmethod
+    def from_networkx(cls, g):
+        """Builds the graph from a networkx graph with nodes 0, ..., n - 1. Self loops are dropped"""
+        edges = np.array(g.edges(), dtype=np.int64).reshape(-1, 2)
+        edges = edges[edges[:, 0] != edges[:, 1]]
+        return cls.from_edges(edges[:, 0], edges[:, 1], n_nodes=g.number_of_nodes())
+
+    @property
+    def n_nodes(self):
+        return len(self.indptr) - 1
+
+    @property
+    def n_edges(self):
+        """Amount of undirected edges"""
+        return len(self.indices) // 2
+
+    def degrees(self):
+        return np.diff(self.indptr)
+
+    def neighbors(self, node):
+        return self.indices[self.indptr[node]:self.indptr[node + 1]]
+
+    def has_edges(self, src, dst):
+        """:return: boolean array that tells if there is an edge between each src[i] and dst[i]"""
+        src, dst = np.asarray(src, dtype=np.int64), np.asarray(dst)
+        end = self.indptr[src + 1]
+        # vectorized binary search of each dst within the sorted neighbors of its src
+        low, high = self.indptr[src].copy(), end.copy()
+        searching = low < high
+        while np.any(searching):
+            mid = (low + high) // 2
+            go_right = searching & (self.indices[np.where(searching, mid, 0)] < dst)
+            low = np.where(go_right, mid + 1, low)
+            high = np.where(searching & ~go_right, mid, high)
+            searching = low < high
+        found = low < end
+        found[found] = self.indices[low[found]] == dst[found]
+        return found
+
+    def edges(self):
+        """:return: src, dst, weights: arrays with each undirected edge once, with src < dst"""
+        src = np.repeat(np.arange(self.n_nodes), self.degrees())
+        mask = src < self.indices
+        return src[mask], self.indices[mask], self.weights[mask]
+
+    def save(self, path, node_labels=None):
+        """
+        Saves the graph in binary format, as a numpy .npz file
+
+        :param node_labels: optional list with the label of each node, stored along with the graph
+        """
+        arrays = {"indptr": self.indptr, "indices": self.indices, "weights": self.weights}
+        if node_labels is not None:
+            arrays["node_labels"] = np.asarray(node_labels, dtype=str)
+        np.savez(path, **arrays)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Loads a graph stored with 'save'
+
+        :return: graph, node_labels: CSRGraph and the list of node labels, or None if they were not stored
+        """
+        with np.load(path) as data:
+            graph = cls(data["indptr"], data["indices"], data["weights"])
+            node_labels = data["node_labels"].tolist() if "node_labels" in data else None
+        return graph, node_labels
+
+    def write_edgelist(self, path, node_labels=None, chunk_size=1000000):
+        """
+        Writes the graph as a text weighted edge list, with one line 'src dst weight' per undirected edge, in the
+        same format as networkx.write_weighted_edgelist. Lines are formatted in chunks of chunk_size edges.
+
+        :param node_labels: list with the label of each node. If None, node ids are used as labels.
+        """
+        src, dst, weights = self.edges()
+        labels = np.asarray(node_labels if node_labels is not None else np.arange(self.n_nodes), dtype=str)
+        with open(path, "w") as f:
+            for ini in range(0, len(src), chunk_size):
+                end = ini + chunk_size
+                lines = np.char.add(np.char.add(labels[src[ini:end]], " "), labels[dst[ini:end]])
+                lines = np.char.add(np.char.add(lines, " "), weights[ini:end].astype(str))
+                f.write("\n".join(lines.tolist()))
+                f.write("\n")
+
+    def to_networkx(self, node_labels=None):
+        """
+        Networkx adapter. Only nodes with at least one edge are added to the networkx graph.
+
+        :param node_labels: list with the label of each node. If None, node ids are used as labels.
+        """
+        import networkx as nx
+
+        src, dst, weights = self.edges()
+        if node_labels is not None:
+            node_labels = np.asarray(node_labels, dtype=object)
+            src, dst = node_labels[src], node_labels[dst]
+        graph = nx.Graph()
+        graph.add_weighted_edges_from(zip(src.tolist(), dst.tolist(), weights.tolist()))
+        return graph
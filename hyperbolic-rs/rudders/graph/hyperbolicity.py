@@ -0,0 +1,131 @@
+# Copyright 2017 The Rudders Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Estimation of the distribution of Gromov delta-hyperbolicity of a graph by sampling quadruples of nodes"""
+
+import multiprocessing
+from absl import logging
+import numpy as np
+from rudders.graph.bfs import multi_source_bfs
+from rudders.graph.shared import SharedArrays
+
+# distance matrix attached by the worker processes of the pool
+_WORKER_STATE = {}
+
+
+def quadruple_hyperbolicities(dists, quadruples):
+    """
+    Computes the hyperbolicity of each quadruple (a, b, c, d): half the difference between the two largest sums of
+    d(a, b) + d(c, d), d(a, c) + d(b, d) and d(a, d) + d(b, c).
+
+    :param dists: n x n matrix of distances
+    :param quadruples: array of batch x 4 with node indexes
+    :return: array of batch with twice the hyperbolicity of each quadruple, which is an integer for hop distances
+    """
+    a, b, c, d = quadruples.T
+    sums = np.stack((dists[a, b].astype(np.int64) + dists[c, d],
+                     dists[a, c].astype(np.int64) + dists[b, d],
+                     dists[a, d].astype(np.int64) + dists[b, c]), axis=1)
+    sums.sort(axis=1)
+    return sums[:, 2] - sums[:, 1]
+
+
+def sample_quadruples(n_nodes, size, rng):
+    """:return: array of at most size x 4 random quadruples of different nodes"""
+    quadruples = rng.randint(n_nodes, size=(size, 4))
+    quadruples.sort(axis=1)
+    different = np.all(quadruples[:, 1:] != quadruples[:, :-1], axis=1)
+    return quadruples[different]
+
+
+def hyperbolicity_histogram(dists, n_samples, rng, batch_size=int(1e6)):
+    """:return: array where the position i has the amount of sampled quadruples with hyperbolicity i / 2"""
+    counts = np.zeros(1, dtype=np.int64)
+    sampled = 0
+    while sampled < n_samples:
+        quadruples = sample_quadruples(len(dists), min(batch_size, n_samples - sampled), rng)
+        sampled += len(quadruples)
+        batch_counts = np.bincount(quadruple_hyperbolicities(dists, quadruples))
+        counts = _add_histograms(counts, batch_counts)
+    return counts
+
+
+def _add_histograms(h1, h2):
+    if len(h1) < len(h2):
+        h1, h2 = h2, h1
+    h1 = h1.copy()
+    h1[:len(h2)] += h2
+    return h1
+
+
+def _init_worker(paths):
+    _WORKER_STATE["dists"] = SharedArrays.attach(paths)["dists"]
+
+
+def _sample_task(task):
+    n_samples, seed = task
+    return hyperbolicity_histogram(_WORKER_STATE["dists"], n_samples, np.random.RandomState(seed))
+
+
+def hyperbolicity_distribution(graph, sampling_size=int(1e8), max_nodes=8192, samples_per_task=int(1e6),
+                               tolerance=1e-4, n_cpus=multiprocessing.cpu_count(), distances=None):
+    """
+    Estimates the distribution of delta-hyperbolicities of a connected graph by sampling quadruples of nodes.
+    If the graph has more than max_nodes nodes, quadruples are sampled from a random subset of max_nodes nodes, so
+    only their BFS distances are required. Quadruples are sampled in vectorized batches by a pool of processes that
+    share the distance matrix. After each round of n_cpus tasks, the distribution is compared with the one of the
+    previous round, and sampling stops early when the largest change of a relative frequency is below tolerance.
+
+    :param graph: connected CSRGraph
+    :param sampling_size: max amount of quadruples to sample
+    :param max_nodes: max amount of nodes to sample quadruples from
+    :param samples_per_task: quadruples sampled by each task of the pool
+    :param tolerance: convergence threshold of the relative frequencies. If 0, all samples are taken.
+    :param n_cpus: The number of CPUs used for parallelization.
+    :param distances: optional tuple (nodes, dists) with precomputed distances from nodes to all the nodes, as
+    returned by multi_source_bfs. If given, quadruples are sampled from these nodes and no distances are computed.
+    :return: values, counts: arrays with the sampled hyperbolicities and their relative frequencies multiplied by
+    sampling_size, as the SageMath implementation returned them. Counts are comparable between runs even if sampling
+    stopped early.
+    """
+    if distances is None:
+        nodes = np.arange(graph.n_nodes)
+        if graph.n_nodes > max_nodes:
+            nodes = np.sort(np.random.choice(graph.n_nodes, max_nodes, replace=False))
+        logging.info(f"Running BFS from {len(nodes)} nodes")
+        distances = nodes, multi_source_bfs(graph, nodes, verbose=True)
+    nodes, dists = distances
+    if len(nodes) < 4:
+        raise ValueError(f"At least 4 nodes are required to compute hyperbolicities, but the graph has {len(nodes)}")
+    counts = np.zeros(1, dtype=np.int64)
+    with SharedArrays() as shared:
+        shared.add("dists", dists[:, nodes])
+        with multiprocessing.Pool(n_cpus, initializer=_init_worker, initargs=(shared.paths,)) as pool:
+            sampled = 0
+            while sampled < sampling_size:
+                round_samples = [min(samples_per_task, sampling_size - sampled - i * samples_per_task)
+                                 for i in range(n_cpus)]
+                tasks = [(n, np.random.randint(2 ** 31)) for n in round_samples if n > 0]
+                new_counts = counts
+                for task_counts in pool.map(_sample_task, tasks):
+                    new_counts = _add_histograms(new_counts, task_counts)
+                sampled += sum(n for n, _ in tasks)
+                change = np.max(np.abs(_add_histograms(new_counts / new_counts.sum(), -counts / max(counts.sum(), 1))))
+                counts = new_counts
+                logging.info(f"Sampled quadruples: {counts.sum()}, max change of the distribution: {change:.2e}")
+                if change < tolerance:
+                    break
+
+    values = np.flatnonzero(counts)
+    frequencies = counts[values] / counts.sum()
+    return values / 2, (frequencies * sampling_size).astype(np.int64)
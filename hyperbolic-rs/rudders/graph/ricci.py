@@ -0,0 +1,267 @@
+# Copyright 2017 The Rudders Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Ollivier-Ricci curvature of the edges of a graph, with entropic optimal transport between neighborhoods"""
+
+import multiprocessing
+from absl import logging
+import numpy as np
+import scipy.sparse as sp
+from tqdm import tqdm
+from rudders.graph.csr import CSRGraph
+from rudders.graph.shared import SharedArrays
+
+# graph attached by the worker processes of the pool
+_WORKER_STATE = {}
+
+
+def _bucket_size(sizes):
+    """:return: smallest power of 2 greater or equal than each size"""
+    return 2 ** np.ceil(np.log2(np.maximum(sizes, 1))).astype(np.int64)
+
+
+def neighborhoods(graph, nodes, size):
+    """
+    :param nodes: array of n nodes
+    :param size: size of the neighborhoods. Nodes with size or more neighbors keep a random sample of size - 1 of them
+    :return: n x size array where row i has nodes[i] followed by its neighbors, padded with -1
+    """
+    degrees = graph.degrees()[nodes]
+    truncated = degrees >= size
+    kept = np.where(truncated, 0, degrees)
+    neighs = np.full((len(nodes), size), -1, dtype=np.int64)
+    neighs[:, 0] = nodes
+    rows = np.repeat(np.arange(len(nodes)), kept)
+    cols = 1 + np.arange(kept.sum()) - np.repeat(np.cumsum(kept) - kept, kept)
+    starts = np.repeat(graph.indptr[nodes], kept)
+    neighs[rows, cols] = graph.indices[starts + cols - 1]
+    for row in np.flatnonzero(truncated):
+        node = nodes[row]
+        neighs[row, 1:] = np.random.choice(graph.indices[graph.indptr[node]:graph.indptr[node + 1]], size - 1,
+                                           replace=False)
+    return neighs
+
+
+def neighborhood_masses(neighs, alpha):
+    """
+    :return: masses of the same shape as neighs: alpha for the node itself, (1 - alpha) / n_neighbors for the
+    neighbors in the neighborhood
+    """
+    n_neighs = np.sum(neighs[:, 1:] >= 0, axis=1)
+    masses = np.where(neighs >= 0, ((1 - alpha) / np.maximum(n_neighs, 1))[:, None], 0.)
+    masses[:, 0] = np.where(n_neighs > 0, alpha, 1.)
+    return masses
+
+
+def _neighbor_entries(graph, neighs):
+    """
+    :return: rows, cols: entries of a sparse matrix where the row of neighs[b, i] (b * size + i) has the neighbors
+    of the node in the columns b * n_nodes + neighbor, so rows of different elements of the batch never share columns
+    """
+    size = neighs.shape[1]
+    nodes = neighs.ravel()
+    degrees = np.where(nodes >= 0, graph.degrees()[np.maximum(nodes, 0)], 0)
+    rows = np.repeat(np.arange(len(nodes)), degrees)
+    offsets = np.arange(degrees.sum()) - np.repeat(np.cumsum(degrees) - degrees, degrees)
+    cols = graph.indices[np.repeat(graph.indptr[np.maximum(nodes, 0)], degrees) + offsets].astype(np.int64)
+    return rows, cols + rows // size * graph.n_nodes
+
+
+def neighborhood_distances(graph, src_neighs, dst_neighs):
+    """
+    Computes the hop distances between the nodes of the neighborhoods of the ends of a batch of edges.
+    Since the ends of each edge are adjacent, all distances are 0, 1, 2 or 3: two different nodes are at distance 2
+    if they are not adjacent but have a common neighbor. Common neighbors of all the batch are counted with a single
+    sparse product, where each element of the batch uses a disjoint range of columns.
+
+    :param src_neighs: batch x size_src neighborhoods of the src of each edge, padded with -1
+    :param dst_neighs: batch x size_dst neighborhoods of the dst of each edge, padded with -1
+    :return: batch x size_src x size_dst array of distances. Distances with padding nodes are 3
+    """
+    batch, size_src = src_neighs.shape
+    size_dst = dst_neighs.shape[1]
+    src_rows, src_cols = _neighbor_entries(graph, src_neighs)
+    dst_rows, dst_cols = _neighbor_entries(graph, dst_neighs)
+    # only the columns in use are kept
+    cols, inverse = np.unique(np.concatenate((src_cols, dst_cols)), return_inverse=True)
+    src_matrix = sp.csr_matrix((np.ones(len(src_rows), dtype=np.int32), (src_rows, inverse[:len(src_cols)])),
+                               shape=(src_neighs.size, len(cols)))
+    dst_matrix = sp.csr_matrix((np.ones(len(dst_rows), dtype=np.int32), (dst_rows, inverse[len(src_cols):])),
+                               shape=(dst_neighs.size, len(cols)))
+    common = (src_matrix @ dst_matrix.T).tocoo()
+    has_common = np.zeros((batch, size_src, size_dst), dtype=bool)
+    has_common[common.row // size_src, common.row % size_src, common.col % size_dst] = True
+
+    src = np.broadcast_to(src_neighs[:, :, None], has_common.shape)
+    dst = np.broadcast_to(dst_neighs[:, None, :], has_common.shape)
+    valid = (src >= 0) & (dst >= 0)
+    adjacent = np.zeros(has_common.shape, dtype=bool)
+    adjacent[valid] = graph.has_edges(src[valid], dst[valid])
+    dists = np.where(adjacent, 1, np.where(has_common, 2, 3)).astype(np.float64)
+    dists[(src == dst) & valid] = 0
+    return dists
+
+
+def _logsumexp(x, axis):
+    x_max = np.max(x, axis=axis, keepdims=True)
+    x_max = np.where(np.isfinite(x_max), x_max, 0)
+    return np.squeeze(x_max, axis=axis) + np.log(np.sum(np.exp(x - x_max), axis=axis))
+
+
+def _round_plan(plan, src_masses, dst_masses):
+    """
+    Rounds approximate transport plans to plans with exactly the given marginals (Altschuler et al., 2017), so their
+    cost is an upper bound of the optimal transport cost
+    """
+    with np.errstate(divide="ignore", invalid="ignore"):
+        row_scale = np.where(src_masses > 0, np.minimum(src_masses / plan.sum(axis=2), 1), 0)
+        plan = plan * row_scale[:, :, None]
+        col_scale = np.where(dst_masses > 0, np.minimum(dst_masses / plan.sum(axis=1), 1), 0)
+        plan = plan * col_scale[:, None, :]
+    src_err = src_masses - plan.sum(axis=2)
+    dst_err = dst_masses - plan.sum(axis=1)
+    dst_err_norm = np.maximum(dst_err.sum(axis=1), np.finfo(plan.dtype).tiny)
+    return plan + src_err[:, :, None] * dst_err[:, None, :] / dst_err_norm[:, None, None]
+
+
+def sinkhorn_cost(src_masses, dst_masses, costs, epsilon=0.05, max_iters=500, tolerance=1e-6, check_every=10):
+    """
+    Batched entropic optimal transport, with the Sinkhorn algorithm in the log domain.
+    The regularization is decreased geometrically from the max cost down to epsilon (epsilon scaling), warm
+    starting the potentials of each stage with the previous one, which converges much faster than starting with a
+    small epsilon. Problems of the batch that converge are dropped from the following iterations of the stage.
+    The final plans are rounded to match the marginals exactly.
+
+    :param src_masses: batch x n distributions. Zero masses are allowed for padding.
+    :param dst_masses: batch x m distributions
+    :param costs: batch x n x m costs
+    :param epsilon: entropic regularization. With integer costs the error of the transport cost decreases as
+    exp(-1 / epsilon)
+    :param max_iters: max amount of Sinkhorn iterations per stage
+    :param tolerance: a problem has converged when the marginals of its plan are this close to src_masses
+    :param check_every: iterations between convergence checks
+    :return: array of batch with the cost of the transport plan of each element of the batch
+    """
+    with np.errstate(divide="ignore"):
+        log_src, log_dst = np.log(src_masses), np.log(dst_masses)
+    f = np.zeros(src_masses.shape)
+    g = np.zeros(dst_masses.shape)
+    max_cost = max(costs.max(), epsilon)
+    n_stages = int(np.ceil(np.log2(max_cost / epsilon))) + 1
+    for eps in np.geomspace(max_cost, epsilon, n_stages):
+        active = np.arange(len(costs))
+        active_costs, active_log_src, active_log_dst = costs, log_src, log_dst
+        active_f, active_g = f, g
+        for i in range(1, max_iters + 1):
+            active_f = eps * (active_log_src - _logsumexp((active_g[:, None, :] - active_costs) / eps, axis=2))
+            active_g = eps * (active_log_dst - _logsumexp((active_f[:, :, None] - active_costs) / eps, axis=1))
+            if i % check_every and i < max_iters:
+                continue
+            f[active], g[active] = active_f, active_g
+            plan = np.exp((active_f[:, :, None] + active_g[:, None, :] - active_costs) / eps)
+            pending = np.max(np.abs(plan.sum(axis=2) - src_masses[active]), axis=1) >= tolerance
+            if not np.any(pending):
+                break
+            active = active[pending]
+            active_costs, active_log_src, active_log_dst = costs[active], log_src[active], log_dst[active]
+            active_f, active_g = f[active], g[active]
+    plan = np.exp((f[:, :, None] + g[:, None, :] - costs) / epsilon)
+    plan = _round_plan(plan, src_masses, dst_masses)
+    return np.sum(plan * costs, axis=(1, 2))
+
+
+def edge_curvatures(graph, src, dst, alpha=0.5, epsilon=0.05, max_batch_elements=int(2 ** 22), max_neighbors=None):
+    """
+    Computes the Ollivier-Ricci curvature 1 - W1(m_src, m_dst) of a list of edges, where m_x keeps alpha mass in x
+    and spreads 1 - alpha uniformly over its neighbors.
+    Edges are grouped in buckets by the size of their neighborhoods, padded to powers of 2, so the transport
+    problems of each bucket are solved in batch.
+    The cost tensor of an edge has (degree_src + 1) x (degree_dst + 1) elements, so an edge between two hubs would not
+    fit in memory. Nodes with more than max_neighbors neighbors spread their mass over a uniform random sample of
+    max_neighbors of them instead, and the curvature of their edges is an estimate.
+
+    :param graph: CSRGraph
+    :param src, dst: arrays with the ends of each edge
+    :param max_batch_elements: max amount of elements of the cost tensors of each batch of edges
+    :param max_neighbors: max amount of neighbors of each node. If None, it is the largest one such that the padded
+    cost tensor of a single edge fits in max_batch_elements (2047 by default).
+    :return: array with the curvature of each edge
+    """
+    if max_neighbors is None:
+        max_neighbors = 2 ** (int(np.log2(max_batch_elements)) // 2) - 1
+    src, dst = np.asarray(src, dtype=np.int64), np.asarray(dst, dtype=np.int64)
+    degrees = np.minimum(graph.degrees(), max_neighbors)
+    src_sizes, dst_sizes = _bucket_size(degrees[src] + 1), _bucket_size(degrees[dst] + 1)
+    curvatures = np.empty(len(src), dtype=np.float64)
+    buckets, bucket_ids = np.unique(np.stack((src_sizes, dst_sizes), axis=1), axis=0, return_inverse=True)
+    for bucket, (size_src, size_dst) in enumerate(buckets):
+        edges = np.flatnonzero(bucket_ids.ravel() == bucket)
+        batch = max(1, max_batch_elements // (size_src * size_dst))
+        for ini in range(0, len(edges), batch):
+            batch_edges = edges[ini:ini + batch]
+            src_neighs = neighborhoods(graph, src[batch_edges], size_src)
+            dst_neighs = neighborhoods(graph, dst[batch_edges], size_dst)
+            costs = neighborhood_distances(graph, src_neighs, dst_neighs)
+            w1 = sinkhorn_cost(neighborhood_masses(src_neighs, alpha), neighborhood_masses(dst_neighs, alpha), costs,
+                               epsilon=epsilon)
+            curvatures[batch_edges] = 1 - w1
+    return curvatures
+
+
+def _init_worker(paths):
+    arrays = SharedArrays.attach(paths)
+    _WORKER_STATE["graph"] = CSRGraph(arrays["indptr"], arrays["indices"], arrays["weights"])
+
+
+def _curvatures_task(task):
+    src, dst, alpha, epsilon = task
+    return edge_curvatures(_WORKER_STATE["graph"], src, dst, alpha=alpha, epsilon=epsilon)
+
+
+def ricci_curvature(graph, alpha=0.5, epsilon=0.05, edges_per_task=4096, n_cpus=multiprocessing.cpu_count()):
+    """
+    Computes the Ollivier-Ricci curvature of all the edges of the graph, and the curvature of each node as the
+    mean of the curvatures of its edges. Edges are sorted by neighborhood size and split in tasks of a process pool
+    that shares the CSR arrays of the graph. The neighborhoods of nodes with more than 2047 neighbors are sampled,
+    to bound the memory of each transport problem (see edge_curvatures).
+
+    :param graph: CSRGraph
+    :param alpha: mass that each node keeps when spreading it to its neighbors
+    :param epsilon: entropic regularization of the optimal transport
+    :param edges_per_task: amount of edges processed by each task of the pool
+    :param n_cpus: The number of CPUs used for parallelization.
+    :return: edges, edge_curvs, node_curvs: array of n_edges x 2 with each edge (src < dst), array with their
+    curvatures and array with the curvature of each node (nan for nodes without edges)
+    """
+    src, dst, _ = graph.edges()
+    src, dst = src.astype(np.int64), dst.astype(np.int64)
+    degrees = graph.degrees()
+    # similar neighborhood sizes together, so tasks share buckets
+    order = np.lexsort((degrees[dst], degrees[src]))
+    tasks = [(src[order[i:i + edges_per_task]], dst[order[i:i + edges_per_task]], alpha, epsilon)
+             for i in range(0, len(order), edges_per_task)]
+    logging.info(f"Computing Ricci curvatures of {len(src)} edges over {n_cpus} cpus...")
+    edge_curvs = np.empty(len(src), dtype=np.float64)
+    with SharedArrays() as shared:
+        for name in ("indptr", "indices", "weights"):
+            shared.add(name, getattr(graph, name))
+        with multiprocessing.Pool(n_cpus, initializer=_init_worker, initargs=(shared.paths,)) as pool:
+            results = pool.imap(_curvatures_task, tasks)
+            for i, curvs in enumerate(tqdm(results, total=len(tasks), desc="ricci_curvature")):
+                edge_curvs[order[i * edges_per_task:(i + 1) * edges_per_task]] = curvs
+
+    curv_sums = np.bincount(src, weights=edge_curvs, minlength=graph.n_nodes)
+    curv_sums += np.bincount(dst, weights=edge_curvs, minlength=graph.n_nodes)
+    with np.errstate(invalid="ignore"):
+        node_curvs = curv_sums / degrees
+    return np.stack((src, dst), axis=1), edge_curvs, node_curvs
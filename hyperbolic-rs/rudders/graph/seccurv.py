@@ -13,21 +13,24 @@
 # limitations under the License.
 """Code adapted from https://github.com/dalab/matrix-manifolds/blob/master/analysis/seccurvs.py"""
 
-import itertools
 import multiprocessing
 from tqdm import tqdm
 import random
-import ctypes
 from absl import logging
 
-import networkit as nk
 import networkx as nx
 import numpy as np
 from rudders.graph.utils import get_largest_connected_component
+from rudders.graph.csr import CSRGraph
+from rudders.graph.bfs import multi_source_bfs
+from rudders.graph.shared import SharedArrays
+
+# graph and distances attached by the worker processes of the pool
+_WORKER_STATE = {}
 
 
 def seccurv(g, min_num_nodes=100, sample_ratio=0.5, max_neigh_pairs=int(1e4),
-            n_cpus=multiprocessing.cpu_count()):
+            n_cpus=multiprocessing.cpu_count(), nodes_per_chunk=64, sampled_distances=False, max_ref_nodes=4096):
     """
     Computes graph sectional curvatures
 
@@ -36,6 +39,11 @@ def seccurv(g, min_num_nodes=100, sample_ratio=0.5, max_neigh_pairs=int(1e4),
     :param sample_ratio: The percentage of all nodes to use as reference nodes `a`.
     :param max_neigh_pairs: The maximum number of neighbor pairs to compute seccurvs for
     :param n_cpus: The number of CPUs used for parallelization.
+    :param nodes_per_chunk: amount of nodes `m` processed by each task of the pool
+    :param sampled_distances: if True, instead of computing all pairs shortest paths, a set of at most
+    max_ref_nodes reference nodes is sampled and only the distances from them are computed, with a multi-source BFS.
+    The memory is max_ref_nodes x n_nodes instead of n_nodes x n_nodes.
+    :param max_ref_nodes: max amount of reference nodes in the sampled distances mode
     :return:
     """
     g = get_largest_connected_component(g)
@@ -48,20 +56,12 @@ def seccurv(g, min_num_nodes=100, sample_ratio=0.5, max_neigh_pairs=int(1e4),
         raise ValueError(f"min_num_nodes = {min_num_nodes} but largest connected component has {num_nodes} nodes")
 
     num_ref_nodes = int(sample_ratio * num_nodes)
-
-    # compute the shortest paths
-    logging.info("Building distance matrix")
-    dists = build_distance_matrix(g)
-
     # sampling of nodes to compute curvature
     m_samples = random.sample(range(num_nodes), num_ref_nodes)
-
-    # parallelize over nodes ``m``
-    logging.info(f"Starting parallelization over {n_cpus} cpus...")
-    pool = multiprocessing.Pool(n_cpus)
-    curvatures = pool.starmap(compute_sectional_curvatures,
-                              [(g, dists, num_ref_nodes, max_neigh_pairs, m) for m in m_samples])
-    curvatures = list(itertools.chain(*curvatures))
+    curvatures = sectional_curvatures(CSRGraph.from_networkx(g), m_samples, num_ref_nodes, max_neigh_pairs,
+                                      n_cpus=n_cpus, nodes_per_chunk=nodes_per_chunk,
+                                      sampled_distances=sampled_distances, max_ref_nodes=max_ref_nodes,
+                                      nx_graph=g).tolist()
 
     curv_mean = np.mean(curvatures)
     curv_std = np.std(curvatures)
@@ -70,52 +70,148 @@ def seccurv(g, min_num_nodes=100, sample_ratio=0.5, max_neigh_pairs=int(1e4),
     return curvatures
 
 
-def compute_sectional_curvatures(graph, dists, num_ref_nodes, max_neigh_pairs, m):
+def sectional_curvatures(graph, m_nodes, num_ref_nodes, max_neigh_pairs, n_cpus=multiprocessing.cpu_count(),
+                         nodes_per_chunk=64, sampled_distances=False, max_ref_nodes=4096, nx_graph=None,
+                         ref_distances=None):
     """
-    Computes sectional curvature by sampling triangles, as described in Gu et al.
+    Computes the sectional curvatures of the neighbor pairs of the nodes m_nodes in parallel.
+    The distances and the CSR arrays of the graph are put in shared memory once. Worker processes attach to them
+    at initialization, and tasks only carry chunks of node ids.
+
+    :param graph: connected CSRGraph
+    :param m_nodes: nodes `m` to compute curvatures for
+    :param num_ref_nodes: number of reference nodes `a` to sample for each m
+    :param max_neigh_pairs: The maximum number of neighbor pairs of each m to compute seccurvs for
+    :param n_cpus: The number of CPUs used for parallelization.
+    :param nodes_per_chunk: amount of nodes `m` processed by each task of the pool
+    :param sampled_distances: whether to compute only the distances from at most max_ref_nodes reference nodes
+    :param nx_graph: networkx version of graph, to compute all pairs shortest paths if sampled_distances is False.
+    If None, all pairs shortest paths are computed with BFS over graph.
+    :param ref_distances: optional tuple (ref_nodes, ref_dists) with precomputed distances from the reference nodes
+    to all the nodes, as returned by multi_source_bfs. If given, no distances are computed.
+    :return: numpy array with the sectional curvatures of all the sampled pairs
+    """
+    with SharedArrays() as shared:
+        if ref_distances is not None:
+            ref_nodes = ref_distances[0]
+            num_ref_nodes = min(num_ref_nodes, len(ref_nodes))
+            shared.add("ref_dists", ref_distances[1])
+        elif sampled_distances:
+            ref_nodes = np.sort(np.random.choice(graph.n_nodes, min(num_ref_nodes, max_ref_nodes), replace=False))
+            num_ref_nodes = len(ref_nodes)
+            logging.info(f"Running BFS from {num_ref_nodes} reference nodes")
+            dists = shared.empty("ref_dists", (num_ref_nodes, graph.n_nodes), dtype=np.uint16)
+            multi_source_bfs(graph, ref_nodes, verbose=True, out=dists)
+            dists.flush()
+            del dists
+        else:
+            logging.info("Building distance matrix")
+            ref_nodes = np.arange(graph.n_nodes)
+            dists = shared.empty("ref_dists", (graph.n_nodes, graph.n_nodes), dtype=np.uint16)
+            if nx_graph is not None:
+                build_distance_matrix(nx_graph, out=dists)
+            else:
+                multi_source_bfs(graph, ref_nodes, verbose=True, out=dists)
+            dists.flush()
+            del dists
+        shared.add("ref_nodes", ref_nodes)
+        shared.add("indptr", graph.indptr)
+        shared.add("indices", graph.indices)
+        shared.add("weights", graph.weights)
+
+        # parallelize over chunks of nodes ``m``
+        m_nodes = list(m_nodes)
+        chunks = [m_nodes[i:i + nodes_per_chunk] for i in range(0, len(m_nodes), nodes_per_chunk)]
+        tasks = [(chunk, num_ref_nodes, max_neigh_pairs, np.random.randint(2 ** 31)) for chunk in chunks]
+        logging.info(f"Starting parallelization over {n_cpus} cpus...")
+        with multiprocessing.Pool(n_cpus, initializer=_init_worker, initargs=(shared.paths,)) as pool:
+            curvatures = list(tqdm(pool.imap(_compute_chunk, tasks), total=len(tasks), desc="seccurv"))
+    return np.concatenate([curv for chunk in curvatures for curv in chunk] + [np.empty(0)])
+
+
+def _init_worker(paths):
+    arrays = SharedArrays.attach(paths)
+    _WORKER_STATE["graph"] = CSRGraph(arrays["indptr"], arrays["indices"], arrays["weights"])
+    _WORKER_STATE["ref_nodes"] = arrays["ref_nodes"]
+    _WORKER_STATE["ref_dists"] = arrays["ref_dists"]
+
+
+def _compute_chunk(task):
+    chunk, num_ref_nodes, max_neigh_pairs, seed = task
+    graph = _WORKER_STATE["graph"]
+    rng = np.random.RandomState(seed)
+    return [compute_sectional_curvatures(graph, _WORKER_STATE["ref_nodes"], _WORKER_STATE["ref_dists"],
+                                         num_ref_nodes, max_neigh_pairs, m, rng) for m in chunk]
+
+
+def sample_neighbor_pairs(neighs, max_neigh_pairs, rng):
+    """
+    Samples up to max_neigh_pairs different pairs (b, c) of neighbors, without building the list of all pairs.
 
-    :param graph: original graph
-    :param dists: matrix of distances
+    :param neighs: array of neighbors of a node
+    :return: bs, cs: arrays with the ends of each pair
+    """
+    n = len(neighs)
+    n_pairs = n * (n - 1) // 2
+    if n_pairs <= max_neigh_pairs:
+        i, j = np.triu_indices(n, k=1)
+        return neighs[i], neighs[j]
+    # maps indexes of pairs of the upper triangle, in row-major order, to (i, j)
+    idx = np.array(random.Random(int(rng.randint(2 ** 31))).sample(range(n_pairs), max_neigh_pairs),
+                   dtype=np.float64)
+    i = n - 2 - np.floor(np.sqrt(-8 * idx + 4 * n * (n - 1) - 7) / 2 - 0.5)
+    j = idx + i + 1 - n * (n - 1) / 2 + (n - i) * (n - i - 1) / 2
+    return neighs[i.astype(np.int64)], neighs[j.astype(np.int64)]
+
+
+def compute_sectional_curvatures(graph, ref_nodes, ref_dists, num_ref_nodes, max_neigh_pairs, m, rng=np.random,
+                                 max_block_size=int(2 ** 22)):
+    """
+    Computes sectional curvature by sampling triangles, as described in Gu et al.
+    The reference nodes `a` are sampled once for `m` and shared by all its neighbor pairs, so the curvature of a
+    block of pairs is computed with one numpy expression over a pairs x reference nodes matrix.
+    Since b and c are both neighbors of m, their distance is 1 if they are adjacent and 2 otherwise, so only the
+    distances from the reference nodes are required.
+
+    :param graph: CSRGraph
+    :param ref_nodes: array with the nodes that can be used as reference nodes
+    :param ref_dists: matrix of len(ref_nodes) x n_nodes with the distances from each reference node
     :param num_ref_nodes: number of nodes to sample
     :param max_neigh_pairs: max number of neighbor pairs to consider
     :param m: key of current node to use
-    :return: list of means of sectional curvatures
+    :param rng: numpy random state
+    :param max_block_size: max amount of elements of the pairs x reference nodes matrices
+    :return: array of means of sectional curvatures, one for each sampled pair of neighbors
     """
-    seccurvs = []
-    num_nodes = graph.number_of_nodes()
-    neighs = list(graph[m])
-    n_neighs = len(neighs)
-    neigh_pairs = [(neighs[i], neighs[j]) for i in range(n_neighs) for j in range(i + 1, n_neighs)]
-    for b, c in random.sample(neigh_pairs, min(max_neigh_pairs, len(neigh_pairs))):
-        xis = []
-        for a in random.sample(range(num_nodes), num_ref_nodes):
-            if a == m: continue
-            xi = dists[a][m] ** 2 + dists[b][c] ** 2 / 4 - (dists[a][b] ** 2 + dists[a][c] ** 2) / 2
-            xi_g = xi / dists[a][m] / 2
-            xis.append(xi_g)
-
-        seccurvs.append(np.mean(xis))
-
+    bs, cs = sample_neighbor_pairs(graph.neighbors(m).astype(np.int64), max_neigh_pairs, rng)
+    rows = rng.choice(len(ref_nodes), min(num_ref_nodes, len(ref_nodes)), replace=False)
+    rows = rows[ref_nodes[rows] != m]
+    d_am = ref_dists[rows, m].astype(np.float64)
+    block = max(1, max_block_size // max(len(rows), 1))
+    seccurvs = np.empty(len(bs), dtype=np.float64)
+    for ini in range(0, len(bs), block):
+        b, c = bs[ini:ini + block], cs[ini:ini + block]
+        d_ab = ref_dists[np.ix_(rows, b)].T.astype(np.float64)
+        d_ac = ref_dists[np.ix_(rows, c)].T.astype(np.float64)
+        d_bc = np.where(graph.has_edges(b, c), 1., 2.)[:, None]
+        xi = d_am ** 2 + d_bc ** 2 / 4 - (d_ab ** 2 + d_ac ** 2) / 2
+        seccurvs[ini:ini + block] = np.mean(xi / d_am / 2, axis=1)
     return seccurvs
 
 
-def build_distance_matrix(g):
-    """Builds a distance matrix from the graph g as a numpy array"""
+def build_distance_matrix(g, out=None):
+    """
+    Builds a distance matrix from the graph g as a numpy array
+
+    :param g: networkx graph with nodes 0, ..., n - 1
+    :param out: optional array of n x n where the distances are written, for instance a shared memory array
+    """
+    import networkit as nk
+
     gk = nk.nxadapter.nx2nk(g)
     shortest_paths = nk.distance.APSP(gk).run().getDistances()
     n_nodes = len(shortest_paths)
-    shared_array_base = multiprocessing.Array(ctypes.c_float, n_nodes ** 2, lock=False)
-    shared_array = np.ctypeslib.as_array(shared_array_base)
-    shared_array = np.reshape(shared_array, (n_nodes, n_nodes))
+    dists = np.empty((n_nodes, n_nodes), dtype=np.uint16) if out is None else out
     for i in tqdm(range(n_nodes), desc="copying_matrix"):
-        for j in range(n_nodes):
-            shared_array[i, j] = shortest_paths[i][j]
-
-    return shared_array
-    # return np.array(shortest_paths, dtype=np.float32)
-    # n_nodes = g.number_of_nodes()
-    # dists = {u: {} for u in range(n_nodes)}
-    # for i, u in enumerate(g.nodes()):
-    #     for j, v in enumerate(g.nodes()):
-    #         dists[u][v] = int(shortest_paths[i][j])
-    # return dists
+        dists[i] = np.minimum(shortest_paths[i], np.iinfo(dists.dtype).max)
+    return dists
@@ -0,0 +1,61 @@
+# Copyright 2017 The Rudders Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Numpy arrays shared with worker processes without copying them"""
+
+from pathlib import Path
+import tempfile
+import numpy as np
+
+
+class SharedArrays:
+    """
+    Numpy arrays shared with worker processes through memory mapped files.
+    Arrays are written once to a temporary directory, and workers open them with 'attach', given only their paths.
+    All processes read the same pages from the OS cache, so memory does not grow with the amount of workers, and
+    only the paths are pickled to send them to the workers.
+
+    Use it as a context manager: files are deleted on exit.
+    """
+
+    def __init__(self, dir=None):
+        """:param dir: directory to create the temporary directory with the files. If None, the system default"""
+        self._tmp_dir = tempfile.TemporaryDirectory(dir=dir)
+        self.paths = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def add(self, name, array):
+        """Writes array to shared memory. :return: read only memory mapped version of the array"""
+        path = Path(self._tmp_dir.name) / f"{name}.npy"
+        np.save(path, np.asarray(array))
+        self.paths[name] = str(path)
+        return np.load(path, mmap_mode="r")
+
+    def empty(self, name, shape, dtype):
+        """:return: writable memory mapped array to fill in place, for arrays that do not fit in memory twice"""
+        path = Path(self._tmp_dir.name) / f"{name}.npy"
+        self.paths[name] = str(path)
+        return np.lib.format.open_memmap(path, mode="w+", dtype=dtype, shape=shape)
+
+    @staticmethod
+    def attach(paths):
+        """:return: dict of name: read only memory mapped array, from the paths of a SharedArrays"""
+        return {name: np.load(path, mmap_mode="r") for name, path in paths.items()}
+
+    def close(self):
+        self._tmp_dir.cleanup()
@@ -14,6 +14,10 @@
 """Utils file for graph analisis"""
 
 import networkx as nx
+import numpy as np
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+from rudders.graph.csr import CSRGraph
 
 
 def get_largest_connected_component(graph, verbose=False):
@@ -23,3 +27,49 @@ def get_largest_connected_component(graph, verbose=False):
     if verbose:
         print(f"Graph has {len(connected_components)} connected components")
     return graph.subgraph(max(connected_components, key=len))
+
+
+def read_edgelist(path):
+    """
+    Reads the first two columns of a text edge list, as written by networkx or CSRGraph.write_edgelist.
+
+    :return: src, dst: arrays with the labels of the ends of each edge
+    """
+    edges = np.loadtxt(path, dtype=str, usecols=(0, 1), comments="#", ndmin=2)
+    return edges[:, 0], edges[:, 1]
+
+
+def unique_edges(src, dst):
+    """:return: src, dst: each undirected edge once, with src < dst, and without self loops"""
+    src, dst = np.asarray(src, dtype=np.int64), np.asarray(dst, dtype=np.int64)
+    low, high = np.minimum(src, dst), np.maximum(src, dst)
+    no_loop = low != high
+    n_nodes = int(high.max(initial=-1)) + 1
+    keys = np.unique(low[no_loop] * n_nodes + high[no_loop])
+    return keys // n_nodes, keys % n_nodes
+
+
+def largest_connected_component(src, dst, verbose=False):
+    """
+    Finds the largest connected component of the undirected graph with the edges (src[i], dst[i]), working directly
+    on the columns of the edges, for instance the head and tail columns of the triplets, without building a
+    networkx graph.
+
+    :param src, dst: arrays with the ids or labels of the ends of each edge. Repeated edges and self loops are allowed.
+    :return: graph, node_ids: CSRGraph of the component, with nodes relabeled to 0, ..., n - 1, and array with the
+    original id of each node of the component
+    """
+    node_ids, inverse = np.unique(np.concatenate((src, dst)), return_inverse=True)
+    if len(node_ids) == 0:
+        raise ValueError("Graph is empty ergo does not have connected components")
+    src, dst = unique_edges(inverse[:len(src)], inverse[len(src):])
+    n_nodes = len(node_ids)
+    adjacency = coo_matrix((np.ones(len(src), dtype=np.int8), (src, dst)), shape=(n_nodes, n_nodes))
+    n_components, labels = connected_components(adjacency, directed=False)
+    if verbose:
+        print(f"Graph has {n_components} connected components")
+    keep = labels == np.argmax(np.bincount(labels))
+    new_ids = np.cumsum(keep) - 1
+    in_component = keep[src]
+    graph = CSRGraph.from_edges(new_ids[src[in_component]], new_ids[dst[in_component]], n_nodes=int(keep.sum()))
+    return graph, node_ids[keep]
@@ -0,0 +1,20 @@
+# Copyright 2017 The Rudders Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Scoring of trained models with NumPy only, without TensorFlow.
+Models are exported with export_model, and loaded with load_model as instances of the NumPy version of their class,
+that computes the same lhs, rhs, all items embeddings and scores.
+"""
+from rudders.inference.models import *
+from rudders.inference.export import export_model, load_model
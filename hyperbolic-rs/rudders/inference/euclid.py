@@ -0,0 +1,76 @@
+# Copyright 2017 The Rudders Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""NumPy version of the Euclidean operations of rudders.math.euclid"""
+
+import numpy as np
+
+
+def euclidean_sq_distance(x, y, all_pairs=False):
+    """
+    :param x: array of B1 x d
+    :param y: array of B2 x d
+    :param all_pairs: whether to compute the distances from each x to all y's. If False, must have B1 == B2.
+    :return: array of B1 x B2 if all_pairs, otherwise B1 x 1
+    """
+    x2 = np.sum(x * x, axis=-1, keepdims=True)
+    y2 = np.sum(y * y, axis=-1, keepdims=True)
+    if all_pairs:
+        return x2 + y2.T - 2 * (x @ y.T)
+    return x2 + y2 - 2 * np.sum(x * y, axis=-1, keepdims=True)
+
+
+def euclidean_sq_distance_batched_all_pairs(x, y):
+    """
+    :param x: array of B1 x d
+    :param y: array of B1 x B2 x d
+    :return: array of B1 x B2 with the distances from each x_i to all the elements of y_i
+    """
+    x2 = np.sum(x * x, axis=-1, keepdims=True)
+    y2 = np.sum(y * y, axis=-1)
+    return x2 + y2 - 2 * np.einsum('bd,bnd->bn', x, y)
+
+
+def l2_normalize(x, epsilon=1e-12):
+    """Same as tf.math.l2_normalize over the last axis"""
+    return x / np.sqrt(np.maximum(np.sum(x * x, axis=-1, keepdims=True), epsilon))
+
+
+def clip_by_norm(x, clip_norm):
+    """Same as tf.clip_by_norm over the last axis"""
+    norm = np.sqrt(np.sum(x * x, axis=-1, keepdims=True))
+    return x * clip_norm / np.maximum(norm, clip_norm)
+
+
+def givens_unit_pairs(r):
+    """
+    :param r: array of B x d of Givens parameters.
+    :return: cos, sin: arrays of B x d/2 with the normalized coordinates of each pair of parameters.
+    """
+    givens = np.reshape(r, (len(r), -1, 2))
+    givens = givens / np.sqrt(np.sum(givens * givens, axis=-1, keepdims=True))
+    return givens[:, :, 0], givens[:, :, 1]
+
+
+def apply_unit_rotation_and_reflection(rot_cos, rot_sin, ref_cos, ref_sin, x):
+    """
+    :param rot_cos, rot_sin, ref_cos, ref_sin: arrays of B x d/2, as returned by givens_unit_pairs.
+    :param x: array of B x d representing points to transform.
+    :return: x_rot, x_ref: arrays of B x d with the rotation and the reflection of x.
+    """
+    pairs = np.reshape(x, (len(x), -1, 2))
+    x0, x1 = pairs[:, :, 0], pairs[:, :, 1]
+    x_rot = np.stack((rot_cos * x0 - rot_sin * x1, rot_cos * x1 + rot_sin * x0), axis=-1)
+    # same as rudders.math.euclid.apply_reflection, where the second coordinate is computed from (-x0, x0)
+    x_ref = np.stack((ref_cos * x0 + ref_sin * x1, (ref_sin - ref_cos) * x0), axis=-1)
+    return np.reshape(x_rot, (len(x), -1)), np.reshape(x_ref, (len(x), -1))
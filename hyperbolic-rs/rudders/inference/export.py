@@ -0,0 +1,66 @@
+# Copyright 2017 The Rudders Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Export of trained models to npz files, and loading of them as NumPy inference models"""
+
+import json
+import numpy as np
+from rudders.inference import models
+
+EMBEDDING_LAYERS = ('entities', 'relations', 'bias_head', 'bias_tail', 'transforms', 'reflections', 'rotations',
+                    'attention_lhs', 'attention_rhs', 'ui_weights', 'norm_vector')
+DENSE_LAYERS = ('dense_1', 'dense_2', 'dense_3')
+META_KEY = 'meta'
+DEFAULT_ITEMS_CHUNK_SIZE = 1024
+
+
+def export_model(model, path):
+    """
+    Writes the weights of a model of rudders.models to a npz file, with one array for each layer and the
+    configuration required to score with them. It runs in the training process, with the TensorFlow model. Only
+    load_model and the models of rudders.inference are free of TensorFlow.
+
+    :param model: built model of rudders.models
+    :param path: path of the npz file
+    """
+    arrays = {}
+    for name in EMBEDDING_LAYERS:
+        layer = getattr(model, name, None)
+        if layer is not None:
+            arrays[name] = np.asarray(layer.embeddings)
+    for name in DENSE_LAYERS:
+        layer = getattr(model, name, None)
+        if layer is not None:
+            arrays[f"{name}_kernel"], arrays[f"{name}_bias"] = np.asarray(layer.kernel), np.asarray(layer.bias)
+    meta = {
+        "model": type(model).__name__,
+        "dims": int(model.dims),
+        "item_ids": np.reshape(np.asarray(model.item_ids), (-1,)).tolist(),
+        "items_chunk_size": int(getattr(model, "items_chunk_size", DEFAULT_ITEMS_CHUNK_SIZE)),
+    }
+    if hasattr(model, "get_c"):
+        meta["curvature"] = float(np.asarray(model.get_c()))
+        meta["hyperbolic_model"] = model.hyperbolic_model
+        meta["ball_embeddings"] = bool(model.ball_embeddings)
+    np.savez(path, **{META_KEY: json.dumps(meta)}, **arrays)
+
+
+def load_model(path):
+    """
+    :param path: npz file written by export_model
+    :return: instance of the class of rudders.inference.models with the name of the exported model
+    """
+    with np.load(path) as data:
+        meta = json.loads(str(data[META_KEY]))
+        weights = {name: data[name] for name in data.files if name != META_KEY}
+    return getattr(models, meta["model"])(weights, meta)
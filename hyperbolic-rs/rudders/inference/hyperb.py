@@ -0,0 +1,85 @@
+# Copyright 2017 The Rudders Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""NumPy version of the Poincare ball operations of rudders.math.hyperb"""
+
+import numpy as np
+from rudders.inference.euclid import clip_by_norm
+
+MIN_NORM = 1e-15
+MAX_TANH_ARG = 15.0
+BALL_EPS = {np.dtype(np.float32): 4e-3, np.dtype(np.float64): 1e-10}
+
+
+def artanh(x):
+    eps = BALL_EPS[x.dtype]
+    return np.arctanh(np.clip(x, -1 + eps, 1 - eps))
+
+
+def tanh(x):
+    return np.tanh(np.clip(x, -MAX_TANH_ARG, MAX_TANH_ARG))
+
+
+def project(x, c):
+    """:return: x with the norm of each row clipped to stay within the Poincare ball"""
+    return clip_by_norm(x, (1. - BALL_EPS[x.dtype]) / np.sqrt(c))
+
+
+def expmap0(u, c):
+    """:return: B x d: hyperbolic exponential map of the tangent vectors u at the origin"""
+    sqrt_c = np.sqrt(c)
+    u_norm = np.maximum(np.linalg.norm(u, axis=-1, keepdims=True), MIN_NORM)
+    return project(tanh(sqrt_c * u_norm) * u / (sqrt_c * u_norm), c)
+
+
+def mobius_add(x, y, c):
+    """:return: B x d: element-wise Mobius addition of x and y"""
+    cx2 = c * np.sum(x * x, axis=-1, keepdims=True)
+    cy2 = c * np.sum(y * y, axis=-1, keepdims=True)
+    cxy = c * np.sum(x * y, axis=-1, keepdims=True)
+    num = (1 + 2 * cxy + cy2) * x + (1 - cx2) * y
+    denom = 1 + 2 * cxy + cx2 * cy2
+    return project(num / np.maximum(denom, MIN_NORM), c)
+
+
+def hyp_distance_from_products(x2, y2, xy, c):
+    """:return: hyperbolic distance given the squared norms and the dot products of the points"""
+    sqrt_c = np.sqrt(c)
+    c1 = 1 - 2 * c * xy + c * y2
+    c2 = 1 - c * x2
+    num = np.sqrt(np.maximum(np.square(c1) * x2 + np.square(c2) * y2 - (2 * c1 * c2) * xy, 0))
+    denom = 1 - 2 * c * xy + np.square(c) * x2 * y2
+    pairwise_norm = num / np.maximum(denom, MIN_NORM)
+    return 2 * artanh(sqrt_c * pairwise_norm) / sqrt_c
+
+
+def hyp_distance(x, y, c):
+    """:return: (..., 1): hyperbolic distance between x and y, broadcasted"""
+    x2 = np.sum(x * x, axis=-1, keepdims=True)
+    y2 = np.sum(y * y, axis=-1, keepdims=True)
+    xy = np.sum(x * y, axis=-1, keepdims=True)
+    return hyp_distance_from_products(x2, y2, xy, c)
+
+
+def hyp_distance_all_pairs(x, y, c):
+    """:return: b1 x b2: hyperbolic distance between all pairs of x (b1 x d) and y (b2 x d)"""
+    x2 = np.sum(x * x, axis=-1, keepdims=True)
+    y2 = np.sum(y * y, axis=-1, keepdims=True).T
+    return hyp_distance_from_products(x2, y2, x @ y.T, c)
+
+
+def hyp_distance_batch_rhs(x, y, c):
+    """:return: b1 x b2: hyperbolic distance between each x_i (b1 x d) and its points y_i (b1 x b2 x d)"""
+    x2 = np.sum(x * x, axis=-1, keepdims=True)
+    y2 = np.sum(y * y, axis=-1)
+    return hyp_distance_from_products(x2, y2, np.einsum('bd,bnd->bn', x, y), c)
@@ -0,0 +1,71 @@
+# Copyright 2017 The Rudders Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""NumPy version of the Lorentz model operations of rudders.math.lorentz"""
+
+import numpy as np
+
+MIN_NORM = 1e-15
+MAX_COSH_ARG = 50.0
+ACOSH_EPS = {np.dtype(np.float32): 1e-6, np.dtype(np.float64): 1e-15}
+
+
+def arcosh(x):
+    return np.arccosh(np.maximum(x, 1 + ACOSH_EPS[x.dtype]))
+
+
+def _from_space(space, c):
+    """:return: points of the hyperboloid with the given last d coordinates"""
+    time = np.sqrt(1. / c + np.sum(space * space, axis=-1, keepdims=True))
+    return np.concatenate([time.astype(space.dtype), space], axis=-1)
+
+
+def project(x, c):
+    """:return: x with its first coordinate recomputed from the rest of them"""
+    return _from_space(x[..., 1:], c)
+
+
+def expmap0(u, c):
+    """:return: B x (d + 1): hyperbolic exponential map of the tangent vectors u at the origin"""
+    sqrt_c = np.sqrt(c)
+    u_norm = np.maximum(np.linalg.norm(u, axis=-1, keepdims=True), MIN_NORM)
+    theta = np.minimum(2 * sqrt_c * u_norm, MAX_COSH_ARG)
+    return _from_space(np.sinh(theta) * u / (sqrt_c * u_norm), c)
+
+
+def mobius_add(x, y, c):
+    """:return: B x (d + 1): translation of y by x, equivalent to the Mobius addition of the Poincare ball"""
+    sqrt_c = np.sqrt(c)
+    x_time, x_space = x[..., :1], x[..., 1:]
+    y_time, y_space = y[..., :1], y[..., 1:]
+    xy_space = np.sum(x_space * y_space, axis=-1, keepdims=True)
+    space = sqrt_c * y_time * x_space + y_space + c * xy_space / (1 + sqrt_c * x_time) * x_space
+    return _from_space(space, c)
+
+
+def hyp_distance(x, y, c):
+    """:return: (..., 1): hyperbolic distance between x and y, broadcasted"""
+    xy = np.sum(x[..., 1:] * y[..., 1:], axis=-1, keepdims=True) - x[..., :1] * y[..., :1]
+    return arcosh(-c * xy) / np.sqrt(c)
+
+
+def hyp_distance_all_pairs(x, y, c):
+    """:return: b1 x b2: hyperbolic distance between all pairs of x and y, with one matrix multiplication"""
+    x_signed = np.concatenate([-x[:, :1], x[:, 1:]], axis=-1)
+    return arcosh(-c * (x_signed @ y.T)) / np.sqrt(c)
+
+
+def hyp_distance_batch_rhs(x, y, c):
+    """:return: b1 x b2: hyperbolic distance between each x_i (b1 x (d + 1)) and its points y_i"""
+    x_signed = np.concatenate([-x[:, :1], x[:, 1:]], axis=-1)
+    return arcosh(-c * np.einsum('bd,bnd->bn', x_signed, y)) / np.sqrt(c)
@@ -0,0 +1,477 @@
+# Copyright 2017 The Rudders Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""NumPy versions of the models of rudders.models, with the same names, for inference only"""
+
+import abc
+import numpy as np
+from rudders.relations import Relations
+from rudders.inference import hyperb, lorentz
+from rudders.inference.euclid import euclidean_sq_distance, euclidean_sq_distance_batched_all_pairs, l2_normalize, \
+    clip_by_norm, givens_unit_pairs, apply_unit_rotation_and_reflection
+
+HYPERBOLIC_MODELS = {'poincare': hyperb, 'lorentz': lorentz}
+
+
+def sigmoid(x):
+    return 1. / (1. + np.exp(-x))
+
+
+def softmax(x):
+    x = np.exp(x - np.max(x, axis=-1, keepdims=True))
+    return x / np.sum(x, axis=-1, keepdims=True)
+
+
+class CFModel(abc.ABC):
+    """
+    NumPy version of rudders.models.CFModel, that scores triplets with the weights exported from a trained model.
+    Layers are replaced by the arrays of their weights, with the same attribute names. There is no dropout, and the
+    values that only depend on the weights, as the ones cached by frozen TF models, are computed once.
+    """
+
+    def __init__(self, weights, meta):
+        """
+        :param weights: dict of layer name: array of weights, as written by export_model
+        :param meta: dict with the configuration of the model, as written by export_model
+        """
+        self.dims = meta["dims"]
+        self.item_ids = np.asarray(meta["item_ids"], dtype=np.int64)
+        self.items_chunk_size = meta["items_chunk_size"]
+        self.entities = weights["entities"]
+        self.relations = weights.get("relations")
+        self.bias_head = weights["bias_head"]
+        self.bias_tail = weights["bias_tail"]
+
+    @abc.abstractmethod
+    def get_lhs(self, input_array):
+        """
+        :param input_array: array of batch_size x 3 containing (h, r, t) indices.
+        :return: array of batch_size x embedding_dimension representing left hand side embeddings.
+        """
+        pass
+
+    @abc.abstractmethod
+    def get_rhs(self, input_array):
+        """
+        :param input_array: array of batch_size x 3 containing (h, r, t) indices.
+        :return: array of batch_size x embedding_dimension representing right hand side embeddings.
+        """
+        pass
+
+    def get_candidates(self, relation, candidate_ids):
+        """:return: C x embedding_dimension: rhs embeddings of the candidate tails under a single relation"""
+        candidate_ids = np.asarray(candidate_ids, dtype=np.int64)
+        return self.get_rhs(np.stack((candidate_ids, np.full_like(candidate_ids, relation), candidate_ids), axis=1))
+
+    def get_all_items(self, input_array):
+        """:return: n_items x embedding_dimension: rhs embeddings of all the items"""
+        return self.get_candidates(Relations.USER_ITEM.value, self.item_ids)
+
+    @abc.abstractmethod
+    def similarity_score(self, lhs, rhs, all_items):
+        """
+        :param lhs: array of B1 x embedding_dimension
+        :param rhs: array of B2 x embedding_dimension
+        :param all_items: whether to compute all pairs of scores. If False, B1 must be equal to B2.
+        :return: array of B1 x 1 if all_items is False, otherwise B1 x B2.
+        """
+        pass
+
+    def __call__(self, input_array, all_items=False):
+        """
+        :param input_array: array of batch_size x 3 containing triples' indices: (head, relation, tail)
+        :param all_items: whether to compute scores against all items, or only individual triples' scores.
+        :return: array of batch_size x 1 with the triple scores, or batch_size x n_items if all_items
+        """
+        input_array = np.asarray(input_array, dtype=np.int64)
+        lhs = self.get_lhs(input_array)
+        lhs_biases = self.bias_head[input_array[:, 0]]
+        if all_items:
+            return self.score_all_items(input_array, lhs, lhs_biases)
+        rhs = self.get_rhs(input_array)
+        rhs_biases = self.bias_tail[input_array[:, -1]]
+        return self.score(lhs, lhs_biases, rhs, rhs_biases, all_items)
+
+    def score_all_items(self, input_array, lhs, lhs_biases):
+        """:return: batch_size x n_items: scores of each triple against all items"""
+        rhs = self.get_all_items(input_array)
+        return self.score(lhs, lhs_biases, rhs, self.bias_tail[self.item_ids], all_items=True)
+
+    def score_candidates(self, input_array, lhs, lhs_biases, relation, candidate_ids):
+        """:return: batch_size x C: scores of each triple against candidate tails under a single relation"""
+        rhs = self.get_candidates(relation, candidate_ids)
+        return self.score(lhs, lhs_biases, rhs, self.bias_tail[candidate_ids], all_items=True)
+
+    def score_relations(self, heads, relations, candidates=None, chunk_size=4096):
+        """
+        :param heads: list or array of H head ids
+        :param relations: list of R relation indexes
+        :param candidates: list or array of C candidate tail ids. If None, all items.
+        :param chunk_size: amount of candidates scored at once
+        :return: scores: array of H x R x C
+        """
+        heads = np.asarray(heads, dtype=np.int64)
+        candidates = np.reshape(np.array(self.item_ids if candidates is None else candidates, dtype=np.int64), (-1,))
+        scores = []
+        for relation in relations:
+            input_array = np.stack((heads, np.full_like(heads, relation), heads), axis=1)
+            lhs = self.get_lhs(input_array)
+            lhs_biases = self.bias_head[heads]
+            scores.append(np.concatenate([self.score_candidates(input_array, lhs, lhs_biases, relation,
+                                                                candidates[ini:ini + chunk_size])
+                                          for ini in range(0, len(candidates), chunk_size)], axis=1))
+        return np.stack(scores, axis=1)
+
+    def score(self, lhs, lhs_biases, rhs, rhs_biases, all_items):
+        """:return: scores: B1 x 1 if all_items is False, else B1 x B2"""
+        score = self.similarity_score(lhs, rhs, all_items)
+        if all_items:
+            return score + lhs_biases + rhs_biases.T
+        return score + lhs_biases + rhs_biases
+
+
+class MuRBase(CFModel, abc.ABC):
+
+    def __init__(self, weights, meta):
+        super().__init__(weights, meta)
+        self.transforms = weights["transforms"]
+
+
+class RotRefBase(CFModel, abc.ABC):
+
+    def __init__(self, weights, meta):
+        super().__init__(weights, meta)
+        self.attention_lhs = weights["attention_lhs"]
+        self.scale = 1. / self.dims ** 0.5
+        # rot_cos, rot_sin, ref_cos, ref_sin: n_relations x dims/2
+        self.relation_givens = givens_unit_pairs(weights["rotations"]) + givens_unit_pairs(weights["reflections"])
+
+    def rotate_and_reflect_entities(self, entity, relation_index):
+        """:return: rotated_entity_embeddings, reflected_entity_embeddings: bs x dims"""
+        givens = [params[relation_index] for params in self.relation_givens]
+        return apply_unit_rotation_and_reflection(*givens, entity)
+
+    def attn_mechanism(self, queries, attn_vecs):
+        """
+        :param queries: b x n x dims: n queries to combine with attention
+        :param attn_vecs: b x dims
+        :return: b x dims: weighted average of the queries
+        """
+        att_weights = softmax(np.einsum('bd,bnd->bn', attn_vecs, queries) * self.scale)
+        return np.einsum('bn,bnd->bd', att_weights, queries)
+
+    def get_heads(self, input_array):
+        heads = self.entities[input_array[:, 0]]
+        rot_q, ref_q = self.rotate_and_reflect_entities(heads, input_array[:, 1])
+        return self.attn_mechanism(np.stack([ref_q, rot_q], axis=1), self.attention_lhs[input_array[:, 1]])
+
+
+class UserAttentiveBase(RotRefBase, MuRBase, abc.ABC):
+
+    def __init__(self, weights, meta):
+        super().__init__(weights, meta)
+        self.attention_rhs = weights["attention_rhs"]
+        self.ui_weights = weights["ui_weights"]
+
+    def get_lhs(self, input_array):
+        heads = self.entities[input_array[:, 0]]
+        transforms = self.transforms[input_array[:, 1]]
+        rot_q, ref_q = self.rotate_and_reflect_entities(heads, input_array[:, 1])
+        queries = np.stack([ref_q, rot_q, transforms * heads], axis=1)
+        return self.attn_mechanism(queries, self.attention_lhs[input_array[:, 1]])
+
+    def get_rhs_attn_vector(self, input_array):
+        return self.attention_rhs[input_array[:, 0]]
+
+    def get_rhs(self, input_array):
+        """
+        The tail plus the relation. For the USER-ITEM relation, it is combined with the tail plus each of the
+        relations, aggregated with the user-specific attention
+        """
+        tails = self.entities[input_array[:, -1]]
+        rel_index = input_array[:, 1]
+        res = tails + self.relations[rel_index]
+        is_user_item = rel_index == Relations.USER_ITEM.value
+        if np.any(is_user_item):
+            candidates = tails[is_user_item, None, :] + self.relations[None, :, :]  # b x r x dims
+            combined = self.attn_mechanism(candidates, self.get_rhs_attn_vector(input_array)[is_user_item])
+            ui_weights = sigmoid(self.ui_weights[input_array[is_user_item, 0]])
+            res[is_user_item] = ui_weights * res[is_user_item] + (1 - ui_weights) * combined
+        return res
+
+    def get_user_item_offsets(self, input_array):
+        """:return: b x dims: offset to add to each item embedding to get its rhs with the USER-ITEM relation"""
+        ui_weights = sigmoid(self.ui_weights[input_array[:, 0]])
+        att_weights = softmax(self.get_rhs_attn_vector(input_array) @ self.relations.T * self.scale)
+        combined_relations = att_weights @ self.relations
+        return ui_weights * self.relations[Relations.USER_ITEM.value] + (1 - ui_weights) * combined_relations
+
+    def get_all_items(self, input_array, item_ids=None):
+        """:return: b x n_items x dims: embeddings of the items according to each head (user)"""
+        items = self.entities[self.item_ids if item_ids is None else item_ids]
+        return items[None, :, :] + self.get_user_item_offsets(input_array)[:, None, :]
+
+    def score_candidates(self, input_array, lhs, lhs_biases, relation, candidate_ids):
+        if relation == Relations.USER_ITEM.value:
+            rhs = self.get_all_items(input_array, candidate_ids)
+        else:
+            rhs = self.get_candidates(relation, candidate_ids)
+            rhs = np.broadcast_to(rhs[None], (len(lhs),) + rhs.shape)
+        return self.score(lhs, lhs_biases, rhs, self.bias_tail[candidate_ids], all_items=True)
+
+    def score_all_items(self, input_array, lhs, lhs_biases):
+        """Computes the scores against chunks of items_chunk_size items, to bound the size of the rhs embeddings"""
+        return np.concatenate([self.score_candidates(input_array, lhs, lhs_biases, Relations.USER_ITEM.value,
+                                                     self.item_ids[ini:ini + self.items_chunk_size])
+                               for ini in range(0, len(self.item_ids), self.items_chunk_size)], axis=1)
+
+
+# Euclidean models
+
+class CFEuclideanBase(CFModel, abc.ABC):
+
+    def get_rhs(self, input_array):
+        return self.entities[input_array[:, -1]]
+
+    def similarity_score(self, lhs, rhs, all_items):
+        return -euclidean_sq_distance(lhs, rhs, all_items)
+
+
+class MLP(CFModel):
+
+    def __init__(self, weights, meta):
+        super().__init__(weights, meta)
+        self.kernels = [weights[f"dense_{i}_kernel"] for i in (1, 2, 3)]
+        self.biases = [weights[f"dense_{i}_bias"] for i in (1, 2, 3)]
+        # the item projections of the first layer do not depend on the users
+        self.item_projections = self.entities[self.item_ids] @ self.rhs_kernel()
+
+    def get_lhs(self, input_array):
+        return self.entities[input_array[:, 0]]
+
+    def get_rhs(self, input_array):
+        return self.entities[input_array[:, -1]]
+
+    def similarity_score(self, lhs, rhs, all_items):
+        if all_items:
+            return self.score_projections(lhs @ self.lhs_kernel() + self.biases[0], rhs @ self.rhs_kernel())
+        return self.dense_layers(np.maximum(np.concatenate((lhs, rhs), axis=-1) @ self.kernels[0] + self.biases[0], 0))
+
+    def score_all_items(self, input_array, lhs, lhs_biases):
+        scores = self.score_projections(lhs @ self.lhs_kernel() + self.biases[0], self.item_projections)
+        return scores + lhs_biases + self.bias_tail[self.item_ids].T
+
+    def lhs_kernel(self):
+        return self.kernels[0][:self.dims]
+
+    def rhs_kernel(self):
+        return self.kernels[0][self.dims:]
+
+    def dense_layers(self, embeds):
+        """:return: ... x 1: output of the layers after the first one"""
+        embeds = np.maximum(embeds @ self.kernels[1] + self.biases[1], 0)
+        return embeds @ self.kernels[2] + self.biases[2]
+
+    def score_projections(self, lhs_projections, rhs_projections):
+        """:return: b x n_items: scores of all pairs of projections, in chunks of items_chunk_size rhs at a time"""
+        scores = []
+        for ini in range(0, len(rhs_projections), self.items_chunk_size):
+            embeds = lhs_projections[:, None, :] + rhs_projections[None, ini:ini + self.items_chunk_size, :]
+            scores.append(self.dense_layers(np.maximum(embeds, 0))[..., 0])
+        return np.concatenate(scores, axis=1)
+
+
+class DistMul(CFEuclideanBase):
+
+    def get_lhs(self, input_array):
+        return self.entities[input_array[:, 0]] * self.relations[input_array[:, 1]]
+
+    def similarity_score(self, lhs, rhs, all_items):
+        if all_items:
+            return lhs @ rhs.T
+        return np.sum(lhs * rhs, axis=-1, keepdims=True)
+
+
+class BPR(DistMul):
+
+    def get_lhs(self, input_array):
+        return self.entities[input_array[:, 0]]
+
+
+class TransE(CFEuclideanBase):
+
+    def get_lhs(self, input_array):
+        return l2_normalize(self.entities[input_array[:, 0]]) + self.relations[input_array[:, 1]]
+
+    def get_rhs(self, input_array):
+        return l2_normalize(self.entities[input_array[:, -1]])
+
+
+class TransH(CFEuclideanBase):
+
+    def __init__(self, weights, meta):
+        super().__init__(weights, meta)
+        self.norm_vectors = l2_normalize(weights["norm_vector"])
+
+    def get_lhs(self, input_array):
+        heads = clip_by_norm(self.entities[input_array[:, 0]], 1)
+        return self.project(heads, self.norm_vectors[input_array[:, 1]]) + self.relations[input_array[:, 1]]
+
+    def get_rhs(self, input_array):
+        tails = clip_by_norm(self.entities[input_array[:, -1]], 1)
+        return self.project(tails, self.norm_vectors[input_array[:, 1]])
+
+    @staticmethod
+    def project(entities, norm_vectors):
+        return entities - np.sum(entities * norm_vectors, axis=-1, keepdims=True) * norm_vectors
+
+
+class MuREuclidean(MuRBase, CFEuclideanBase):
+
+    def get_lhs(self, input_array):
+        return self.transforms[input_array[:, 1]] * self.entities[input_array[:, 0]]
+
+    def get_rhs(self, input_array):
+        return self.entities[input_array[:, -1]] + self.relations[input_array[:, 1]]
+
+
+class RotRefEuclidean(RotRefBase, CFEuclideanBase):
+
+    def get_lhs(self, input_array):
+        return self.get_heads(input_array) + self.relations[input_array[:, 1]]
+
+
+class UserAttentiveEuclidean(UserAttentiveBase):
+
+    def similarity_score(self, lhs, rhs, all_items):
+        """rhs is B1 x B2 x dims if all_items"""
+        if all_items:
+            return -euclidean_sq_distance_batched_all_pairs(lhs, rhs)
+        return -euclidean_sq_distance(lhs, rhs)
+
+
+# Hyperbolic models
+
+class CFHyperbolicBase(CFModel, abc.ABC):
+    """Points and operations are the ones of the model of hyperbolic space in 'manifold', as in the TF models"""
+
+    def __init__(self, weights, meta):
+        super().__init__(weights, meta)
+        self.c = np.asarray(meta["curvature"], dtype=self.entities.dtype)
+        self.manifold = HYPERBOLIC_MODELS[meta["hyperbolic_model"]]
+        self.ball_embeddings = meta["ball_embeddings"]
+        self.hyperbolic_relations = None
+        if self.relations is not None:
+            self.hyperbolic_relations = self.manifold.expmap0(self.relations, self.c)
+        self._ball_entities = None
+
+    def get_rhs(self, input_array):
+        return self.ball_entities(input_array[:, -1])
+
+    def ball_entities(self, entity_ids):
+        """:return: bs x dims: entity embeddings mapped to hyperbolic space. The table is mapped once, when needed"""
+        if self.ball_embeddings:
+            return self.entities[entity_ids]
+        if self._ball_entities is None:
+            self._ball_entities = self.manifold.expmap0(self.entities, self.c)
+        return self._ball_entities[entity_ids]
+
+    def similarity_score(self, lhs, rhs, all_items):
+        if all_items:
+            return -self.manifold.hyp_distance_all_pairs(lhs, rhs, self.c) ** 2
+        return -self.manifold.hyp_distance(lhs, rhs, self.c) ** 2
+
+
+class HyperML(CFHyperbolicBase):
+
+    def get_lhs(self, input_array):
+        return self.ball_entities(input_array[:, 0])
+
+
+class MuRHyperbolic(MuRBase, CFHyperbolicBase):
+
+    def get_lhs(self, input_array):
+        heads = self.entities[input_array[:, 0]]
+        return self.manifold.expmap0(self.transforms[input_array[:, 1]] * heads, self.c)
+
+    def get_rhs(self, input_array):
+        tails = self.ball_entities(input_array[:, -1])
+        return self.manifold.mobius_add(tails, self.hyperbolic_relations[input_array[:, 1]], self.c)
+
+
+class RotRefHyperbolic(RotRefBase, CFHyperbolicBase):
+
+    def get_lhs(self, input_array):
+        head_embeds = self.manifold.expmap0(self.get_heads(input_array), self.c)
+        return self.manifold.mobius_add(head_embeds, self.hyperbolic_relations[input_array[:, 1]], self.c)
+
+
+class UserAttentiveHyperbolic(UserAttentiveBase, CFHyperbolicBase):
+
+    def similarity_score(self, lhs, rhs, all_items):
+        """rhs is B1 x B2 x dims if all_items"""
+        if all_items:
+            return -self.manifold.hyp_distance_batch_rhs(lhs, rhs, self.c) ** 2
+        return -self.manifold.hyp_distance(lhs, rhs, self.c) ** 2
+
+    def get_lhs(self, input_array):
+        return self.manifold.expmap0(super().get_lhs(input_array), self.c)
+
+    def get_rhs(self, input_array):
+        return self.manifold.expmap0(super().get_rhs(input_array), self.c)
+
+    def get_all_items(self, input_array, item_ids=None):
+        all_items = super().get_all_items(input_array, item_ids)
+        return self.manifold.expmap0(all_items, self.c)
+
+
+# Complex models
+
+class BaseComplex(CFModel, abc.ABC):
+
+    def __init__(self, weights, meta):
+        super().__init__(weights, meta)
+        self.half_dim = self.dims // 2
+
+    def get_rhs(self, input_array):
+        return self.entities[input_array[:, -1]]
+
+    def similarity_score(self, lhs, rhs, all_items):
+        """Same as the dot product of the concatenated real and imaginary parts"""
+        if all_items:
+            return lhs @ rhs.T
+        return np.sum(lhs * rhs, axis=-1, keepdims=True)
+
+
+class ComplexProd(BaseComplex):
+
+    def get_lhs(self, input_array):
+        lhs = self.entities[input_array[:, 0]]
+        rel = self.relations[input_array[:, 1]]
+        lhs = lhs[:, :self.half_dim], lhs[:, self.half_dim:]
+        rel = rel[:, :self.half_dim], rel[:, self.half_dim:]
+        return np.concatenate([lhs[0] * rel[0] - lhs[1] * rel[1], lhs[0] * rel[1] + lhs[1] * rel[0]], axis=1)
+
+
+class RotatE(BaseComplex):
+
+    def get_lhs(self, input_array):
+        head = self.entities[input_array[:, 0]]
+        relation = self.relations[input_array[:, 1]]
+        head = head[:, :self.half_dim], head[:, self.half_dim:]
+        relation = relation[:, :self.half_dim], relation[:, self.half_dim:]
+        rel_norm = np.sqrt(relation[0] ** 2 + relation[1] ** 2)
+        safe_norm = np.where(rel_norm == 0, 1, rel_norm)
+        cos = np.where(rel_norm == 0, 0, relation[0] / safe_norm)
+        sin = np.where(rel_norm == 0, 0, relation[1] / safe_norm)
+        return np.concatenate([head[0] * cos - head[1] * sin, head[0] * sin + head[1] * cos], axis=1)
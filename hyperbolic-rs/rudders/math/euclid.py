@@ -91,3 +91,45 @@ def apply_rotation(r, x):
     x_rot = givens[:, :, 0:1] * x + givens[:, :, 1:] * tf.concat((-x[:, :, 1:], x[:, :, 0:1]), axis=-1)
     return tf.reshape(x_rot, (batch_size, -1))
 
+
+def givens_unit_pairs(r):
+    """
+    :param r: Tensor of size B x d of Givens parameters.
+    :return: cos, sin: Tensors of size B x d/2 with the normalized coordinates of each pair of parameters.
+    """
+    batch_size = tf.shape(r)[0]
+    givens = tf.reshape(r, (batch_size, -1, 2))
+    givens = givens * tf.math.rsqrt(tf.reduce_sum(givens * givens, axis=-1, keepdims=True))
+    return tf.unstack(givens, axis=-1)
+
+
+def apply_rotation_and_reflection(rot, ref, x):
+    """
+    Applies 2x2 rotations and reflections to the same points.
+    It is equivalent to apply_rotation(rot, x) and apply_reflection(ref, x), but the pairs of coordinates of x are
+    split only once, and both results are computed with elementwise operations over them, without slicing and
+    concatenating the pairs for each transformation.
+
+    :param rot: Tensor of size B x d representing rotation parameters per example.
+    :param ref: Tensor of size B x d representing reflection parameters per example.
+    :param x: Tensor of size B x d representing points to transform.
+    :return: x_rot, x_ref: Tensors of size B x d with the rotation and the reflection of x.
+    """
+    return apply_unit_rotation_and_reflection(*givens_unit_pairs(rot), *givens_unit_pairs(ref), x)
+
+
+def apply_unit_rotation_and_reflection(rot_cos, rot_sin, ref_cos, ref_sin, x):
+    """
+    Same as apply_rotation_and_reflection, with Givens parameters that are already normalized, for instance
+    precomputed for each relation.
+
+    :param rot_cos, rot_sin, ref_cos, ref_sin: Tensors of size B x d/2, as returned by givens_unit_pairs.
+    :param x: Tensor of size B x d representing points to transform.
+    :return: x_rot, x_ref: Tensors of size B x d with the rotation and the reflection of x.
+    """
+    batch_size = tf.shape(x)[0]
+    x0, x1 = tf.unstack(tf.reshape(x, (batch_size, -1, 2)), axis=-1)
+    x_rot = tf.stack((rot_cos * x0 - rot_sin * x1, rot_cos * x1 + rot_sin * x0), axis=-1)
+    # same as apply_reflection, where the second coordinate is computed from (-x0, x0)
+    x_ref = tf.stack((ref_cos * x0 + ref_sin * x1, (ref_sin - ref_cos) * x0), axis=-1)
+    return tf.reshape(x_rot, (batch_size, -1)), tf.reshape(x_ref, (batch_size, -1))
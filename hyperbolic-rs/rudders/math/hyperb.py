@@ -99,6 +99,88 @@ def mobius_add(x, y, c):
     return project(num / tf.maximum(denom, MIN_NORM), c)
 
 
+def lambda_x(x, c):
+    """Conformal factor of the Poincare ball at x.
+
+    Args:
+      x: Tensor of size B x dimension representing hyperbolic points.
+      c: Tensor of size 1 representing the absolute hyperbolic curvature.
+
+    Returns:
+      Tensor of shape B x 1 with 2 / (1 - c|x|^2).
+    """
+    cx2 = c * tf.reduce_sum(x * x, axis=-1, keepdims=True)
+    return 2. / tf.maximum(1. - cx2, MIN_NORM)
+
+
+def egrad2rgrad(x, grad, c):
+    """Converts the Euclidean gradient at x to the Riemannian gradient of the Poincare ball.
+
+    Args:
+      x: Tensor of size B x dimension representing hyperbolic points.
+      grad: Tensor of size B x dimension with the Euclidean gradient at x.
+      c: Tensor of size 1 representing the absolute hyperbolic curvature.
+
+    Returns:
+      Tensor of shape B x dimension with grad / lambda_x^2.
+    """
+    return grad / tf.square(lambda_x(x, c))
+
+
+def expmap(x, u, c):
+    """Hyperbolic exponential map at x in the Poincare ball model.
+
+    Args:
+      x: Tensor of size B x dimension representing hyperbolic points.
+      u: Tensor of size B x dimension representing tangent vectors at x.
+      c: Tensor of size 1 representing the absolute hyperbolic curvature.
+
+    Returns:
+      Tensor of shape B x dimension with the points reached from x along u, projected to the ball.
+    """
+    sqrt_c = tf.sqrt(c)
+    u_norm = tf.maximum(tf.norm(u, axis=-1, keepdims=True), MIN_NORM)
+    second_term = tanh(sqrt_c * lambda_x(x, c) * u_norm / 2) * u / (sqrt_c * u_norm)
+    return mobius_add(x, second_term, c)
+
+
+def gyration(u, v, w, c):
+    """Gyration gyr[u, v]w of the Mobius addition.
+
+    Args:
+      u, v: Tensors of size B x dimension representing hyperbolic points.
+      w: Tensor of size B x dimension.
+      c: Tensor of size 1 representing the absolute hyperbolic curvature.
+
+    Returns:
+      Tensor of shape B x dimension.
+    """
+    u2 = tf.reduce_sum(u * u, axis=-1, keepdims=True)
+    v2 = tf.reduce_sum(v * v, axis=-1, keepdims=True)
+    uv = tf.reduce_sum(u * v, axis=-1, keepdims=True)
+    uw = tf.reduce_sum(u * w, axis=-1, keepdims=True)
+    vw = tf.reduce_sum(v * w, axis=-1, keepdims=True)
+    c2 = c * c
+    a = -c2 * uw * v2 + c * vw + 2 * c2 * uv * vw
+    b = -c2 * vw * u2 - c * uw
+    d = 1 + 2 * c * uv + c2 * u2 * v2
+    return w + 2 * (a * u + b * v) / tf.maximum(d, MIN_NORM)
+
+
+def parallel_transport(x, y, v, c):
+    """Parallel transport of tangent vectors at x to tangent vectors at y, along the geodesic.
+
+    Args:
+      x, y: Tensors of size B x dimension representing hyperbolic points.
+      v: Tensor of size B x dimension representing tangent vectors at x.
+      c: Tensor of size 1 representing the absolute hyperbolic curvature.
+
+    Returns:
+      Tensor of shape B x dimension representing tangent vectors at y.
+    """
+    return gyration(y, -x, v, c) * lambda_x(x, c) / lambda_x(y, c)
+
+
 def hyp_distance(x, y, c):
     """Hyperbolic distance on the Poincare ball.
 
@@ -115,13 +197,31 @@ def hyp_distance(x, y, c):
     Returns:
       Tensor of size (c1, c2, ..., cn, 1) where ck=max(bk,ak)
     """
-    sqrt_c = tf.sqrt(c)
     x2 = tf.reduce_sum(x * x, axis=-1, keepdims=True)
     y2 = tf.reduce_sum(y * y, axis=-1, keepdims=True)
     xy = tf.reduce_sum(x * y, axis=-1, keepdims=True)
+    return hyp_distance_from_products(x2, y2, xy, c)
+
+
+def hyp_distance_from_products(x2, y2, xy, c):
+    """Hyperbolic distance on the Poincare ball, given the squared norms and the dot products of the points.
+
+    The distance only depends on these three values, so it can be evaluated on
+    matrices of dot products computed with matrix multiplications.
+
+    Args:
+      x2: Tensor with the squared norms of x.
+      y2: Tensor with the squared norms of y, broadcastable with x2.
+      xy: Tensor with the dot products between x and y, broadcastable with x2 and y2.
+      c: Tensor of size 1 representing the absolute hyperbolic curvature.
+
+    Returns:
+      Tensor with the distances, of the broadcast shape of x2, y2 and xy.
+    """
+    sqrt_c = tf.sqrt(c)
     c1 = 1 - 2 * c * xy + c * y2
     c2 = 1 - c * x2
-    num = tf.sqrt(tf.maximum(tf.square(c1) * x2 + tf.square(c2) * y2 - (2 * c1 * c2) * xy, tf.zeros_like(x2)))
+    num = tf.sqrt(tf.maximum(tf.square(c1) * x2 + tf.square(c2) * y2 - (2 * c1 * c2) * xy, tf.zeros_like(c1)))
     denom = 1 - 2 * c * xy + tf.square(c) * x2 * y2
     pairwise_norm = num / tf.maximum(denom, MIN_NORM)
     dist = artanh(sqrt_c * pairwise_norm)
@@ -131,6 +231,9 @@ def hyp_distance(x, y, c):
 def hyp_distance_all_pairs(x, y, c):
     """Hyperbolic distance between all pairs among x and y.
 
+    The dot products are computed with one matrix multiplication, so no
+    b1 x b2 x d tensor is built.
+
     Args:
       x: Tensor of shape (b1, d).
       y: Tensor of shape (b2, d).
@@ -139,9 +242,10 @@ def hyp_distance_all_pairs(x, y, c):
     Returns:
       Tensor of size (b1, b2).
     """
-    x = tf.expand_dims(x, 1)
-    y = tf.expand_dims(y, 0)
-    return tf.squeeze(hyp_distance(x, y, c), axis=[-1])
+    x2 = tf.reduce_sum(x * x, axis=-1, keepdims=True)  # b1 x 1
+    y2 = tf.transpose(tf.reduce_sum(y * y, axis=-1, keepdims=True))  # 1 x b2
+    xy = tf.linalg.matmul(x, y, transpose_b=True)  # b1 x b2
+    return hyp_distance_from_products(x2, y2, xy, c)
 
 
 def hyp_distance_batch_rhs(x, y, c):
@@ -158,5 +262,7 @@ def hyp_distance_batch_rhs(x, y, c):
     Returns:
       Tensor of size (b1, b2).
     """
-    x = tf.expand_dims(x, 1)
-    return tf.squeeze(hyp_distance(x, y, c), axis=[-1])
+    x2 = tf.reduce_sum(x * x, axis=-1, keepdims=True)  # b1 x 1
+    y2 = tf.reduce_sum(y * y, axis=-1)  # b1 x b2
+    xy = tf.einsum('bd,bnd->bn', x, y)  # b1 x b2
+    return hyp_distance_from_products(x2, y2, xy, c)
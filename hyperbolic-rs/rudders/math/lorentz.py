@@ -0,0 +1,197 @@
+# Copyright 2017 The Rudders Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Hyperbolic math in the Lorentz (hyperboloid) model.
+
+Points of the d-dimensional hyperbolic space of curvature -c are vectors x of dimension d + 1 with
+<x, x>_L = -1/c and x_0 > 0, where <x, y>_L = -x_0 y_0 + x_1 y_1 + ... + x_d y_d is the Minkowski inner product.
+The functions mirror the ones of rudders.math.hyperb, so models can use either module: expmap0 and logmap0 identify
+the tangent space at the origin as hyperb does, and mobius_add is the Lorentz boost equivalent to the Mobius
+addition. Points never need to be clipped to stay in the space, since the first coordinate is always computed from
+the rest of them.
+"""
+
+import tensorflow as tf
+
+MIN_NORM = 1e-15
+MAX_COSH_ARG = 50.0
+ACOSH_EPS = {tf.float32: 1e-6, tf.float64: 1e-15}
+
+
+def arcosh(x):
+    eps = ACOSH_EPS[x.dtype]
+    return tf.acosh(tf.maximum(x, 1 + eps))
+
+
+def minkowski_dot(x, y):
+    """Minkowski inner product.
+
+    Args:
+      x: Tensor of shape (b1, b2, ..., bn, d + 1).
+      y: Tensor of shape (a1, a2, ..., an, d + 1), broadcastable with x.
+
+    Returns:
+      Tensor of size (c1, c2, ..., cn, 1) with -x_0 y_0 + <x_1:, y_1:>.
+    """
+    return tf.reduce_sum(x[..., 1:] * y[..., 1:], axis=-1, keepdims=True) - x[..., :1] * y[..., :1]
+
+
+def project(x, c):
+    """Projects points to the hyperboloid, by recomputing their first coordinate from the rest of them.
+
+    Args:
+      x: Tensor of size B x (dimension + 1).
+      c: Tensor of size 1 representing the absolute hyperbolic curvature.
+
+    Returns:
+      Tensor of shape B x (dimension + 1) where each row is a point of the hyperboloid.
+    """
+    return _from_space(x[..., 1:], c)
+
+
+def _from_space(space, c):
+    """:return: points of the hyperboloid with the given last d coordinates"""
+    time = tf.sqrt(1. / c + tf.reduce_sum(space * space, axis=-1, keepdims=True))
+    return tf.concat([time, space], axis=-1)
+
+
+def expmap0(u, c):
+    """Hyperbolic exponential map at origin of space in the Lorentz model.
+
+    As in hyperb.expmap0, the point is at distance 2|u| from the origin.
+
+    Args:
+      u: Tensor of size B x dimension representing tangent vectors.
+      c: Tensor of size 1 representing the absolute hyperbolic curvature.
+
+    Returns:
+      Tensor of shape B x (dimension + 1).
+    """
+    sqrt_c = tf.sqrt(c)
+    u_norm = tf.maximum(tf.norm(u, axis=-1, keepdims=True), MIN_NORM)
+    theta = tf.minimum(2 * sqrt_c * u_norm, MAX_COSH_ARG)
+    return _from_space(tf.sinh(theta) * u / (sqrt_c * u_norm), c)
+
+
+def logmap0(y, c):
+    """Hyperbolic logarithmic map at origin of space in the Lorentz model.
+
+    Args:
+      y: Tensor of size B x (dimension + 1) representing hyperbolic points.
+      c: Tensor of size 1 representing the absolute hyperbolic curvature.
+
+    Returns:
+      Tensor of shape B x dimension.
+    """
+    sqrt_c = tf.sqrt(c)
+    space = y[..., 1:]
+    space_norm = tf.maximum(tf.norm(space, axis=-1, keepdims=True), MIN_NORM)
+    return tf.asinh(sqrt_c * space_norm) / 2 * space / (sqrt_c * space_norm)
+
+
+def mobius_add(x, y, c):
+    """Translation of y by x, equivalent to the Mobius addition x +_m y of the Poincare ball.
+
+    It is the Lorentz boost that maps the origin to x, applied to y.
+
+    Args:
+      x: Tensor of size B x (dimension + 1) representing hyperbolic points.
+      y: Tensor of size B x (dimension + 1) representing hyperbolic points.
+      c: Tensor of size 1 representing the absolute hyperbolic curvature.
+
+    Returns:
+      Tensor of shape B x (dimension + 1).
+    """
+    sqrt_c = tf.sqrt(c)
+    x_time, x_space = x[..., :1], x[..., 1:]
+    y_time, y_space = y[..., :1], y[..., 1:]
+    xy_space = tf.reduce_sum(x_space * y_space, axis=-1, keepdims=True)
+    space = sqrt_c * y_time * x_space + y_space + c * xy_space / (1 + sqrt_c * x_time) * x_space
+    return _from_space(space, c)
+
+
+def to_poincare(x, c):
+    """Maps points of the hyperboloid to the Poincare ball.
+
+    Args:
+      x: Tensor of size B x (dimension + 1) representing hyperbolic points.
+      c: Tensor of size 1 representing the absolute hyperbolic curvature.
+
+    Returns:
+      Tensor of shape B x dimension.
+    """
+    return x[..., 1:] / (1 + tf.sqrt(c) * x[..., :1])
+
+
+def from_poincare(x, c):
+    """Maps points of the Poincare ball to the hyperboloid.
+
+    Args:
+      x: Tensor of size B x dimension representing points of the ball.
+      c: Tensor of size 1 representing the absolute hyperbolic curvature.
+
+    Returns:
+      Tensor of shape B x (dimension + 1).
+    """
+    cx2 = c * tf.reduce_sum(x * x, axis=-1, keepdims=True)
+    return _from_space(2 * x / tf.maximum(1 - cx2, MIN_NORM), c)
+
+
+def _distance_from_product(xy, c):
+    """:return: distance given the Minkowski inner product of the points"""
+    return arcosh(-c * xy) / tf.sqrt(c)
+
+
+def hyp_distance(x, y, c):
+    """Hyperbolic distance on the hyperboloid, d(x, y) = 1/sqrt(c) arcosh(-c <x, y>_L).
+
+    Args:
+      x: Tensor of shape (b1, b2, ..., bn, d + 1), where n is at least 1.
+      y: Tensor of the same shape (a1, a2, ..., an, d + 1) so that if both
+        ak and bk are not equal to 1 then ak=bk.
+      c: Tensor of size 1 representing the absolute hyperbolic curvature.
+
+    Returns:
+      Tensor of size (c1, c2, ..., cn, 1) where ck=max(bk,ak)
+    """
+    return _distance_from_product(minkowski_dot(x, y), c)
+
+
+def hyp_distance_all_pairs(x, y, c):
+    """Hyperbolic distance between all pairs of points, with one matrix multiplication.
+
+    Args:
+      x: Tensor of size B1 x (dimension + 1) representing hyperbolic points.
+      y: Tensor of size B2 x (dimension + 1) representing hyperbolic points.
+      c: Tensor of size 1 representing the absolute hyperbolic curvature.
+
+    Returns:
+      Tensor of shape B1 x B2 with the distance between each pair of points.
+    """
+    x_signed = tf.concat([-x[:, :1], x[:, 1:]], axis=-1)
+    return _distance_from_product(tf.matmul(x_signed, y, transpose_b=True), c)
+
+
+def hyp_distance_batch_rhs(x, y, c):
+    """Hyperbolic distance between each point and its own set of points.
+
+    Args:
+      x: Tensor of size B x (dimension + 1) representing hyperbolic points.
+      y: Tensor of size B x N x (dimension + 1) representing N hyperbolic points for each point of x.
+      c: Tensor of size 1 representing the absolute hyperbolic curvature.
+
+    Returns:
+      Tensor of shape B x N with the distance between x[i] and each of y[i].
+    """
+    x_signed = tf.concat([-x[:, :1], x[:, 1:]], axis=-1)
+    return _distance_from_product(tf.einsum("bd,bnd->bn", x_signed, y), c)
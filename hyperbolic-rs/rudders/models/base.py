@@ -12,12 +12,13 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 import abc
+from contextlib import contextmanager
 
 import numpy as np
 import tensorflow as tf
 import tensorflow.keras.regularizers as regularizers
 from rudders.relations import Relations
-from rudders.math.euclid import apply_rotation, apply_reflection
+from rudders.math.euclid import apply_unit_rotation_and_reflection, givens_unit_pairs
 
 
 class CFModel(tf.keras.Model, abc.ABC):
@@ -62,11 +63,45 @@ class CFModel(tf.keras.Model, abc.ABC):
             trainable=args.train_bias)
         self.dropout = tf.keras.layers.Dropout(args.dropout)
         self.training = True
+        self.is_frozen = False
+        self.frozen_cache = {}
 
     def build(self, input_shape):
         super().build(input_shape)
         self.dropout.build(input_shape)
 
+    @contextmanager
+    def frozen(self):
+        """
+        Context where the weights of the model are not updated, as in evaluation. Within it, models can cache
+        values that are computed from the weights only with 'cached', and they are discarded on exit.
+        """
+        was_frozen = self.is_frozen
+        self.is_frozen = True
+        try:
+            yield self
+        finally:
+            if not was_frozen:
+                self.is_frozen = False
+                self.frozen_cache.clear()
+
+    @staticmethod
+    def gather_relations(table, relation_index):
+        """
+        :param table: n_relations x ... tensor with values computed for each relation
+        :param relation_index: bs: relation indexes. As in Embedding layers, they are casted to integers.
+        :return: bs x ...: rows of the table for each relation index
+        """
+        return tf.gather(table, tf.cast(relation_index, tf.int64))
+
+    def cached(self, key, compute_fn):
+        """:return: the result of compute_fn, computed only once while the model is frozen"""
+        if not self.is_frozen:
+            return compute_fn()
+        if key not in self.frozen_cache:
+            self.frozen_cache[key] = compute_fn()
+        return self.frozen_cache[key]
+
     @abc.abstractmethod
     def get_lhs(self, input_tensor):
         """
@@ -87,16 +122,23 @@ class CFModel(tf.keras.Model, abc.ABC):
         """
         pass
 
+    def get_candidates(self, relation, candidate_ids):
+        """Identical to get_rhs but for candidate tails under a single relation
+
+        :param relation: relation index
+        :param candidate_ids: numpy array with the ids of C candidate tails
+        :return: Tensor of size C x embedding_dimension representing the rhs embeddings of the candidates
+        """
+        input_tensor = np.stack((candidate_ids, np.full_like(candidate_ids, relation), candidate_ids), axis=1)
+        return self.get_rhs(tf.convert_to_tensor(input_tensor))
+
     def get_all_items(self, input_tensor):
         """Identical to get_rhs but using all items
 
         :param input_tensor: Tensor of size batch_size x 3 containing (h, r, t) indices.
         :return: Tensor of size n_items x embedding_dimension representing embeddings for all items in the CF
         """
-        input_tensor = np.repeat(self.item_ids, 3, axis=-1)
-        input_tensor[:, 1] = Relations.USER_ITEM.value
-        input_tensor = tf.convert_to_tensor(input_tensor)
-        return self.get_rhs(input_tensor)
+        return self.get_candidates(Relations.USER_ITEM.value, np.reshape(self.item_ids, (-1,)))
 
     @abc.abstractmethod
     def similarity_score(self, lhs, rhs, all_items):
@@ -126,14 +168,68 @@ class CFModel(tf.keras.Model, abc.ABC):
         lhs = self.get_lhs(input_tensor)
         lhs_biases = self.bias_head(input_tensor[:, 0])
         if all_items:
-            rhs = self.get_all_items(input_tensor)
-            rhs_biases = self.bias_tail(np.reshape(self.item_ids, (-1,)))
-        else:
-            rhs = self.get_rhs(input_tensor)
-            rhs_biases = self.bias_tail(input_tensor[:, -1])
+            return self.score_all_items(input_tensor, lhs, lhs_biases)
+        rhs = self.get_rhs(input_tensor)
+        rhs_biases = self.bias_tail(input_tensor[:, -1])
         predictions = self.score(lhs, lhs_biases, rhs, rhs_biases, all_items)
         return predictions
 
+    def score_all_items(self, input_tensor, lhs, lhs_biases):
+        """
+        Computes the scores of each triple against all items. Models can override it to compute the scores
+        without building all the item embeddings at once.
+
+        :param input_tensor: Tensor of size batch_size x 3 containing triples' indices: (head, relation, tail)
+        :param lhs: batch_size x embedding_dim
+        :param lhs_biases: batch_size x 1
+        :return: scores: batch_size x n_items
+        """
+        rhs = self.get_all_items(input_tensor)
+        rhs_biases = self.bias_tail(np.reshape(self.item_ids, (-1,)))
+        return self.score(lhs, lhs_biases, rhs, rhs_biases, all_items=True)
+
+    def score_candidates(self, input_tensor, lhs, lhs_biases, relation, candidate_ids):
+        """
+        Computes the scores of each triple against candidate tails under a single relation.
+
+        :param input_tensor: Tensor of size batch_size x 3 containing triples' indices with the given relation
+        :param lhs: batch_size x embedding_dim
+        :param lhs_biases: batch_size x 1
+        :param relation: relation index
+        :param candidate_ids: numpy array with the ids of C candidate tails
+        :return: scores: batch_size x C
+        """
+        rhs = self.get_candidates(relation, candidate_ids)
+        rhs_biases = self.bias_tail(candidate_ids)
+        return self.score(lhs, lhs_biases, rhs, rhs_biases, all_items=True)
+
+    def score_relations(self, heads, relations, candidates=None, chunk_size=4096):
+        """
+        Computes the scores of each head against each candidate tail under several relations, for instance to compare
+        the items related to a user or an item by co-buy, co-view and semantic similarity.
+        The lhs of the heads is computed once per relation, and the candidates are scored in chunks of chunk_size.
+        The model is frozen while scoring, so values cached from the weights are shared by all the chunks.
+
+        :param heads: list or array of H head ids
+        :param relations: list of R relation indexes
+        :param candidates: list or array of C candidate tail ids. If None, all items.
+        :param chunk_size: amount of candidates scored at once
+        :return: scores: Tensor of size H x R x C
+        """
+        heads = np.asarray(heads, dtype=np.int64)
+        candidates = np.reshape(np.array(self.item_ids if candidates is None else candidates, dtype=np.int64), (-1,))
+        scores = []
+        with self.frozen():
+            for relation in relations:
+                input_tensor = tf.convert_to_tensor(np.stack((heads, np.full_like(heads, relation), heads), axis=1))
+                lhs = self.get_lhs(input_tensor)
+                lhs_biases = self.bias_head(input_tensor[:, 0])
+                relation_scores = [self.score_candidates(input_tensor, lhs, lhs_biases, relation,
+                                                         candidates[ini:ini + chunk_size])
+                                   for ini in range(0, len(candidates), chunk_size)]
+                scores.append(tf.concat(relation_scores, axis=1))
+        return tf.stack(scores, axis=1)
+
     def score(self, lhs, lhs_biases, rhs, rhs_biases, all_items):
         """
         Compute triple scores using embeddings and biases.
@@ -171,24 +267,25 @@ class CFModel(tf.keras.Model, abc.ABC):
         ranks = np.ones(total_examples)
         ranks_random = np.ones(total_examples)
 
-        for counter, input_tensor in enumerate(split_data.batch(batch_size)):
-            targets = self.call(input_tensor).numpy()
-            scores = self.call(input_tensor, all_items=True).numpy()
-            # scores[:, excluded_items] = -1e6
-            scores_random = np.ones(shape=(scores.shape[0], num_rand))
-            for i, query in enumerate(input_tensor):
-                query = query.numpy()
-                filter_out = samples[query[0]]
-                scores[i, filter_out] = -1e6  # sets that value on scores of train items
-                comp_filter_out = list(set(range(scores.shape[1])) - set(filter_out))
-                np.random.seed(seed)
-                random_indices = np.random.choice(comp_filter_out, num_rand, replace=False)
-                scores_random[i, :] = scores[i, random_indices]  # copies the indices chosen for evaluation
-
-            ini = counter * batch_size
-            end = (counter + 1) * batch_size
-            ranks[ini:end] += np.sum((scores >= targets), axis=1)
-            ranks_random[ini:end] += np.sum((scores_random >= targets), axis=1)
+        with self.frozen():
+            for counter, input_tensor in enumerate(split_data.batch(batch_size)):
+                targets = self.call(input_tensor).numpy()
+                scores = self.call(input_tensor, all_items=True).numpy()
+                # scores[:, excluded_items] = -1e6
+                scores_random = np.ones(shape=(scores.shape[0], num_rand))
+                for i, query in enumerate(input_tensor):
+                    query = query.numpy()
+                    filter_out = samples[query[0]]
+                    scores[i, filter_out] = -1e6  # sets that value on scores of train items
+                    comp_filter_out = list(set(range(scores.shape[1])) - set(filter_out))
+                    np.random.seed(seed)
+                    random_indices = np.random.choice(comp_filter_out, num_rand, replace=False)
+                    scores_random[i, :] = scores[i, random_indices]  # copies the indices chosen for evaluation
+
+                ini = counter * batch_size
+                end = (counter + 1) * batch_size
+                ranks[ini:end] += np.sum((scores >= targets), axis=1)
+                ranks_random[ini:end] += np.sum((scores_random >= targets), axis=1)
 
         return ranks, ranks_random
 
@@ -241,23 +338,25 @@ class RotRefBase(CFModel, abc.ABC):
             name='attention_lhs')
         self.scale = tf.keras.backend.ones(1) / np.sqrt(self.dims)
 
-    def reflect_entities(self, entity, ref):
+    def relation_givens(self):
         """
-        :param entity: bs x dims: entity embeddings
-        :param ref: bs x dims: reflection weights
-        :return: reflected_entity_embeddings: bs x 1 x dims
+        Normalized Givens parameters of all the relations. They are computed only once while the model is frozen.
+
+        :return: rot_cos, rot_sin, ref_cos, ref_sin: n_relations x dims/2
         """
-        queries = apply_reflection(ref, entity)
-        return tf.reshape(queries, (-1, 1, self.dims))
+        def compute_givens():
+            relation_ids = tf.range(self.rotations.input_dim)
+            return givens_unit_pairs(self.rotations(relation_ids)) + givens_unit_pairs(self.reflections(relation_ids))
+        return self.cached("relation_givens", compute_givens)
 
-    def rotate_entities(self, entity, rot):
+    def rotate_and_reflect_entities(self, entity, relation_index):
         """
         :param entity: bs x dims: entity embeddings
-        :param rot: bs x dims: rotation weights
-        :return: rotated_entity_embeddings: bs x 1 x dims
+        :param relation_index: bs: relation of each entity
+        :return: rotated_entity_embeddings, reflected_entity_embeddings: bs x dims
         """
-        queries = apply_rotation(rot, entity)
-        return tf.reshape(queries, (-1, 1, self.dims))
+        givens = [self.gather_relations(params, relation_index) for params in self.relation_givens()]
+        return apply_unit_rotation_and_reflection(*givens, entity)
 
     def attn_mechanism(self, queries, attn_vecs):
         """
@@ -267,11 +366,9 @@ class RotRefBase(CFModel, abc.ABC):
         between each of the n candidates and the attn vector batch-wise.
         :return: b x dims: weighted average of n candidates as a single vector representation
         """
-        attn_vecs = tf.reshape(attn_vecs, (-1, 1, self.dims))  # b x 1 x dim
-        att_weights = tf.reduce_sum(attn_vecs * queries * self.scale, axis=-1, keepdims=True)  # b x n x 1
-        att_weights = tf.nn.softmax(att_weights, axis=1)
-        res = tf.reduce_sum(att_weights * queries, axis=1)
-        return res
+        att_weights = tf.einsum('bd,bnd->bn', attn_vecs, queries) * self.scale  # b x n
+        att_weights = tf.nn.softmax(att_weights, axis=-1)
+        return tf.einsum('bn,bnd->bd', att_weights, queries)
 
     def get_heads(self, input_tensor):
         """
@@ -283,13 +380,10 @@ class RotRefBase(CFModel, abc.ABC):
         """
         heads = self.entities(input_tensor[:, 0])
         heads = self.dropout(heads, training=self.training)
-        rotations = self.rotations(input_tensor[:, 1])
-        reflections = self.reflections(input_tensor[:, 1])
         attn_vec = self.attention_lhs(input_tensor[:, 1])
 
-        ref_q = self.reflect_entities(heads, reflections)
-        rot_q = self.rotate_entities(heads, rotations)
-        queries = tf.concat([ref_q, rot_q], axis=1)
+        rot_q, ref_q = self.rotate_and_reflect_entities(heads, input_tensor[:, 1])
+        queries = tf.stack([ref_q, rot_q], axis=1)
         return self.attn_mechanism(queries, attn_vec)
 
 
@@ -318,31 +412,24 @@ class UserAttentiveBase(RotRefBase, MuRBase, abc.ABC):
             name='ui_weights',
             trainable=args.train_ui_weight)
         self.item_ids = tf.convert_to_tensor(item_ids)
+        self.items_chunk_size = args.items_chunk_size
 
     def get_lhs(self, input_tensor):
         heads = self.entities(input_tensor[:, 0])
         heads = self.dropout(heads, training=self.training)
-        rotations = self.rotations(input_tensor[:, 1])
-        reflections = self.reflections(input_tensor[:, 1])
         transforms = self.transforms(input_tensor[:, 1])
         attn_vec = self.attention_lhs(input_tensor[:, 1])
 
-        ref_q = self.reflect_entities(heads, reflections)
-        rot_q = self.rotate_entities(heads, rotations)
-        trf_q = tf.reshape(transforms * heads, (-1, 1, self.dims))
-        queries = tf.concat([ref_q, rot_q, trf_q], axis=1)
+        rot_q, ref_q = self.rotate_and_reflect_entities(heads, input_tensor[:, 1])
+        queries = tf.stack([ref_q, rot_q, transforms * heads], axis=1)
         return self.attn_mechanism(queries, attn_vec)
 
-    def get_rhs_attn_vector(self, input_tensor, all_items=False):
+    def get_rhs_attn_vector(self, input_tensor):
         """
         Returns the attn vectors for the right-hand side. By default it depends on the head entity (user-centric).
         :param input_tensor: bs x 3: tensor of triplets
-        :param all_items: Whether to compute the attn vector for all items or not
-        :return: tensor of bs x dims. If all_items=True, bs x n_items x dims
+        :return: tensor of bs x dims
         """
-        if all_items:
-            input_tensor = tf.tile(tf.expand_dims(input_tensor[:, 0], 1), [1, len(self.item_ids)])
-            return self.attention_rhs(input_tensor)
         return self.attention_rhs(input_tensor[:, 0])
 
     @tf.function
@@ -402,32 +489,58 @@ class UserAttentiveBase(RotRefBase, MuRBase, abc.ABC):
                                                   tf_op=tf.add)
         return res
 
-    def get_all_items(self, input_tensor):
+    def get_user_item_offsets(self, input_tensor):
+        """
+        For the USER-ITEM relation, the attention logit of each candidate (item + relation) is
+        attn_vec * item + attn_vec * relation. The first term is the same for all the relations, so it cancels in the
+        softmax, and the attention weights depend only on the head (user). Then, the combined embedding of any item
+        is the item embedding plus an offset that is the same for all the items.
+
+        :param input_tensor: b x 3: tensor of triplets
+        :return: b x dims: offset to add to each item embedding to get its rhs embedding with the USER-ITEM relation
+        """
+        ui_relation = self.relations(tf.convert_to_tensor([Relations.USER_ITEM.value]))  # 1 x dims
+        all_relations = self.relations.weights[0]  # r x dims
+        attn_vecs = self.get_rhs_attn_vector(input_tensor)  # b x dims
+        ui_weights = tf.keras.activations.sigmoid(self.ui_weights(input_tensor[:, 0]))  # b x 1
+
+        att_weights = tf.matmul(attn_vecs, all_relations, transpose_b=True) * self.scale  # b x r
+        att_weights = tf.nn.softmax(att_weights, axis=-1)
+        combined_relations = tf.matmul(att_weights, all_relations)  # b x dims
+        return ui_weights * ui_relation + (1 - ui_weights) * combined_relations
+
+    def get_all_items(self, input_tensor, item_ids=None):
         """
         In this case, since the item embedding depends on the head (user)
         we need to override this function
 
+        :param item_ids: ids of the items to compute embeddings for. If None, all items
         :return: batch x n_items x dims tensor representing embeddings for
         each item, according to each head (user) in the input tensor
         """
-        all_items = self.entities(self.item_ids)  # n_items x dims
-        ui_relation = self.relations(tf.convert_to_tensor([Relations.USER_ITEM.value]))  # 1 x dims
-        all_relations = self.relations.weights[0]  # r x dims
-        attn_vecs = self.get_rhs_attn_vector(input_tensor, all_items=True)  # b x n_items x dims
-        ui_weights = tf.keras.activations.sigmoid(self.ui_weights(input_tensor[:, 0]))
+        items = self.entities(self.item_ids if item_ids is None else item_ids)  # n_items x dims
+        offsets = self.get_user_item_offsets(input_tensor)  # b x dims
+        return tf.expand_dims(items, 0) + tf.expand_dims(offsets, 1)
 
-        # adds each item with all the relation embeddings
-        cands = tf.add(tf.reshape(all_items, (-1, 1, self.dims)),
-                       tf.reshape(all_relations, (1, -1, self.dims)))  # n_items x r x dims
-
-        # aggregates the points
-        cands = tf.expand_dims(cands, axis=0)  # 1 x n_items x r x dims
-        attn_vecs = tf.expand_dims(attn_vecs, axis=2)  # b x n_items x 1 x dims
-        att_weights = tf.reduce_sum(attn_vecs * cands * self.scale, axis=-1, keepdims=True)  # b x n_items x r x 1
-        att_weights = tf.nn.softmax(att_weights, axis=2)
-        combined_embeds = tf.reduce_sum(att_weights * cands, axis=2)  # b x n_items x dims
-
-        regular_embeds = tf.expand_dims(tf.add(all_items, ui_relation), 0)  # 1 x n_items x dims
-        user_item_embed = tf.reshape(ui_weights, (-1, 1, 1)) * regular_embeds + \
-                          tf.reshape(1 - ui_weights, (-1, 1, 1)) * combined_embeds
-        return user_item_embed
+    def score_candidates(self, input_tensor, lhs, lhs_biases, relation, candidate_ids):
+        """
+        The rhs of the USER-ITEM relation depends on the head, while the rhs of the rest of the relations is the same
+        for all heads, so it is broadcasted to them
+        """
+        if relation == Relations.USER_ITEM.value:
+            rhs = self.get_all_items(input_tensor, candidate_ids)
+        else:
+            rhs = self.get_candidates(relation, candidate_ids)
+            rhs = tf.broadcast_to(tf.expand_dims(rhs, 0), (tf.shape(lhs)[0], len(candidate_ids), rhs.shape[-1]))
+        rhs_biases = self.bias_tail(candidate_ids)
+        return self.score(lhs, lhs_biases, rhs, rhs_biases, all_items=True)
+
+    def score_all_items(self, input_tensor, lhs, lhs_biases):
+        """Computes the scores against chunks of items_chunk_size items, to bound the size of the rhs embeddings"""
+        scores = []
+        for ini in range(0, len(self.item_ids), self.items_chunk_size):
+            item_ids = self.item_ids[ini:ini + self.items_chunk_size]
+            rhs = self.get_all_items(input_tensor, item_ids)
+            rhs_biases = self.bias_tail(item_ids)
+            scores.append(self.score(lhs, lhs_biases, rhs, rhs_biases, all_items=True))
+        return tf.concat(scores, axis=1)
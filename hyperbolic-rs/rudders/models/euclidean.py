@@ -13,6 +13,7 @@
 # limitations under the License.
 
 from abc import ABC
+import numpy as np
 import tensorflow as tf
 from rudders.models.base import CFModel, MuRBase, RotRefBase, UserAttentiveBase
 from rudders.math.euclid import euclidean_sq_distance, euclidean_sq_distance_batched_all_pairs
@@ -37,6 +38,7 @@ class MLP(CFModel):
         self.dense_2 = tf.keras.layers.Dense(units=int(self.dims / 2), activation=tf.nn.relu)
         self.dense_3 = tf.keras.layers.Dense(units=1)
         self.dropout = tf.keras.layers.Dropout(args.dropout)
+        self.items_chunk_size = args.items_chunk_size
 
     def get_lhs(self, input_tensor):
         return self.entities(input_tensor[:, 0])
@@ -51,21 +53,64 @@ class MLP(CFModel):
         :param all_items:
         :return: b x 1. If all_items b x n_items
         """
-        squeeze = lambda x: x
         if all_items:
-            bs, dim = tf.shape(lhs)
-            n_items, _ = tf.shape(rhs)
-            lhs = tf.broadcast_to(tf.expand_dims(lhs, 1), (bs, n_items, dim))
-            rhs = tf.broadcast_to(tf.expand_dims(rhs, 0), (bs, n_items, dim))
-            squeeze = lambda x: tf.squeeze(x, axis=-1)
+            return self.score_projections(self.project(lhs, self.lhs_kernel(), self.dense_1.bias),
+                                          self.project(rhs, self.rhs_kernel()))
 
         embeds = tf.concat((lhs, rhs), axis=-1)
         embeds = self.dense_1(self.dropout(embeds, training=self.training))
         embeds = self.dense_2(self.dropout(embeds, training=self.training))
         embeds = self.dense_3(self.dropout(embeds, training=self.training))
-        embeds = squeeze(embeds)
         return embeds
 
+    def score_all_items(self, input_tensor, lhs, lhs_biases):
+        """
+        The item projections of the first layer do not depend on the users, so they are computed once while the
+        model is frozen
+        """
+        item_projections = self.cached("item_projections",
+                                       lambda: self.project(self.get_all_items(input_tensor), self.rhs_kernel()))
+        rhs_biases = self.cached("item_biases", lambda: self.bias_tail(np.reshape(self.item_ids, (-1,))))
+        scores = self.score_projections(self.project(lhs, self.lhs_kernel(), self.dense_1.bias), item_projections)
+        return scores + lhs_biases + tf.transpose(rhs_biases)
+
+    def lhs_kernel(self):
+        """:return: dim x dims: rows of the kernel of the first layer applied to the lhs"""
+        return self.dense_1.kernel[:self.dims]
+
+    def rhs_kernel(self):
+        """:return: dim x dims: rows of the kernel of the first layer applied to the rhs"""
+        return self.dense_1.kernel[self.dims:]
+
+    def project(self, embeds, kernel, bias=None):
+        """
+        Since the first layer is linear before the activation, applying it to the concatenation of lhs and rhs is
+        the same as adding the projections of each one with its part of the kernel.
+
+        :return: n x dims: projection of the embeddings with the kernel, and the bias if given
+        """
+        projections = tf.matmul(self.dropout(embeds, training=self.training), kernel)
+        return projections if bias is None else projections + bias
+
+    def score_projections(self, lhs_projections, rhs_projections):
+        """
+        Applies the activation of the first layer and the remaining layers to all pairs of lhs and rhs projections,
+        in chunks of items_chunk_size rhs at a time.
+
+        :param lhs_projections: b x dims
+        :param rhs_projections: n_items x dims
+        :return: b x n_items
+        """
+        scores = []
+        for ini in range(0, rhs_projections.shape[0], self.items_chunk_size):
+            rhs_chunk = rhs_projections[ini:ini + self.items_chunk_size]
+            embeds = tf.expand_dims(lhs_projections, 1) + tf.expand_dims(rhs_chunk, 0)
+            embeds = self.dense_1.activation(embeds)
+            embeds = self.dense_2(self.dropout(embeds, training=self.training))
+            embeds = self.dense_3(self.dropout(embeds, training=self.training))
+            scores.append(tf.squeeze(embeds, axis=-1))
+        return tf.concat(scores, axis=1)
+
 
 class DistMul(CFEuclideanBase):
     
@@ -122,7 +167,7 @@ class TransH(CFEuclideanBase):
     def get_lhs(self, input_tensor):
         heads = self.entities(input_tensor[:, 0])
         heads = tf.clip_by_norm(heads, clip_norm=1, axes=-1)
-        norm_vectors = self.norm_vector(input_tensor[:, 1])
+        norm_vectors = self.gather_relations(self.relation_norm_vectors(), input_tensor[:, 1])
         proj_heads = self.project(heads, norm_vectors)
 
         relations = self.relations(input_tensor[:, 1])
@@ -131,17 +176,21 @@ class TransH(CFEuclideanBase):
     def get_rhs(self, input_tensor):
         tails = self.entities(input_tensor[:, -1])
         tails = tf.clip_by_norm(tails, clip_norm=1, axes=-1)
-        norm_vectors = self.norm_vector(input_tensor[:, 1])
+        norm_vectors = self.gather_relations(self.relation_norm_vectors(), input_tensor[:, 1])
         proj_tails = self.project(tails, norm_vectors)
         return proj_tails
 
+    def relation_norm_vectors(self):
+        """:return: n_relations x dim: normalized norm vectors, computed only once while the model is frozen"""
+        return self.cached("relation_norm_vectors", lambda: tf.math.l2_normalize(
+            self.norm_vector(tf.range(self.norm_vector.input_dim)), axis=-1))
+
     def project(self, entities, norm_vectors):
         """
         :param entities: b x dim
-        :param norm_vectors: b x dim
+        :param norm_vectors: b x dim: normalized norm vectors
         :return: b x dim
         """
-        norm_vectors = tf.math.l2_normalize(norm_vectors, axis=-1)
         dot_prod = tf.reduce_sum(entities * norm_vectors, axis=-1, keepdims=True)
         return entities - dot_prod * norm_vectors
 
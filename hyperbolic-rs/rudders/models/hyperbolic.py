@@ -16,28 +16,82 @@ from abc import ABC
 import tensorflow as tf
 from rudders.models.base import CFModel, MuRBase, RotRefBase, UserAttentiveBase
 import rudders.math.hyperb as hmath
+import rudders.math.lorentz as lmath
+
+# modules with the math of each model of hyperbolic space, selected with args.hyperbolic_model
+HYPERBOLIC_MODELS = {'poincare': hmath, 'lorentz': lmath}
 
 
 class CFHyperbolicBase(CFModel, ABC):
-    """Base model class for hyperbolic embeddings with parameters defined in tangent space."""
+    """
+    Base model class for hyperbolic embeddings with parameters defined in tangent space.
+    Points are represented in the Poincare ball or in the Lorentz model, according to args.hyperbolic_model, and the
+    hyperbolic operations are taken from the module of that model in 'manifold'.
+    Models that only use the entities as points of the ball can keep them on the ball instead, with
+    args.ball_embeddings, to be trained with a RiemannianOptimizer over 'ball_variables'.
+    """
+    supports_ball_embeddings = False
 
     def __init__(self, n_entities, n_relations, item_ids, args):
         super().__init__(n_entities, n_relations, item_ids, args)
         # inits c to a value that will result in softplus(c) == curvature
         init_value = tf.math.log(tf.math.exp(tf.keras.backend.constant(args.curvature)) - 1)
         self.c = tf.Variable(initial_value=init_value, trainable=args.train_c)
+        if args.hyperbolic_model not in HYPERBOLIC_MODELS:
+            raise ValueError(f"Unknown hyperbolic_model '{args.hyperbolic_model}'. Use one of "
+                             f"{tuple(HYPERBOLIC_MODELS)}")
+        self.hyperbolic_model = args.hyperbolic_model
+        self.manifold = HYPERBOLIC_MODELS[args.hyperbolic_model]
+        self.ball_embeddings = args.ball_embeddings
+        if self.ball_embeddings and not self.supports_ball_embeddings:
+            raise ValueError(f"{type(self).__name__} uses entities as tangent vectors and does not support "
+                             f"ball_embeddings")
+        if self.ball_embeddings and self.manifold is not hmath:
+            raise ValueError("ball_embeddings requires the 'poincare' hyperbolic_model")
+
+    def build(self, input_shape):
+        super().build(input_shape)
+        if self.ball_embeddings:
+            self.entities.embeddings.assign(hmath.project(self.entities.embeddings, self.get_c()))
 
     def get_c(self):
         return tf.math.softplus(self.c)
 
+    def ball_variables(self):
+        """:return: list of variables whose rows are points of the ball, to be updated with a Riemannian optimizer"""
+        return [self.entities.embeddings] if self.ball_embeddings else []
+
     def get_rhs(self, input_tensor):
-        return hmath.expmap0(self.entities(input_tensor[:, -1]), self.get_c())
+        return self.ball_entities(input_tensor[:, -1])
+
+    def ball_entities(self, entity_ids):
+        """
+        Entity embeddings mapped to the hyperbolic space.
+        With ball_embeddings, the entities already are points of the ball and are returned as they are.
+        While the model is frozen, neither the entities nor the curvature change, so the whole entity table is
+        mapped once and the points are gathered from it. Otherwise, only the given entities are mapped.
+
+        :param entity_ids: bs: entity indexes
+        :return: bs x dims: hyperbolic points, with dims + 1 coordinates in the Lorentz model
+        """
+        if self.ball_embeddings:
+            return self.entities(entity_ids)
+        if not self.is_frozen:
+            return self.manifold.expmap0(self.entities(entity_ids), self.get_c())
+        table = self.cached("ball_entities", lambda: self.manifold.expmap0(
+            self.entities(tf.range(self.entities.input_dim)), self.get_c()))
+        return tf.gather(table, tf.cast(entity_ids, tf.int64))
+
+    def hyperbolic_relations(self):
+        """:return: n_relations x dims: relation embeddings mapped to hyperbolic space, computed once while frozen"""
+        return self.cached("hyperbolic_relations", lambda: self.manifold.expmap0(
+            self.relations(tf.range(self.relations.input_dim)), self.get_c()))
 
     def similarity_score(self, lhs, rhs, all_items):
         """Score based on square hyperbolic distance"""
         if all_items:
-            return -hmath.hyp_distance_all_pairs(lhs, rhs, self.get_c()) ** 2
-        return -hmath.hyp_distance(lhs, rhs, self.get_c()) ** 2
+            return -self.manifold.hyp_distance_all_pairs(lhs, rhs, self.get_c()) ** 2
+        return -self.manifold.hyp_distance(lhs, rhs, self.get_c()) ** 2
 
 
 class HyperML(CFHyperbolicBase):
@@ -45,13 +99,14 @@ class HyperML(CFHyperbolicBase):
     Model based on "HyperML: A boosting metric learning approach in hyperbolic space for recommender systems"
     Vinh Tran et al.
     """
+    supports_ball_embeddings = True
 
     def __init__(self, n_entities, n_relations, item_ids, args):
         super().__init__(n_entities, n_relations, item_ids, args)
         self.relations = None
 
     def get_lhs(self, input_tensor):
-        return hmath.expmap0(self.entities(input_tensor[:, 0]), self.get_c())
+        return self.ball_entities(input_tensor[:, 0])
 
 
 class MuRHyperbolic(MuRBase, CFHyperbolicBase):
@@ -60,12 +115,12 @@ class MuRHyperbolic(MuRBase, CFHyperbolicBase):
         tg_heads = self.entities(input_tensor[:, 0])
         tg_heads = self.dropout(tg_heads)
         tg_relation_transforms = self.transforms(input_tensor[:, 1])
-        return hmath.expmap0(tg_relation_transforms * tg_heads, self.get_c())
+        return self.manifold.expmap0(tg_relation_transforms * tg_heads, self.get_c())
 
     def get_rhs(self, input_tensor):
-        tails = hmath.expmap0(self.entities(input_tensor[:, -1]), self.get_c())
-        relation_additions = hmath.expmap0(self.relations(input_tensor[:, 1]), self.get_c())
-        return hmath.mobius_add(tails, relation_additions, self.get_c())
+        tails = self.ball_entities(input_tensor[:, -1])
+        relation_additions = self.gather_relations(self.hyperbolic_relations(), input_tensor[:, 1])
+        return self.manifold.mobius_add(tails, relation_additions, self.get_c())
 
 
 class RotRefHyperbolic(RotRefBase, CFHyperbolicBase):
@@ -73,9 +128,9 @@ class RotRefHyperbolic(RotRefBase, CFHyperbolicBase):
 
     def get_lhs(self, input_tensor):
         c = self.get_c()
-        head_embeds = hmath.expmap0(self.get_heads(input_tensor), c)
-        relation_embeds = hmath.expmap0(self.relations(input_tensor[:, 1]), c)
-        return hmath.mobius_add(head_embeds, relation_embeds, c)
+        head_embeds = self.manifold.expmap0(self.get_heads(input_tensor), c)
+        relation_embeds = self.gather_relations(self.hyperbolic_relations(), input_tensor[:, 1])
+        return self.manifold.mobius_add(head_embeds, relation_embeds, c)
 
 
 class UserAttentiveHyperbolic(UserAttentiveBase, CFHyperbolicBase):
@@ -83,17 +138,17 @@ class UserAttentiveHyperbolic(UserAttentiveBase, CFHyperbolicBase):
     def similarity_score(self, lhs, rhs, all_items):
         """Score based on square hyperbolic distance"""
         if all_items:
-            return -hmath.hyp_distance_batch_rhs(lhs, rhs, self.get_c()) ** 2
-        return -hmath.hyp_distance(lhs, rhs, self.get_c()) ** 2
+            return -self.manifold.hyp_distance_batch_rhs(lhs, rhs, self.get_c()) ** 2
+        return -self.manifold.hyp_distance(lhs, rhs, self.get_c()) ** 2
 
     def get_lhs(self, input_tensor):
         heads = super().get_lhs(input_tensor)
-        return hmath.expmap0(heads, self.get_c())
+        return self.manifold.expmap0(heads, self.get_c())
 
     def get_rhs(self, input_tensor):
         tails = super().get_rhs(input_tensor)
-        return hmath.expmap0(tails, self.get_c())
+        return self.manifold.expmap0(tails, self.get_c())
 
-    def get_all_items(self, input_tensor):
-        all_items = super().get_all_items(input_tensor)
-        return hmath.expmap0(all_items, self.get_c())
+    def get_all_items(self, input_tensor, item_ids=None):
+        all_items = super().get_all_items(input_tensor, item_ids)
+        return self.manifold.expmap0(all_items, self.get_c())
@@ -0,0 +1,121 @@
+# Copyright 2017 The Rudders Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Riemannian optimizers for embeddings that live on the Poincare ball"""
+
+import tensorflow as tf
+import rudders.math.hyperb as hmath
+
+METHODS = ('rsgd', 'radam')
+
+
+class RiemannianOptimizer:
+    """
+    Optimizer for models where some variables are points of the Poincare ball.
+
+    The rows of the ball variables are updated with Riemannian SGD or Riemannian Adam (Becigneul and Ganea, 2019):
+    the Euclidean gradient is rescaled to the Riemannian gradient, the step follows the exponential map at the
+    current point, and the result is projected to the ball. Adam moments are kept per coordinate, and the first
+    moment is moved along with the point by parallel transport.
+    Sparse gradients only update the rows that appear in the batch, as in lazy Adam.
+    The rest of the variables are updated by the given Keras optimizer, whose learning rate is shared, so decaying
+    it with 'optimizer.lr' affects both.
+    """
+
+    def __init__(self, optimizer, ball_variables, get_c, method='radam', beta_1=0.9, beta_2=0.999, epsilon=1e-8):
+        """
+        :param optimizer: Keras optimizer for the variables that are not on the ball
+        :param ball_variables: list of variables of n x dims where each row is a point of the ball
+        :param get_c: function that returns the absolute curvature of the ball
+        :param method: 'rsgd' or 'radam'
+        """
+        if method not in METHODS:
+            raise ValueError(f"Unknown Riemannian optimizer '{method}'. Use one of {METHODS}")
+        self.optimizer = optimizer
+        self.ball_variables = list(ball_variables)
+        self.ball_index = {var.ref(): i for i, var in enumerate(self.ball_variables)}
+        self.get_c = get_c
+        self.method = method
+        self.beta_1 = beta_1
+        self.beta_2 = beta_2
+        self.epsilon = epsilon
+        # slots are created eagerly, so apply_gradients can run within a tf.function
+        self.iterations = tf.Variable(0, dtype=tf.int64, trainable=False, name='riemannian_iterations')
+        self.moments, self.sq_moments = [], []
+        if method == 'radam':
+            self.moments = [tf.Variable(tf.zeros_like(var), trainable=False) for var in self.ball_variables]
+            self.sq_moments = [tf.Variable(tf.zeros_like(var), trainable=False) for var in self.ball_variables]
+
+    @property
+    def lr(self):
+        return self.optimizer.lr
+
+    def apply_gradients(self, grads_and_vars):
+        euclidean_grads_and_vars, ball_grads = [], {}
+        for grad, var in grads_and_vars:
+            if var.ref() in self.ball_index:
+                ball_grads[self.ball_index[var.ref()]] = grad
+            else:
+                euclidean_grads_and_vars.append((grad, var))
+        self.optimizer.apply_gradients(euclidean_grads_and_vars)
+        self.iterations.assign_add(1)
+        for i, grad in ball_grads.items():
+            if grad is not None:
+                self.apply_ball_gradient(i, grad)
+
+    def apply_ball_gradient(self, i, grad):
+        var = self.ball_variables[i]
+        indices, egrad = unique_rows(grad)
+        c = self.get_c()
+        lr = tf.cast(self.lr, var.dtype)
+        point = read_rows(var, indices)
+        rgrad = hmath.egrad2rgrad(point, egrad, c)
+        if self.method == 'rsgd':
+            write_rows(var, indices, hmath.expmap(point, -lr * rgrad, c))
+            return
+
+        step = tf.cast(self.iterations, var.dtype)
+        moment = self.beta_1 * read_rows(self.moments[i], indices) + (1 - self.beta_1) * rgrad
+        # second moment of the Riemannian gradient, with the metric of the ball at the point
+        sq_grad = tf.square(rgrad * hmath.lambda_x(point, c))
+        sq_moment = self.beta_2 * read_rows(self.sq_moments[i], indices) + (1 - self.beta_2) * sq_grad
+        direction = (moment / (1 - self.beta_1 ** step)) / (tf.sqrt(sq_moment / (1 - self.beta_2 ** step)) +
+                                                            self.epsilon)
+        new_point = hmath.expmap(point, -lr * direction, c)
+        write_rows(self.moments[i], indices, hmath.parallel_transport(point, new_point, moment, c))
+        write_rows(self.sq_moments[i], indices, sq_moment)
+        write_rows(var, indices, new_point)
+
+
+def unique_rows(grad):
+    """
+    :param grad: dense gradient or tf.IndexedSlices
+    :return: indices, values: for sparse gradients, the unique row indexes and their summed gradients. For dense
+    gradients, indices is None and values is the gradient
+    """
+    if not isinstance(grad, tf.IndexedSlices):
+        return None, tf.convert_to_tensor(grad)
+    indices, positions = tf.unique(grad.indices)
+    values = tf.math.unsorted_segment_sum(grad.values, positions, tf.shape(indices)[0])
+    return indices, values
+
+
+def read_rows(var, indices):
+    return tf.convert_to_tensor(var) if indices is None else tf.gather(var, indices)
+
+
+def write_rows(var, indices, values):
+    if indices is None:
+        var.assign(values)
+    else:
+        var.scatter_update(tf.IndexedSlices(values, indices))
@@ -20,6 +20,7 @@ from absl import logging
 from pathlib import Path
 import random
 from datetime import datetime
+from rudders.inference import export_model
 from rudders.relations import Relations
 from rudders.utils import rank_to_metric_dict
 
@@ -96,6 +97,8 @@ class Runner:
 
         if self.args.save_model:
             self.model.save_weights(str(Path(self.args.ckpt_dir) / f'{self.args.run_id}_{best_epoch}ep.h5'))
+        if self.args.export_inference:
+            export_model(self.model, str(Path(self.args.ckpt_dir) / f'{self.args.run_id}_{best_epoch}ep.npz'))
 
         # validation metrics
         self.print_samples()
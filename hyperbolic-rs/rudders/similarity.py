@@ -0,0 +1,179 @@
+# Copyright 2017 The Rudders Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Cosine similarity between embeddings computed by tiles, to build item-item graphs"""
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from tqdm import tqdm
+
+
+def l2_normalize(embeds, dtype=np.float32):
+    """:return: copy of embeds, casted to dtype, where each row has norm 1"""
+    embeds = np.array(embeds, dtype=dtype)
+    norms = np.linalg.norm(embeds, axis=1, keepdims=True)
+    return embeds / np.maximum(norms, np.finfo(dtype).tiny)
+
+
+def _threshold_row_tile(embeds, ini, tile_size, threshold):
+    """
+    Compares the rows in [ini, ini + tile_size) against all the following rows, one column tile at a time.
+
+    :return: src, dst, sims: arrays with the pairs (src < dst) with similarity above threshold
+    """
+    end = min(ini + tile_size, len(embeds))
+    rows = embeds[ini:end]
+    srcs, dsts, sims = [], [], []
+    for col_ini in range(ini, len(embeds), tile_size):
+        col_end = min(col_ini + tile_size, len(embeds))
+        tile = rows @ embeds[col_ini:col_end].T
+        mask = tile > threshold
+        if col_ini == ini:
+            # diagonal tile: only pairs above the diagonal
+            mask = np.triu(mask, k=1)
+        src, dst = np.nonzero(mask)
+        srcs.append(src + ini)
+        dsts.append(dst + col_ini)
+        sims.append(np.clip(tile[src, dst], -1.0, 1.0))
+    return np.concatenate(srcs), np.concatenate(dsts), np.concatenate(sims)
+
+
+def threshold_edges(embeds, threshold, tile_size=4096, n_workers=os.cpu_count()):
+    """
+    Finds all pairs of embeddings with cosine similarity above threshold.
+    The similarity matrix is computed by tiles of tile_size x tile_size, so the memory used is bounded by the tile
+    size and the amount of workers, and not by the amount of embeddings. Row tiles are processed concurrently by
+    n_workers threads.
+
+    :param embeds: numpy array of n x dims
+    :param threshold: only pairs with similarity above threshold are returned
+    :param tile_size: amount of rows and columns of each tile of the similarity matrix
+    :param n_workers: number of threads
+    :return: src, dst, sims: arrays of the same length with the pairs of row indexes (src < dst) and their cosine
+    similarity
+    """
+    embeds = l2_normalize(embeds)
+    threshold = np.float32(threshold)
+    tiles = range(0, len(embeds), tile_size)
+    with ThreadPoolExecutor(max_workers=n_workers) as pool:
+        results = list(tqdm(pool.map(lambda ini: _threshold_row_tile(embeds, ini, tile_size, threshold), tiles),
+                            total=len(tiles), desc="threshold_edges"))
+    if not results:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+    src, dst, sims = zip(*results)
+    return np.concatenate(src), np.concatenate(dst), np.concatenate(sims)
+
+
+def _top_k(sims, ids, k):
+    """
+    :param sims: n x m similarities
+    :param ids: n x m ids of the similarities
+    :return: top_sims, top_ids: n x k with the k highest similarities of each row and their ids, in no particular
+    order. If m < k, rows are padded with -inf similarities and -1 ids.
+    """
+    if sims.shape[1] < k:
+        pad = k - sims.shape[1]
+        sims = np.concatenate((sims, np.full((len(sims), pad), -np.inf, dtype=sims.dtype)), axis=1)
+        ids = np.concatenate((ids, np.full((len(ids), pad), -1, dtype=ids.dtype)), axis=1)
+    top = np.argpartition(-sims, k - 1, axis=1)[:, :k]
+    return np.take_along_axis(sims, top, axis=1), np.take_along_axis(ids, top, axis=1)
+
+
+def _closest_centroids(embeds, centroids, n_closest, tile_size):
+    """:return: n x n_closest array with the index of the closest centroids to each embedding"""
+    n_closest = min(n_closest, len(centroids))
+    closest = []
+    for ini in range(0, len(embeds), tile_size):
+        sims = embeds[ini:ini + tile_size] @ centroids.T
+        closest.append(np.argpartition(-sims, n_closest - 1, axis=1)[:, :n_closest])
+    return np.concatenate(closest, axis=0)
+
+
+def spherical_kmeans(embeds, n_clusters, n_iters=10, sample_size=100000, tile_size=4096, seed=42):
+    """
+    K-means with cosine similarity over a sample of the l2-normalized embeddings
+
+    :return: n_clusters x dims array of l2-normalized centroids
+    """
+    rng = np.random.RandomState(seed)
+    sample = embeds[rng.choice(len(embeds), min(sample_size, len(embeds)), replace=False)]
+    centroids = sample[rng.choice(len(sample), n_clusters, replace=False)]
+    for _ in range(n_iters):
+        assign = _closest_centroids(sample, centroids, 1, tile_size)[:, 0]
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, sample)
+        non_empty = np.bincount(assign, minlength=n_clusters) > 0
+        centroids[non_empty] = l2_normalize(sums[non_empty])
+    return centroids
+
+
+def knn_edges(embeds, k, n_lists=0, n_probe=8, tile_size=4096, n_workers=os.cpu_count(), seed=42):
+    """
+    Approximate k nearest neighbors by cosine similarity, with an inverted file (IVF) index.
+    Embeddings are clustered with spherical k-means into n_lists inverted lists. Each embedding is compared only
+    against the members of the n_probe lists with the closest centroids, so the cost is about
+    n * n * n_probe / n_lists instead of n * n. If n_probe >= n_lists the search is exact.
+    Lists are processed concurrently by n_workers threads.
+
+    :param embeds: numpy array of n x dims
+    :param k: amount of neighbors per embedding
+    :param n_lists: amount of inverted lists. If 0, it is sqrt(n)
+    :param n_probe: amount of lists to search for each embedding
+    :return: src, dst, sims: arrays with the k neighbors (dst) of each embedding (src), excluding itself, and their
+    cosine similarity. Each pair can appear in both directions.
+    """
+    embeds = l2_normalize(embeds)
+    n = len(embeds)
+    if n < 2:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+    k = min(k, n - 1)
+    n_lists = min(n_lists if n_lists > 0 else int(np.sqrt(n)), n)
+    centroids = spherical_kmeans(embeds, n_lists, tile_size=tile_size, seed=seed)
+
+    # inverted lists: members of each list sorted by list
+    assign = _closest_centroids(embeds, centroids, 1, tile_size)[:, 0]
+    members = np.argsort(assign, kind="stable")
+    member_ptr = np.concatenate(([0], np.cumsum(np.bincount(assign, minlength=n_lists))))
+    # queries that probe each list, sorted by list
+    probes = _closest_centroids(embeds, centroids, n_probe, tile_size)
+    probe_queries = np.repeat(np.arange(n), probes.shape[1])
+    order = np.argsort(probes.ravel(), kind="stable")
+    probe_queries = probe_queries[order]
+    query_ptr = np.concatenate(([0], np.cumsum(np.bincount(probes.ravel(), minlength=n_lists))))
+
+    def search_list(list_id):
+        list_members = members[member_ptr[list_id]:member_ptr[list_id + 1]]
+        queries = probe_queries[query_ptr[list_id]:query_ptr[list_id + 1]]
+        results = []
+        for ini in range(0, len(queries), tile_size):
+            tile_queries = queries[ini:ini + tile_size]
+            sims = embeds[tile_queries] @ embeds[list_members].T
+            sims[tile_queries[:, None] == list_members[None, :]] = -np.inf     # excludes the query itself
+            ids = np.broadcast_to(list_members, sims.shape)
+            results.append((tile_queries,) + _top_k(sims, ids, k))
+        return results
+
+    best_sims = np.full((n, k), -np.inf, dtype=np.float32)
+    best_ids = np.full((n, k), -1, dtype=np.int64)
+    with ThreadPoolExecutor(max_workers=n_workers) as pool:
+        for results in tqdm(pool.map(search_list, range(n_lists)), total=n_lists, desc="knn_edges"):
+            # merges the neighbors found in this list with the best ones so far
+            for queries, sims, ids in results:
+                best_sims[queries], best_ids[queries] = _top_k(np.concatenate((best_sims[queries], sims), axis=1),
+                                                               np.concatenate((best_ids[queries], ids), axis=1), k)
+
+    src = np.repeat(np.arange(n), k)
+    dst, sims = best_ids.ravel(), best_sims.ravel()
+    found = np.isfinite(sims)
+    return src[found], dst[found], np.clip(sims[found], -1.0, 1.0)
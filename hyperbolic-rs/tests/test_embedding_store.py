@@ -0,0 +1,81 @@
+# Copyright 2017 The Rudders Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import unittest
+import tempfile
+import numpy as np
+from rudders.embedding_store import EmbeddingStore, MATRIX_FILE
+
+
+class TestEmbeddingStore(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = self.tmp_dir.name
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_append_and_reload(self):
+        store = EmbeddingStore(self.path, dims=3)
+        store.append(["a", "b"], np.arange(6).reshape(2, 3))
+        store.append(["c"], np.ones((1, 3)))
+
+        reloaded = EmbeddingStore(self.path)
+
+        self.assertEqual(len(reloaded), 3)
+        self.assertEqual(reloaded.dtype, np.float32)
+        np.testing.assert_allclose(reloaded["b"], [3, 4, 5])
+        np.testing.assert_allclose(reloaded.get(["c", "a"]), [[1, 1, 1], [0, 1, 2]])
+
+    def test_to_arrays_is_memory_mapped(self):
+        store = EmbeddingStore(self.path, dims=2, dtype="float16")
+        store.append(["a", "b"], np.ones((2, 2)))
+
+        ids, embeds = EmbeddingStore(self.path).to_arrays()
+
+        self.assertEqual(ids, ["a", "b"])
+        self.assertIsInstance(embeds, np.memmap)
+        self.assertEqual(embeds.dtype, np.float16)
+
+    def test_last_appended_row_is_kept(self):
+        store = EmbeddingStore(self.path, dims=2)
+        store.append(["a", "b"], np.zeros((2, 2)))
+        store.append(["a"], np.ones((1, 2)))
+
+        ids, embeds = EmbeddingStore(self.path).to_arrays()
+
+        self.assertEqual(ids, ["a", "b"])
+        np.testing.assert_allclose(embeds, [[1, 1], [0, 0]])
+
+    def test_interrupted_append_is_discarded(self):
+        store = EmbeddingStore(self.path, dims=2)
+        store.append(["a"], np.zeros((1, 2)))
+        # simulates rows written without their ids
+        with open(store.path / MATRIX_FILE, "ab") as f:
+            np.ones((3, 2), dtype=np.float32).tofile(f)
+
+        store = EmbeddingStore(self.path)
+        store.append(["b"], np.full((1, 2), 2))
+
+        np.testing.assert_allclose(EmbeddingStore(self.path)["b"], [2, 2])
+
+    def test_wrong_shape_raises(self):
+        store = EmbeddingStore(self.path, dims=2)
+
+        with self.assertRaises(ValueError):
+            store.append(["a"], np.zeros((1, 3)))
+
+    def test_missing_store_without_dims_raises(self):
+        with self.assertRaises(ValueError):
+            EmbeddingStore(self.path)
@@ -0,0 +1,43 @@
+# Copyright 2017 The Rudders Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests of Euclidean operations"""
+import tensorflow as tf
+from rudders.math import euclid
+from rudders.utils import set_seed
+
+
+class TestEuclideanMath(tf.test.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        set_seed(42, set_tf_seed=True)
+        self.dtype = tf.float64
+
+    def get_random(self, shape):
+        return tf.random.uniform(shape, -1, 1, dtype=self.dtype)
+
+    def test_rotation_preserves_norm(self):
+        x = self.get_random((10, 8))
+
+        result = euclid.apply_rotation(self.get_random((10, 8)), x)
+
+        self.assertAllClose(tf.norm(x, axis=-1), tf.norm(result, axis=-1))
+
+    def test_rotation_and_reflection_match_separate_transformations(self):
+        rot, ref, x = self.get_random((10, 8)), self.get_random((10, 8)), self.get_random((10, 8))
+
+        x_rot, x_ref = euclid.apply_rotation_and_reflection(rot, ref, x)
+
+        self.assertAllClose(euclid.apply_rotation(rot, x), x_rot)
+        self.assertAllClose(euclid.apply_reflection(ref, x), x_ref)
@@ -0,0 +1,102 @@
+# Copyright 2017 The Rudders Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import os
+import tempfile
+import unittest
+import networkx as nx
+import numpy as np
+from rudders.graph.analysis import runner
+from rudders.graph.bfs import nodes_per_layer
+from rudders.graph.csr import CSRGraph
+from rudders.graph.utils import largest_connected_component
+
+
+class TestGraphAnalysis(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.graph = nx.disjoint_union(nx.balanced_tree(2, 4), nx.path_graph(3))
+        self.input_path = os.path.join(self.tmp_dir.name, "graph.edgelist")
+        nx.write_edgelist(self.graph, self.input_path, data=False)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_run_stores_statistics_of_largest_component(self):
+        runner.run(self.input_path, ["degrees", "seccurvs", "hyperbolicities"], min_num_nodes=10, n_cpus=2,
+                   stats_kwargs={"hyperbolicities": {"sampling_size": 10000}})
+
+        degrees = np.load(os.path.join(self.tmp_dir.name, "degrees.npy"))
+        self.assertEqual(len(degrees), len(self.graph))
+        values = np.load(os.path.join(self.tmp_dir.name, "hyp-values.npy"))
+        np.testing.assert_array_equal(values, [0.])     # the largest component is a tree
+        seccurvs = np.load(os.path.join(self.tmp_dir.name, "seccurvs.npy"))
+        self.assertGreater(len(seccurvs), 0)
+        self.assertTrue(os.path.isfile(os.path.join(self.tmp_dir.name, "graph+lcc.npz")))
+
+    def test_graph_analysis_shares_distances(self):
+        analysis = runner.GraphAnalysis.from_edgelist(self.input_path, max_bfs_nodes=8, n_cpus=2)
+
+        nodes, dists = analysis.distances()
+
+        self.assertEqual(analysis.graph.n_nodes, 31)
+        self.assertEqual(dists.shape, (8, 31))
+        self.assertIs(analysis.distances()[1], dists)
+
+    def test_graph_analysis_rebuilds_cache_of_changed_edgelist(self):
+        runner.GraphAnalysis.from_edgelist(self.input_path, n_cpus=2)
+        nx.write_edgelist(nx.path_graph(40), self.input_path, data=False)
+
+        analysis = runner.GraphAnalysis.from_edgelist(self.input_path, n_cpus=2)
+
+        self.assertEqual(analysis.graph.n_nodes, 40)
+
+    def test_graph_analysis_min_num_nodes(self):
+        with self.assertRaises(ValueError):
+            runner.GraphAnalysis.from_edgelist(self.input_path, min_num_nodes=100, use_cache=False)
+
+    def test_largest_connected_component_from_edge_columns(self):
+        heads = np.array([10, 20, 30, 30, 50, 60, 20, 70])
+        tails = np.array([20, 30, 10, 10, 60, 60, 40, 70])     # repeated edge and self loops
+
+        graph, node_ids = largest_connected_component(heads, tails)
+
+        np.testing.assert_array_equal(node_ids, [10, 20, 30, 40])
+        self.assertEqual(graph.n_edges, 4)
+        np.testing.assert_array_equal(graph.neighbors(1), [0, 2, 3])
+        np.testing.assert_array_equal(graph.degrees(), [2, 3, 2, 1])
+
+    def test_graph_analysis_from_edges_keeps_degrees_of_all_nodes(self):
+        heads, tails = np.array([0, 1, 5, 2]), np.array([1, 2, 6, 0])
+
+        analysis, node_ids = runner.GraphAnalysis.from_edges(heads, tails)
+
+        np.testing.assert_array_equal(node_ids, [0, 1, 2])
+        np.testing.assert_array_equal(analysis.degrees(), [2, 2, 2, 1, 1])
+
+    def test_nodes_per_layer_matches_shortest_paths(self):
+        graph = nx.gnm_random_graph(150, 300, seed=42)
+
+        result = nodes_per_layer(CSRGraph.from_networkx(graph), n_cpus=2, groups_per_task=1)
+
+        lengths = [d for _, dists in nx.all_pairs_shortest_path_length(graph) for d in dists.values()]
+        np.testing.assert_array_equal(result, np.bincount(lengths)[1:])
+
+    def test_run_stores_layer_nodes_of_sampled_sources(self):
+        runner.run(self.input_path, ["layer_nodes"], min_num_nodes=10, n_cpus=2,
+                   stats_kwargs={"layer_nodes": {"max_sources": 10}})
+
+        result = np.load(os.path.join(self.tmp_dir.name, "layer-nodes.npy"))
+        self.assertEqual(result.sum(), 10 * 30)     # each source reaches the other 30 nodes of the component
+        self.assertLessEqual(len(result), 8)     # diameter of the balanced tree
@@ -77,3 +77,56 @@ class TestHyperbolicMath(tf.test.TestCase):
 
         self.assertShapeEqual(np.ndarray((3, 10)), expected)
         self.assertAllClose(expected, result)
+
+    def test_distance_all_pairs_matches_distance_of_each_pair(self):
+        x = tf.clip_by_norm(tf.random.uniform((7, 16), -1, 1, dtype=tf.float64), clip_norm=0.99, axes=-1)
+        y = tf.clip_by_norm(tf.random.uniform((5, 16), -1, 1, dtype=tf.float64), clip_norm=0.99, axes=-1)
+
+        result = hyperb.hyp_distance_all_pairs(x, y, self.c)
+
+        expected = hyperb.hyp_distance(tf.expand_dims(x, 1), tf.expand_dims(y, 0), self.c)[:, :, 0]
+        self.assertAllClose(expected, result)
+
+    def test_distance_batch_rhs_matches_distance_of_each_pair(self):
+        x = tf.clip_by_norm(tf.random.uniform((7, 16), -1, 1, dtype=tf.float64), clip_norm=0.99, axes=-1)
+        y = tf.clip_by_norm(tf.random.uniform((7, 5, 16), -1, 1, dtype=tf.float64), clip_norm=0.99, axes=-1)
+
+        result = hyperb.hyp_distance_batch_rhs(x, y, self.c)
+
+        expected = hyperb.hyp_distance(tf.expand_dims(x, 1), y, self.c)[:, :, 0]
+        self.assertShapeEqual(np.ndarray((7, 5)), result)
+        self.assertAllClose(expected, result)
+
+    def test_expmap_at_origin_is_expmap0(self):
+        u = tf.random.uniform((7, 16), -1, 1, dtype=tf.float64)
+
+        result = hyperb.expmap(tf.zeros_like(u), u, self.c)
+
+        self.assertAllClose(hyperb.expmap0(u, self.c), result)
+
+    def test_expmap_moves_the_riemannian_norm_of_the_tangent_vector(self):
+        x = tf.clip_by_norm(tf.random.uniform((7, 16), -1, 1, dtype=tf.float64), clip_norm=0.7, axes=-1)
+        u = tf.random.uniform((7, 16), -0.1, 0.1, dtype=tf.float64)
+
+        result = hyperb.hyp_distance(x, hyperb.expmap(x, u, self.c), self.c)
+
+        expected = hyperb.lambda_x(x, self.c) * tf.norm(u, axis=-1, keepdims=True)
+        self.assertAllClose(expected, result)
+
+    def test_parallel_transport_preserves_the_riemannian_norm(self):
+        x = tf.clip_by_norm(tf.random.uniform((7, 16), -1, 1, dtype=tf.float64), clip_norm=0.9, axes=-1)
+        y = tf.clip_by_norm(tf.random.uniform((7, 16), -1, 1, dtype=tf.float64), clip_norm=0.9, axes=-1)
+        v = tf.random.uniform((7, 16), -1, 1, dtype=tf.float64)
+
+        result = hyperb.parallel_transport(x, y, v, self.c)
+
+        self.assertAllClose(hyperb.lambda_x(x, self.c) * tf.norm(v, axis=-1, keepdims=True),
+                            hyperb.lambda_x(y, self.c) * tf.norm(result, axis=-1, keepdims=True))
+
+    def test_parallel_transport_to_the_same_point_is_the_identity(self):
+        x = tf.clip_by_norm(tf.random.uniform((7, 16), -1, 1, dtype=tf.float64), clip_norm=0.9, axes=-1)
+        v = tf.random.uniform((7, 16), -1, 1, dtype=tf.float64)
+
+        result = hyperb.parallel_transport(x, x, v, self.c)
+
+        self.assertAllClose(v, result)
@@ -0,0 +1,66 @@
+# Copyright 2017 The Rudders Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import itertools
+import unittest
+import networkx as nx
+import numpy as np
+from rudders.graph.csr import CSRGraph
+from rudders.graph.hyperbolicity import quadruple_hyperbolicities, sample_quadruples, hyperbolicity_distribution
+
+
+class TestHyperbolicity(unittest.TestCase):
+
+    def test_quadruple_hyperbolicities_matches_definition(self):
+        graph = nx.cycle_graph(9)
+        dists = np.array(nx.floyd_warshall_numpy(graph), dtype=np.uint16)
+        quadruples = np.array(list(itertools.combinations(range(9), 4)))
+
+        result = quadruple_hyperbolicities(dists, quadruples)
+
+        for (a, b, c, d), h in zip(quadruples, result):
+            sums = sorted([dists[a, b] + dists[c, d], dists[a, c] + dists[b, d], dists[a, d] + dists[b, c]])
+            self.assertEqual(h, sums[2] - sums[1])
+
+    def test_sample_quadruples_have_different_nodes(self):
+        quadruples = sample_quadruples(6, 1000, np.random.RandomState(42))
+
+        self.assertGreater(len(quadruples), 0)
+        for quadruple in quadruples:
+            self.assertEqual(len(set(quadruple.tolist())), 4)
+
+    def test_hyperbolicity_distribution_of_tree_is_zero(self):
+        graph = CSRGraph.from_networkx(nx.convert_node_labels_to_integers(nx.balanced_tree(2, 4)))
+
+        values, counts = hyperbolicity_distribution(graph, sampling_size=10000, samples_per_task=2000, n_cpus=2)
+
+        np.testing.assert_array_equal(values, [0.])
+        self.assertGreater(counts[0], 0)
+
+    def test_hyperbolicity_distribution_of_cycle(self):
+        graph = CSRGraph.from_networkx(nx.cycle_graph(8))
+
+        values, counts = hyperbolicity_distribution(graph, sampling_size=20000, samples_per_task=5000, tolerance=0,
+                                                    n_cpus=2)
+
+        self.assertEqual(values.max(), 2.)     # the max delta of a cycle of length 8 is 8 / 4
+        self.assertEqual(len(values), len(counts))
+
+    def test_hyperbolicity_distribution_counts_are_scaled_to_sampling_size(self):
+        graph = CSRGraph.from_networkx(nx.cycle_graph(8))
+
+        # a high tolerance stops sampling after the first round
+        values, counts = hyperbolicity_distribution(graph, sampling_size=int(1e6), samples_per_task=5000, tolerance=2,
+                                                    n_cpus=2)
+
+        self.assertAlmostEqual(counts.sum(), 1e6, delta=len(counts))
@@ -0,0 +1,85 @@
+# Copyright 2017 The Rudders Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Parity of the NumPy inference models with the TF models"""
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+import tensorflow as tf
+import rudders.models as models
+from rudders.inference import export_model, load_model
+from rudders.relations import Relations
+from rudders.utils import set_seed
+from tests.test_models import get_flags
+
+MODEL_CLASSES = ('MLP', 'DistMul', 'BPR', 'TransE', 'TransH', 'MuREuclidean', 'RotRefEuclidean',
+                 'UserAttentiveEuclidean', 'HyperML', 'MuRHyperbolic', 'RotRefHyperbolic', 'UserAttentiveHyperbolic',
+                 'ComplexProd', 'RotatE')
+
+
+class TestInference(tf.test.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        set_seed(42, set_tf_seed=True)
+        tf.keras.backend.set_floatx("float64")
+        self.n_entities = 11
+        self.item_ids = list(range(4, self.n_entities))
+        self.triplets = tf.convert_to_tensor([[0, Relations.USER_ITEM.value, 5], [3, Relations.USER_ITEM.value, 9],
+                                              [1, 2, 6], [6, 1, 4]])
+
+    def get_models(self, model_class, **kwargs):
+        """:return: TF model with random weights, and the NumPy model loaded from its export"""
+        model = getattr(models, model_class)(self.n_entities, 3, self.item_ids, get_flags(**kwargs))
+        model.build(input_shape=(1, 3))
+        model.training = False
+        for weight in model.weights:
+            if weight.trainable or "ui_weights" in weight.name:
+                weight.assign(tf.random.uniform(weight.shape, -0.5, 0.5, dtype=weight.dtype))
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = Path(tmp_dir) / "model.npz"
+            export_model(model, path)
+            return model, load_model(path)
+
+    def assert_same_scores(self, model, np_model, msg):
+        self.assertAllClose(model.get_lhs(self.triplets), np_model.get_lhs(self.triplets.numpy()), msg=msg)
+        self.assertAllClose(model.get_rhs(self.triplets), np_model.get_rhs(self.triplets.numpy()), msg=msg)
+        self.assertAllClose(model(self.triplets), np_model(self.triplets.numpy()), msg=msg)
+        self.assertAllClose(model(self.triplets, all_items=True), np_model(self.triplets.numpy(), all_items=True),
+                            msg=msg)
+        self.assertAllClose(model.score_relations([0, 3, 5], [0, 2, 1], [4, 10, 6, 5], chunk_size=3),
+                            np_model.score_relations([0, 3, 5], [0, 2, 1], [4, 10, 6, 5], chunk_size=3), msg=msg)
+
+    def test_all_models_match_tf_models(self):
+        for model_class in MODEL_CLASSES:
+            model, np_model = self.get_models(model_class)
+
+            self.assertEqual(type(np_model).__name__, model_class)
+            self.assert_same_scores(model, np_model, model_class)
+
+    def test_hyperbolic_variants_match_tf_models(self):
+        for model_class in ('MuRHyperbolic', 'RotRefHyperbolic', 'UserAttentiveHyperbolic'):
+            model, np_model = self.get_models(model_class, hyperbolic_model='lorentz')
+            self.assert_same_scores(model, np_model, model_class)
+
+        model, np_model = self.get_models('HyperML', ball_embeddings=True)
+        model.entities.embeddings.assign(model.entities.embeddings / 2)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            export_model(model, Path(tmp_dir) / "model.npz")
+            np_model = load_model(Path(tmp_dir) / "model.npz")
+        self.assert_same_scores(model, np_model, 'HyperML')
+
+    def test_inference_does_not_import_tensorflow(self):
+        code = "import sys, rudders.inference; assert 'tensorflow' not in sys.modules"
+        subprocess.run([sys.executable, "-c", code], check=True, cwd=Path(__file__).parent.parent)
@@ -12,7 +12,9 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 import unittest
+from concurrent.futures import ThreadPoolExecutor
 import item_graph
+from rudders.graph.csr import CSRGraph
 import tensorflow as tf
 import numpy as np
 
@@ -61,3 +63,52 @@ class TestItemGraph(unittest.TestCase):
             self.assertEqual(edge[2]["weight"], 1)
         self.assertIn("a", graph.nodes())
         self.assertIn("b", graph.nodes())
+
+    def test_get_neighbors_with_distances(self):
+        graph = CSRGraph.from_edges([0, 0], [1, 2], weights=[0.1, 0.2], n_nodes=4)
+
+        neighs = item_graph.get_neighbors_with_distances(graph, ["a", "b", "c", "d"])
+
+        self.assertEqual(set(neighs.keys()), {"a", "b", "c"})
+        self.assertEqual([iid for iid, _ in neighs["a"]], ["b", "c"])
+        self.assertAlmostEqual(neighs["a"][1][1], 0.2, places=5)
+        self.assertEqual([iid for iid, _ in neighs["c"]], ["a"])
+
+    def fake_encode(self, sents):
+        """Deterministic sentence embedding: each sentence is mapped to [len(sent), number of words]"""
+        return np.array([[len(s), len(s.split())] for s in sents], dtype=np.float32)
+
+    def test_embed_items_matches_weighted_mean_per_item(self):
+        item_sents = [["a title", "some text here"], ["single"], ["x", "y y", "z z z"]]
+
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            result = item_graph.embed_items(item_sents, self.fake_encode, pool, batch_size=2, first_embed_weight=2)
+
+        for i, sents in enumerate(item_sents):
+            weights = np.ones(len(sents))
+            weights[0] = 2
+            weights = np.exp(weights) / np.sum(np.exp(weights))
+            expected = np.sum(weights[:, None] * self.fake_encode(sents), axis=0)
+            np.testing.assert_allclose(result[i], expected, rtol=1e-5)
+
+    def test_embed_items_item_without_sentences(self):
+        item_sents = [["a title"], [], ["other"]]
+
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            result = item_graph.embed_items(item_sents, self.fake_encode, pool, batch_size=8, first_embed_weight=1)
+
+        self.assertEqual(result.shape, (3, 2))
+        np.testing.assert_allclose(result[1], [0, 0])
+        np.testing.assert_allclose(result[2], self.fake_encode(["other"])[0])
+
+    def test_embed_items_without_any_sentence(self):
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            result = item_graph.embed_items([[], []], self.fake_encode, pool, batch_size=8, first_embed_weight=1)
+
+        np.testing.assert_allclose(result, np.zeros((2, 2)))
+
+    def test_build_item_embeds_without_items(self):
+        iids, embeds = item_graph.build_item_embeds({}, use_url="unused")
+
+        self.assertEqual(iids, [])
+        self.assertEqual(len(embeds), 0)
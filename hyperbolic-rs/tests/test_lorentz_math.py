@@ -0,0 +1,107 @@
+# Copyright 2017 The Rudders Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests of Lorentz model operations, checked against the ones of the Poincare ball"""
+import numpy as np
+import tensorflow as tf
+from rudders.math import hyperb, lorentz
+from rudders.utils import set_seed
+
+
+class TestLorentzMath(tf.test.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        set_seed(42, set_tf_seed=True)
+        self.dtype = tf.float64
+        self.c = tf.convert_to_tensor([0.7], dtype=self.dtype)
+
+    def get_tangent(self, shape):
+        return tf.random.uniform(shape, -0.5, 0.5, dtype=self.dtype)
+
+    def test_expmap0_gives_points_of_the_hyperboloid(self):
+        x = lorentz.expmap0(self.get_tangent((7, 16)), self.c)
+
+        self.assertAllClose(tf.fill((7, 1), tf.constant(-1., dtype=self.dtype) / self.c), lorentz.minkowski_dot(x, x))
+
+    def test_expmap0_matches_poincare_expmap0(self):
+        u = self.get_tangent((7, 16))
+
+        result = lorentz.to_poincare(lorentz.expmap0(u, self.c), self.c)
+
+        self.assertAllClose(hyperb.expmap0(u, self.c), result)
+
+    def test_logmap0_is_the_inverse_of_expmap0(self):
+        u = self.get_tangent((7, 16))
+
+        self.assertAllClose(u, lorentz.logmap0(lorentz.expmap0(u, self.c), self.c))
+
+    def test_poincare_conversion_roundtrip(self):
+        x = lorentz.expmap0(self.get_tangent((7, 16)), self.c)
+
+        self.assertAllClose(x, lorentz.from_poincare(lorentz.to_poincare(x, self.c), self.c))
+
+    def test_mobius_add_matches_poincare_mobius_add(self):
+        x, y = self.get_tangent((7, 16)), self.get_tangent((7, 16))
+
+        result = lorentz.mobius_add(lorentz.expmap0(x, self.c), lorentz.expmap0(y, self.c), self.c)
+
+        expected = hyperb.mobius_add(hyperb.expmap0(x, self.c), hyperb.expmap0(y, self.c), self.c)
+        self.assertAllClose(expected, lorentz.to_poincare(result, self.c))
+
+    def test_distance_matches_poincare_distance(self):
+        x, y = self.get_tangent((7, 16)), self.get_tangent((7, 16))
+
+        result = lorentz.hyp_distance(lorentz.expmap0(x, self.c), lorentz.expmap0(y, self.c), self.c)
+
+        expected = hyperb.hyp_distance(hyperb.expmap0(x, self.c), hyperb.expmap0(y, self.c), self.c)
+        self.assertAllClose(expected, result)
+
+    def test_distance_to_same_point_is_zero(self):
+        x = lorentz.expmap0(self.get_tangent((7, 16)), self.c)
+
+        self.assertAllClose(tf.zeros((7, 1), dtype=self.dtype), lorentz.hyp_distance(x, x, self.c))
+
+    def test_distance_all_pairs_matches_distance_of_each_pair(self):
+        x = lorentz.expmap0(self.get_tangent((7, 16)), self.c)
+        y = lorentz.expmap0(self.get_tangent((5, 16)), self.c)
+
+        result = lorentz.hyp_distance_all_pairs(x, y, self.c)
+
+        expected = lorentz.hyp_distance(tf.expand_dims(x, 1), tf.expand_dims(y, 0), self.c)[:, :, 0]
+        self.assertShapeEqual(np.ndarray((7, 5)), result)
+        self.assertAllClose(expected, result)
+
+    def test_distance_batch_rhs_matches_distance_of_each_pair(self):
+        x = lorentz.expmap0(self.get_tangent((7, 16)), self.c)
+        y = lorentz.expmap0(self.get_tangent((7, 5, 16)), self.c)
+
+        result = lorentz.hyp_distance_batch_rhs(x, y, self.c)
+
+        expected = lorentz.hyp_distance(tf.expand_dims(x, 1), y, self.c)[:, :, 0]
+        self.assertShapeEqual(np.ndarray((7, 5)), result)
+        self.assertAllClose(expected, result)
+
+    def test_float32_distance_far_from_the_origin(self):
+        # points at distance ~10 from the origin, where the Poincare ball clips them in float32
+        u = tf.random.uniform((7, 16), -1, 1, dtype=tf.float64)
+        u = 5 * u / tf.norm(u, axis=-1, keepdims=True)
+        v = u + tf.random.uniform((7, 16), -0.2, 0.2, dtype=tf.float64)
+        c = tf.constant([1.], dtype=tf.float64)
+
+        result = lorentz.hyp_distance(lorentz.expmap0(tf.cast(u, tf.float32), tf.cast(c, tf.float32)),
+                                      lorentz.expmap0(tf.cast(v, tf.float32), tf.cast(c, tf.float32)),
+                                      tf.cast(c, tf.float32))
+
+        expected = lorentz.hyp_distance(lorentz.expmap0(u, c), lorentz.expmap0(v, c), c)
+        self.assertAllClose(expected, tf.cast(result, tf.float64), rtol=1e-2, atol=1e-2)
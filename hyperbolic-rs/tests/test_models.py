@@ -0,0 +1,146 @@
+# Copyright 2017 The Rudders Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import tensorflow as tf
+from collections import namedtuple
+from rudders.models import MLP, HyperML, MuREuclidean, MuRHyperbolic, RotRefHyperbolic, TransH, \
+    UserAttentiveEuclidean, UserAttentiveHyperbolic
+from rudders.relations import Relations
+from rudders.utils import set_seed
+
+
+def get_flags(dims=8, items_chunk_size=3, ball_embeddings=False, hyperbolic_model='poincare'):
+    Flags = namedtuple("Flags", ['initializer', 'regularizer', 'dims', 'entity_reg', 'relation_reg', 'train_bias',
+                                 'dropout', 'curvature', 'train_c', 'ui_weight', 'train_ui_weight',
+                                 'items_chunk_size', 'ball_embeddings', 'hyperbolic_model'])
+    return Flags(initializer='RandomUniform', regularizer='l2', dims=dims, entity_reg=0, relation_reg=0,
+                 train_bias=True, dropout=0, curvature=1., train_c=False, ui_weight=0.75, train_ui_weight=False,
+                 items_chunk_size=items_chunk_size, ball_embeddings=ball_embeddings, hyperbolic_model=hyperbolic_model)
+
+
+class TestModels(tf.test.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        set_seed(42, set_tf_seed=True)
+        tf.keras.backend.set_floatx("float64")
+        self.n_users = 4
+        self.item_ids = list(range(self.n_users, self.n_users + 7))
+        self.n_relations = 3
+        self.users = tf.convert_to_tensor([[0, Relations.USER_ITEM.value, 5], [3, Relations.USER_ITEM.value, 9]])
+
+    def get_model(self, model_class, **kwargs):
+        model = model_class(self.n_users + len(self.item_ids), self.n_relations, self.item_ids, get_flags(**kwargs))
+        model.build(input_shape=(1, 3))
+        model.training = False
+        # random biases and ui weights, so they are also checked
+        model.bias_tail.embeddings.assign(tf.random.uniform(model.bias_tail.embeddings.shape, dtype=tf.float64))
+        if hasattr(model, "ui_weights"):
+            model.ui_weights.embeddings.assign(tf.random.uniform(model.ui_weights.embeddings.shape, dtype=tf.float64))
+        return model
+
+    def assert_all_items_scores_match_triplet_scores(self, model):
+        scores = model(self.users, all_items=True).numpy()
+
+        self.assertEqual(scores.shape, (2, len(self.item_ids)))
+        for j, item_id in enumerate(self.item_ids):
+            triplets = self.users.numpy()
+            triplets[:, -1] = item_id
+            expected = model(tf.convert_to_tensor(triplets)).numpy()
+            self.assertAllClose(scores[:, j:j + 1], expected)
+
+    def test_user_attentive_euclidean_all_items_scores(self):
+        self.assert_all_items_scores_match_triplet_scores(self.get_model(UserAttentiveEuclidean))
+
+    def test_user_attentive_hyperbolic_all_items_scores(self):
+        self.assert_all_items_scores_match_triplet_scores(self.get_model(UserAttentiveHyperbolic))
+
+    def test_mlp_all_items_scores(self):
+        model = self.get_model(MLP)
+        model(self.users)     # builds the dense layers
+
+        self.assert_all_items_scores_match_triplet_scores(model)
+
+    def test_frozen_model_caches_item_projections(self):
+        model = self.get_model(MLP)
+        model(self.users)
+
+        with model.frozen():
+            scores = model(self.users, all_items=True)
+            self.assertIn("item_projections", model.frozen_cache)
+            kernel = model.dense_1.kernel
+            model.dense_1.kernel.assign(tf.concat((kernel[:model.dims], tf.zeros_like(kernel[model.dims:])), axis=0))
+            self.assertAllClose(scores, model(self.users, all_items=True))     # uses the cached projections
+
+        self.assertEqual(len(model.frozen_cache), 0)
+        self.assertNotAllClose(scores, model(self.users, all_items=True))
+
+    def test_frozen_model_caches_relation_tables(self):
+        for model_class, keys in ((RotRefHyperbolic, ["relation_givens", "hyperbolic_relations"]),
+                                  (TransH, ["relation_norm_vectors"])):
+            model = self.get_model(model_class)
+            expected = model(self.users, all_items=True)
+
+            with model.frozen():
+                result = model(self.users, all_items=True)
+                for key in keys:
+                    self.assertIn(key, model.frozen_cache)
+
+            self.assertAllClose(expected, result)
+
+    def test_score_relations_matches_triplet_scores(self):
+        heads, relations, candidates = [0, 3, 5], [0, 2, 1], [4, 10, 6, 5, 8]
+        for model_class in (MLP, MuREuclidean, TransH, RotRefHyperbolic, UserAttentiveEuclidean,
+                            UserAttentiveHyperbolic):
+            model = self.get_model(model_class)
+            model(self.users)
+
+            scores = model.score_relations(heads, relations, candidates, chunk_size=2).numpy()
+
+            self.assertEqual(scores.shape, (3, 3, 5))
+            for j, relation in enumerate(relations):
+                for k, candidate in enumerate(candidates):
+                    triplets = tf.convert_to_tensor([[head, relation, candidate] for head in heads])
+                    self.assertAllClose(scores[:, j, k:k + 1], model(triplets).numpy(), msg=model_class.__name__)
+
+    def test_score_relations_defaults_to_all_items(self):
+        model = self.get_model(UserAttentiveEuclidean)
+
+        scores = model.score_relations([0, 3], [Relations.USER_ITEM.value])
+
+        self.assertAllClose(scores[:, 0], model(self.users, all_items=True))
+
+    def test_frozen_hyperbolic_model_maps_entity_table_once(self):
+        for model_class in (HyperML, MuRHyperbolic):
+            model = self.get_model(model_class)
+            expected_triplets, expected_all = model(self.users), model(self.users, all_items=True)
+
+            with model.frozen():
+                result_triplets, result_all = model(self.users), model(self.users, all_items=True)
+                self.assertIn("ball_entities", model.frozen_cache)
+
+            self.assertAllClose(expected_triplets, result_triplets)
+            self.assertAllClose(expected_all, result_all)
+
+    def test_lorentz_models_match_poincare_models(self):
+        for model_class in (HyperML, MuRHyperbolic, RotRefHyperbolic, UserAttentiveHyperbolic):
+            poincare = self.get_model(model_class)
+            lorentz = self.get_model(model_class, hyperbolic_model='lorentz')
+            lorentz.set_weights(poincare.get_weights())
+
+            self.assertAllClose(poincare(self.users), lorentz(self.users), msg=model_class.__name__)
+            self.assertAllClose(poincare(self.users, all_items=True), lorentz(self.users, all_items=True),
+                                msg=model_class.__name__)
+            self.assertAllClose(poincare.score_relations([0, 3], [0, 2, 1], [4, 10, 6]),
+                                lorentz.score_relations([0, 3], [0, 2, 1], [4, 10, 6]), msg=model_class.__name__)
+            self.assert_all_items_scores_match_triplet_scores(lorentz)
@@ -0,0 +1,129 @@
+# Copyright 2017 The Rudders Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import tensorflow as tf
+from rudders.math import hyperb
+from rudders.models import HyperML, MuRHyperbolic
+from rudders.optimizers import RiemannianOptimizer
+from rudders.relations import Relations
+from rudders.utils import set_seed
+from tests.test_models import get_flags
+
+
+class TestRiemannianOptimizer(tf.test.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        set_seed(42, set_tf_seed=True)
+        tf.keras.backend.set_floatx("float64")
+        self.c = tf.convert_to_tensor([1.0], dtype=tf.float64)
+        self.points = tf.Variable(hyperb.project(tf.random.uniform((6, 4), -0.5, 0.5, dtype=tf.float64), self.c))
+        self.other = tf.Variable(tf.ones((3,), dtype=tf.float64))
+
+    def get_optimizer(self, method, lr=0.1, points=None):
+        points = self.points if points is None else points
+        return RiemannianOptimizer(tf.keras.optimizers.SGD(learning_rate=lr), [points], lambda: self.c, method=method)
+
+    def test_rsgd_follows_the_exponential_map(self):
+        optimizer = self.get_optimizer('rsgd')
+        x = tf.convert_to_tensor(self.points)
+        grad = tf.random.uniform(x.shape, -1, 1, dtype=tf.float64)
+
+        optimizer.apply_gradients([(grad, self.points), (tf.ones((3,), dtype=tf.float64), self.other)])
+
+        expected = hyperb.expmap(x, -0.1 * hyperb.egrad2rgrad(x, grad, self.c), self.c)
+        self.assertAllClose(expected, self.points)
+        self.assertAllClose([0.9, 0.9, 0.9], self.other)
+
+    def test_sparse_gradients_only_update_their_rows(self):
+        for method in ('rsgd', 'radam'):
+            optimizer = self.get_optimizer(method)
+            x = tf.convert_to_tensor(self.points)
+            values = tf.random.uniform((3, 4), -1, 1, dtype=tf.float64)
+            grad = tf.IndexedSlices(values, tf.constant([4, 1, 4]), dense_shape=tf.constant([6, 4]))
+            dense_points = tf.Variable(x)
+            dense_optimizer = self.get_optimizer(method, points=dense_points)
+
+            optimizer.apply_gradients([(grad, self.points)])
+            dense_optimizer.apply_gradients([(tf.convert_to_tensor(grad), dense_points)])
+
+            self.assertAllClose(x.numpy()[[0, 2, 3, 5]], self.points.numpy()[[0, 2, 3, 5]])
+            self.assertNotAllClose(x.numpy()[[1, 4]], self.points.numpy()[[1, 4]])
+            self.assertAllClose(dense_points.numpy()[[1, 4]], self.points.numpy()[[1, 4]])
+            self.points.assign(x)
+
+    def test_radam_keeps_points_in_the_ball(self):
+        optimizer = self.get_optimizer('radam', lr=1.)
+
+        for _ in range(20):
+            optimizer.apply_gradients([(-self.points * 100, self.points)])
+
+        norms = tf.norm(self.points, axis=-1)
+        self.assertAllLess(norms, 1.)
+        self.assertAllGreater(norms, 0.9)
+
+    def test_unknown_method_raises(self):
+        with self.assertRaises(ValueError):
+            self.get_optimizer('sgd')
+
+
+class TestBallEmbeddings(tf.test.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        set_seed(42, set_tf_seed=True)
+        tf.keras.backend.set_floatx("float64")
+        self.n_entities = 11
+        self.item_ids = list(range(4, self.n_entities))
+        self.triplets = tf.convert_to_tensor([[0, Relations.USER_ITEM.value, 5], [3, Relations.USER_ITEM.value, 9],
+                                              [1, Relations.USER_ITEM.value, 6], [2, Relations.USER_ITEM.value, 4]])
+
+    def get_model(self):
+        model = HyperML(self.n_entities, 3, self.item_ids, get_flags(ball_embeddings=True))
+        model.build(input_shape=(1, 3))
+        return model
+
+    def test_entities_are_used_as_points_of_the_ball(self):
+        model = self.get_model()
+
+        lhs = model.get_lhs(self.triplets)
+
+        self.assertEqual(model.ball_variables(), [model.entities.embeddings])
+        self.assertAllClose(tf.gather(model.entities.embeddings, self.triplets[:, 0]), lhs)
+        with model.frozen():
+            self.assertAllClose(lhs, model.get_lhs(self.triplets))
+
+    def test_training_reduces_the_loss(self):
+        model = self.get_model()
+        optimizer = RiemannianOptimizer(tf.keras.optimizers.Adam(learning_rate=0.05), model.ball_variables(),
+                                        model.get_c, method='radam')
+        labels = tf.constant([[1.], [1.], [1.], [1.]], dtype=tf.float64)
+
+        @tf.function
+        def train_step():
+            with tf.GradientTape() as tape:
+                loss = tf.reduce_mean(tf.nn.sigmoid_cross_entropy_with_logits(labels, model(self.triplets)))
+            gradients = tape.gradient(loss, model.trainable_variables)
+            optimizer.apply_gradients(zip(gradients, model.trainable_variables))
+            return loss
+
+        initial_loss = train_step()
+        for _ in range(30):
+            loss = train_step()
+
+        self.assertLess(loss, initial_loss)
+        self.assertAllLess(tf.norm(model.entities.embeddings, axis=-1), 1.)
+
+    def test_models_with_tangent_entities_do_not_support_ball_embeddings(self):
+        with self.assertRaises(ValueError):
+            MuRHyperbolic(self.n_entities, 3, self.item_ids, get_flags(ball_embeddings=True))
@@ -0,0 +1,74 @@
+# Copyright 2017 The Rudders Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import unittest
+import networkx as nx
+import numpy as np
+from scipy.optimize import linprog
+from rudders.graph.csr import CSRGraph
+from rudders.graph.ricci import edge_curvatures, ricci_curvature
+
+
+class TestRicci(unittest.TestCase):
+
+    def setUp(self):
+        self.nx_graph = nx.convert_node_labels_to_integers(nx.karate_club_graph())
+        self.graph = CSRGraph.from_networkx(self.nx_graph)
+        self.dists = dict(nx.all_pairs_shortest_path_length(self.nx_graph))
+
+    def exact_curvature(self, x, y, alpha):
+        """Ollivier-Ricci curvature solving the optimal transport with a linear program"""
+        src, dst = [x] + list(self.nx_graph[x]), [y] + list(self.nx_graph[y])
+        src_masses = np.array([alpha] + [(1 - alpha) / (len(src) - 1)] * (len(src) - 1))
+        dst_masses = np.array([alpha] + [(1 - alpha) / (len(dst) - 1)] * (len(dst) - 1))
+        costs = np.array([[self.dists[u][v] for v in dst] for u in src], dtype=np.float64)
+        n, m = costs.shape
+        row_constraints = np.kron(np.eye(n), np.ones((1, m)))
+        col_constraints = np.kron(np.ones((1, n)), np.eye(m))
+        result = linprog(costs.ravel(), A_eq=np.concatenate((row_constraints, col_constraints)),
+                         b_eq=np.concatenate((src_masses, dst_masses)), bounds=(0, None))
+        return 1 - result.fun
+
+    def test_edge_curvatures_match_exact_transport(self):
+        src, dst, _ = self.graph.edges()
+        src, dst = src[::3], dst[::3]
+
+        for alpha in [0., 0.5]:
+            result = edge_curvatures(self.graph, src, dst, alpha=alpha)
+
+            expected = [self.exact_curvature(x, y, alpha) for x, y in zip(src, dst)]
+            np.testing.assert_allclose(result, expected, atol=1e-3)
+
+    def test_edge_curvatures_with_sampled_neighborhoods(self):
+        src, dst, _ = self.graph.edges()
+        degrees = self.graph.degrees()
+
+        # each node keeps at most 7 neighbors, while the hubs of the graph have 16 and 17
+        result = edge_curvatures(self.graph, src, dst, alpha=0.5, max_batch_elements=64)
+
+        self.assertTrue(np.all(np.isfinite(result)))
+        self.assertTrue(np.all((result >= -2) & (result <= 1)))
+        small = np.flatnonzero((degrees[src] <= 7) & (degrees[dst] <= 7))
+        self.assertGreater(len(small), 0)
+        expected = [self.exact_curvature(src[i], dst[i], 0.5) for i in small]
+        np.testing.assert_allclose(result[small], expected, atol=1e-3)
+
+    def test_ricci_curvature_nodes_are_mean_of_edges(self):
+        edges, edge_curvs, node_curvs = ricci_curvature(self.graph, alpha=0.5, edges_per_task=16, n_cpus=2)
+
+        self.assertEqual(edges.shape, (self.graph.n_edges, 2))
+        self.assertTrue(np.all(edges[:, 0] < edges[:, 1]))
+        for node in [0, 5, 33]:
+            incident = np.any(edges == node, axis=1)
+            self.assertAlmostEqual(node_curvs[node], edge_curvs[incident].mean())
+        self.assertAlmostEqual(edge_curvs[0], self.exact_curvature(edges[0, 0], edges[0, 1], 0.5), places=3)
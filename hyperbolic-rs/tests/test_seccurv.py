@@ -0,0 +1,102 @@
+# Copyright 2017 The Rudders Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import unittest
+import networkx as nx
+import numpy as np
+from rudders.graph.seccurv import compute_sectional_curvatures, sample_neighbor_pairs, sectional_curvatures
+from rudders.graph.bfs import multi_source_bfs
+from rudders.graph.csr import CSRGraph
+
+
+class TestSeccurv(unittest.TestCase):
+
+    def setUp(self):
+        self.graph = nx.convert_node_labels_to_integers(nx.balanced_tree(3, 3))
+        self.dists = np.array(nx.floyd_warshall_numpy(self.graph), dtype=np.float32)
+        self.n_nodes = self.graph.number_of_nodes()
+        self.csr = CSRGraph.from_networkx(self.graph)
+
+    def loop_sectional_curvatures(self, m):
+        """Reference implementation with one triangle at a time, using all nodes as reference nodes"""
+        neighs = list(self.graph[m])
+        seccurvs = []
+        for i in range(len(neighs)):
+            for j in range(i + 1, len(neighs)):
+                b, c = neighs[i], neighs[j]
+                xis = []
+                for a in range(self.n_nodes):
+                    if a == m: continue
+                    d = self.dists
+                    xi = d[a][m] ** 2 + d[b][c] ** 2 / 4 - (d[a][b] ** 2 + d[a][c] ** 2) / 2
+                    xis.append(xi / d[a][m] / 2)
+                seccurvs.append(np.mean(xis))
+        return seccurvs
+
+    def test_compute_sectional_curvatures_matches_loop(self):
+        for m in [0, 1, 5]:
+            result = compute_sectional_curvatures(self.csr, np.arange(self.n_nodes), self.dists, self.n_nodes,
+                                                  int(1e4), m, max_block_size=50)
+
+            np.testing.assert_allclose(result, self.loop_sectional_curvatures(m), rtol=1e-6)
+
+    def test_compute_sectional_curvatures_with_sampled_distances(self):
+        ref_nodes = np.arange(0, self.n_nodes, 2)
+        ref_dists = multi_source_bfs(self.csr, ref_nodes)
+
+        result = compute_sectional_curvatures(self.csr, ref_nodes, ref_dists, len(ref_nodes), int(1e4), 1)
+
+        expected = compute_sectional_curvatures(self.csr, ref_nodes, self.dists[ref_nodes], len(ref_nodes), int(1e4), 1)
+        np.testing.assert_allclose(result, expected, rtol=1e-6)
+
+    def test_multi_source_bfs_matches_shortest_paths(self):
+        graph = nx.gnm_random_graph(150, 200, seed=42)
+        graph.add_node(150)     # isolated node
+        sources = np.arange(0, 151, 2)     # more than 64 sources
+
+        dists = multi_source_bfs(CSRGraph.from_networkx(graph), sources)
+
+        self.assertEqual(dists.dtype, np.uint16)
+        for i, src in enumerate(sources):
+            lengths = nx.single_source_shortest_path_length(graph, int(src))
+            expected = [lengths.get(node, np.iinfo(np.uint16).max) for node in range(151)]
+            np.testing.assert_array_equal(dists[i], expected)
+
+    def test_multi_source_bfs_writes_into_out(self):
+        graph = nx.gnm_random_graph(150, 200, seed=42)
+        csr = CSRGraph.from_networkx(graph)
+        sources = np.arange(0, 150, 3)
+        out = np.zeros((len(sources), 150), dtype=np.uint16)
+
+        result = multi_source_bfs(csr, sources, out=out)
+
+        self.assertIs(result, out)
+        np.testing.assert_array_equal(out, multi_source_bfs(csr, sources))
+
+    def test_sample_neighbor_pairs_are_different_pairs(self):
+        neighs = np.arange(100, 150)
+
+        bs, cs = sample_neighbor_pairs(neighs, 300, np.random.RandomState(42))
+
+        self.assertEqual(len(bs), 300)
+        self.assertTrue(np.all(bs < cs))
+        self.assertTrue(np.all(np.isin(bs, neighs)) and np.all(np.isin(cs, neighs)))
+        self.assertEqual(len(set(zip(bs.tolist(), cs.tolist()))), 300)
+
+    def test_sectional_curvatures_in_worker_processes(self):
+        m_nodes = [0, 1, 2, 5]
+
+        result = sectional_curvatures(self.csr, m_nodes, self.n_nodes, int(1e4), n_cpus=2, nodes_per_chunk=3)
+
+        expected = np.concatenate([self.loop_sectional_curvatures(m) for m in m_nodes])
+        np.testing.assert_allclose(np.sort(result), np.sort(expected), rtol=1e-6)
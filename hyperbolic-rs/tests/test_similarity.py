@@ -0,0 +1,113 @@
+# Copyright 2017 The Rudders Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import unittest
+import tempfile
+from pathlib import Path
+import numpy as np
+from rudders.similarity import threshold_edges, knn_edges, l2_normalize
+from rudders.graph.csr import CSRGraph
+
+
+class TestSimilarity(unittest.TestCase):
+
+    def setUp(self):
+        self.embeds = np.random.RandomState(42).normal(size=(53, 8))
+
+    def brute_force_edges(self, threshold):
+        embeds = l2_normalize(self.embeds)
+        sims = embeds @ embeds.T
+        src, dst = np.nonzero(np.triu(sims > threshold, k=1))
+        return set(zip(src.tolist(), dst.tolist())), sims
+
+    def test_threshold_edges_matches_full_matrix(self):
+        expected, _ = self.brute_force_edges(0.3)
+
+        src, dst, _ = threshold_edges(self.embeds, 0.3, tile_size=7, n_workers=3)
+
+        self.assertEqual(len(src), len(expected))
+        self.assertEqual(set(zip(src.tolist(), dst.tolist())), expected)
+
+    def test_threshold_edges_similarities(self):
+        _, sims = self.brute_force_edges(0.3)
+
+        src, dst, result = threshold_edges(self.embeds, 0.3, tile_size=10, n_workers=2)
+
+        np.testing.assert_allclose(result, sims[src, dst], rtol=1e-5)
+        self.assertTrue(np.all(src < dst))
+
+    def test_threshold_edges_no_edges(self):
+        src, dst, sims = threshold_edges(self.embeds, 1.1, tile_size=16)
+
+        self.assertEqual(len(src), 0)
+        self.assertEqual(len(sims), 0)
+
+    def test_csr_graph_from_edges(self):
+        graph = CSRGraph.from_edges([0, 2, 1], [1, 0, 3], weights=[0.1, 0.2, 0.3], n_nodes=5)
+
+        self.assertEqual(graph.n_nodes, 5)
+        self.assertEqual(graph.n_edges, 3)
+        np.testing.assert_array_equal(graph.neighbors(0), [1, 2])
+        np.testing.assert_array_equal(graph.neighbors(4), [])
+        np.testing.assert_array_equal(graph.degrees(), [2, 2, 1, 1, 0])
+        np.testing.assert_allclose(graph.weights[graph.indptr[0]:graph.indptr[1]], [0.1, 0.2])
+
+    def test_csr_graph_has_edges(self):
+        graph = CSRGraph.from_edges([0, 2, 1, 0], [1, 0, 3, 4], n_nodes=6)
+
+        result = graph.has_edges([0, 1, 4, 0, 3, 5, 2], [4, 3, 0, 3, 0, 0, 2])
+
+        np.testing.assert_array_equal(result, [True, True, True, False, False, False, False])
+
+    def test_csr_graph_save_and_load(self):
+        graph = CSRGraph.from_edges([0, 2, 1], [1, 0, 3], weights=[0.1, 0.2, 0.3], n_nodes=5)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = Path(tmp_dir) / "graph.npz"
+            graph.save(path, node_labels=["a", "b", "c", "d", "e"])
+
+            loaded, labels = CSRGraph.load(path)
+
+        self.assertEqual(labels, ["a", "b", "c", "d", "e"])
+        np.testing.assert_array_equal(loaded.indptr, graph.indptr)
+        np.testing.assert_array_equal(loaded.indices, graph.indices)
+        np.testing.assert_allclose(loaded.weights, graph.weights)
+
+    def test_csr_graph_write_edgelist(self):
+        graph = CSRGraph.from_edges([0, 2, 1], [1, 0, 3], weights=[0.5, 0.25, 1.0], n_nodes=5)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = Path(tmp_dir) / "graph.edgelist"
+            graph.write_edgelist(path, node_labels=["a", "b", "c", "d", "e"], chunk_size=2)
+            with open(path, "r") as f:
+                lines = f.read().splitlines()
+
+        self.assertEqual(sorted(lines), ["a b 0.5", "a c 0.25", "b d 1.0"])
+
+    def brute_force_knn(self, k):
+        _, sims = self.brute_force_edges(1.0)
+        np.fill_diagonal(sims, -np.inf)
+        return np.argpartition(-sims, k - 1, axis=1)[:, :k]
+
+    def test_knn_edges_is_exact_when_probing_all_lists(self):
+        expected = self.brute_force_knn(5)
+
+        src, dst, _ = knn_edges(self.embeds, 5, n_lists=4, n_probe=4, tile_size=8, n_workers=2)
+
+        self.assertEqual(len(src), len(self.embeds) * 5)
+        for i in range(len(self.embeds)):
+            self.assertEqual(set(dst[src == i].tolist()), set(expected[i].tolist()))
+
+    def test_knn_edges_excludes_itself(self):
+        src, dst, sims = knn_edges(self.embeds, 3, n_lists=10, n_probe=2)
+
+        self.assertFalse(np.any(src == dst))
+        self.assertTrue(np.all(np.isfinite(sims)))
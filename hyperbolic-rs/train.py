@@ -23,6 +23,7 @@ from rudders.config import CONFIG
 from rudders.utils import set_seed, setup_logger
 import rudders.models as models
 import rudders.losses as losses
+from rudders.optimizers import RiemannianOptimizer
 from rudders.runner import Runner
 
 flag_fns = {
@@ -143,12 +144,18 @@ def get_flags_dict(flags):
     return config
 
 
-def get_optimizer(args):
+def get_optimizer(args, model):
     if args.optimizer == 'adagrad':
-        return tf.keras.optimizers.Adagrad(learning_rate=args.lr, initial_accumulator_value=0.0, epsilon=1e-10)
-    if args.optimizer == 'adam':
-        return tf.keras.optimizers.Adam(learning_rate=args.lr, epsilon=1e-08)
-    return getattr(tf.keras.optimizers, args.optimizer)(learning_rate=args.lr)
+        optimizer = tf.keras.optimizers.Adagrad(learning_rate=args.lr, initial_accumulator_value=0.0, epsilon=1e-10)
+    elif args.optimizer == 'adam':
+        optimizer = tf.keras.optimizers.Adam(learning_rate=args.lr, epsilon=1e-08)
+    else:
+        optimizer = getattr(tf.keras.optimizers, args.optimizer)(learning_rate=args.lr)
+    if args.ball_embeddings:
+        # entities on the ball are updated with a Riemannian optimizer, and the rest of the variables as usual
+        optimizer = RiemannianOptimizer(optimizer, model.ball_variables(), model.get_c,
+                                        method=args.riemannian_optimizer)
+    return optimizer
 
 
 def get_quantities(data):
@@ -179,7 +186,7 @@ def main(_):
     n_users, n_items, n_entities = get_quantities(data)
 
     model = get_model(n_entities, n_relations, data["id2iid"])
-    optimizer = get_optimizer(FLAGS)
+    optimizer = get_optimizer(FLAGS, model)
     loss_fn = getattr(losses, FLAGS.loss_fn)(ini_neg_index=0, end_neg_index=n_entities - 1, args=FLAGS)
     logging.info(f"Train split size: {train_len}, relations: {n_relations}")
 